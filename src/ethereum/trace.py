@@ -248,6 +248,19 @@ def set_evm_trace(tracer: EvmTracer) -> EvmTracer:
     return old
 
 
+def get_evm_trace() -> EvmTracer:
+    """
+    Get the active [`EvmTracer`] that is used for generating traces.
+
+    Interpreters may compare it with [`discard_evm_trace`] to skip building
+    events that would be discarded.
+
+    [`EvmTracer`]: ref:ethereum.trace.EvmTracer
+    [`discard_evm_trace`]: ref:ethereum.trace.discard_evm_trace
+    """
+    return _evm_trace
+
+
 def evm_trace(
     evm: object,
     event: TraceEvent,
@@ -16,14 +16,13 @@ They can be monkey patched in during start up by calling the `monkey_patch()`
 function. This must be done before those modules are imported anywhere.
 """
 
+import sys
 from importlib import import_module
-from typing import Any, Optional, cast
+from importlib.util import find_spec
+from typing import Any, Dict, List, Optional, Set, cast
 
 from ethereum_spec_tools.forks import Hardfork
 
-from .fork import get_optimized_pow_patches
-from .state_db import get_optimized_state_patches
-
 
 def monkey_patch_optimized_state_db(
     fork_name: str, state_path: Optional[str]
@@ -35,6 +34,8 @@ def monkey_patch_optimized_state_db(
     This function must be called before the state interface is imported
     anywhere.
     """
+    from .state_db import get_optimized_state_patches
+
     slow_state = cast(Any, import_module("ethereum." + fork_name + ".state"))
 
     optimized_state_db_patches = get_optimized_state_patches(fork_name)
@@ -46,6 +47,356 @@ def monkey_patch_optimized_state_db(
         slow_state.State.default_path = state_path
 
 
+def monkey_patch_journaled_state(fork_name: str) -> None:
+    """
+    Replace the trie snapshots taken by the in-memory state at the start of
+    every transaction with an undo journal.
+
+    This is an alternative to `monkey_patch_optimized_state_db()` for callers
+    that keep the state in memory, and is applied by
+    `monkey_patch_in_memory()`.
+    This function may be called after the fork has been imported, but before
+    any state is created.
+    """
+    from .state_journal import get_journaled_state_patches
+
+    _patch_everywhere(
+        fork_name, "state", get_journaled_state_patches(fork_name)
+    )
+
+
+def monkey_patch_trie_cache(fork_name: str) -> None:
+    """
+    Replace the trie root computation with one that caches encoded nodes
+    between calls and only re-encodes the keys that changed.
+
+    This is applied by `monkey_patch_in_memory()`. This function may be
+    called after the fork has been imported, but before
+    `monkey_patch_stack_trie()`.
+    """
+    from .trie_cache import get_trie_cache_patches
+
+    _patch_everywhere(fork_name, "trie", get_trie_cache_patches(fork_name))
+
+
+def monkey_patch_ethash_cache(
+    fork_name: str, directory: Optional[str] = None
+) -> None:
+    """
+    Replace the ethash cache generation of a proof-of-work fork with one that
+    keeps the caches of recently used epochs, optionally saving them to
+    `directory` so later runs can load them instead of generating them, and
+    `hashimoto_light()` with one that reads those compact caches directly.
+
+    Unlike the other patches this one may be applied after the fork has been
+    imported.
+    """
+    from .ethash_cache import ETHASH_CACHE_STORE, get_ethash_cache_patches
+
+    slow_spec = import_module("ethereum." + fork_name + ".fork")
+
+    for name, value in get_ethash_cache_patches(fork_name).items():
+        setattr(slow_spec, name, value)
+
+    if directory is not None:
+        ETHASH_CACHE_STORE.directory = directory
+
+
+def monkey_patch_code_store(fork_name: str) -> None:
+    """
+    Keep contract code in a content addressed store, so that accounts with
+    the same code share it and code hashes are only computed once.
+
+    This function may be called after the fork has been imported, but must be
+    called after `monkey_patch_optimized_state_db()` or
+    `monkey_patch_journaled_state()`, whose `set_account()` it wraps.
+    """
+    from .code_store import get_code_store_patches
+
+    patches = get_code_store_patches(fork_name)
+    # `trie` imports `encode_account()` from `fork_types`.
+    _patch_everywhere(fork_name, "fork_types", patches["fork_types"])
+    _patch_everywhere(fork_name, "state", patches["state"])
+
+    # Only the environment instructions use `keccak256` to hash code.
+    environment = import_module(
+        "ethereum." + fork_name + ".vm.instructions.environment"
+    )
+    for name, value in patches["vm.instructions.environment"].items():
+        if hasattr(environment, name):
+            setattr(environment, name, value)
+
+
+def monkey_patch_log_accumulation(fork_name: str) -> None:
+    """
+    Collect logs, and the receipt keys of a block, in lists instead of
+    concatenating tuples.
+
+    This function may be called after the fork has been imported, but
+    before `monkey_patch_instruction_stream()`.
+    """
+    from .logs import get_log_patches
+
+    _patch_instructions(fork_name, get_log_patches(fork_name))
+
+
+def monkey_patch_access_sets(fork_name: str) -> None:
+    """
+    Give each message call a layer on top of its caller's sets of accessed
+    addresses and storage keys instead of copies of them. Forks without
+    access lists are left unchanged.
+
+    This function may be called after the fork has been imported, but
+    before `monkey_patch_instruction_stream()`.
+    """
+    from .access_sets import get_access_set_patches
+
+    _patch_instructions(
+        fork_name, {"vm.interpreter": get_access_set_patches(fork_name)}
+    )
+
+
+def monkey_patch_sender_recovery(
+    fork_name: str, workers: Optional[int] = None
+) -> None:
+    """
+    Recover the senders and authorities of each block's transactions on a
+    pool of `workers` processes, one per CPU by default, before the block is
+    executed. This is not applied by `monkey_patch()`, since the pool is only
+    worth starting when many blocks are executed.
+
+    This function may be called after the fork has been imported.
+    """
+    from .signers import SIGNER_RECOVERY, get_signer_patches
+
+    if workers != SIGNER_RECOVERY.workers:
+        SIGNER_RECOVERY.shutdown()
+        SIGNER_RECOVERY.workers = workers
+
+    _patch_instructions(fork_name, get_signer_patches(fork_name))
+
+
+def monkey_patch_block_history(fork_name: str) -> None:
+    """
+    Keep only the headers and ommers of the chain's recent blocks, with their
+    hashes computed once, instead of the complete blocks.
+
+    This function must be called before the chain is created.
+    """
+    from .block_history import get_block_history_patches
+
+    _patch_instructions(
+        fork_name, {"fork": get_block_history_patches(fork_name)}
+    )
+
+
+def _patch_instructions(
+    fork_name: str, patches: Dict[str, Dict[str, Any]]
+) -> None:
+    """
+    Replace names in the fork's modules, given as a dictionary of patches for
+    each module. Instructions are also replaced in `op_implementation`.
+    """
+    prefix = "ethereum." + fork_name + "."
+    instructions = cast(Any, import_module(prefix + "vm.instructions"))
+
+    for module_name, module_patches in patches.items():
+        module = import_module(prefix + module_name)
+        for name, value in module_patches.items():
+            original = getattr(module, name)
+            setattr(module, name, value)
+            for op, implementation in instructions.op_implementation.items():
+                if implementation is original:
+                    instructions.op_implementation[op] = value
+
+
+def monkey_patch_jumpdest_cache(fork_name: str) -> None:
+    """
+    Replace the jump destination analysis with a faster one whose results are
+    cached by code.
+
+    This function may be called after the interpreter has been imported.
+    """
+    from .jumpdest import get_jumpdest_patches
+
+    vm = "ethereum." + fork_name + ".vm"
+    runtime = import_module(vm + ".runtime")
+    interpreter = import_module(vm + ".interpreter")
+
+    for name, value in get_jumpdest_patches(fork_name).items():
+        setattr(runtime, name, value)
+        setattr(interpreter, name, value)
+
+
+_instruction_stream_forks: Set[str] = set()
+
+
+def monkey_patch_instruction_stream(fork_name: str) -> None:
+    """
+    Replace `execute_code()` with one that runs from a pre-decoded instruction
+    stream and charges gas and checks the stack once for each block of stack
+    instructions. While a tracer is installed it runs the specification's
+    `execute_code()` instead.
+
+    This function may be called after the interpreter has been imported, but
+    the instructions are read when it is called, so any patches to them must
+    be applied first. Calling it again for the same fork does nothing.
+    """
+    from .instruction_stream import get_instruction_stream_patches
+
+    if fork_name in _instruction_stream_forks:
+        return
+    _instruction_stream_forks.add(fork_name)
+
+    # `charge_gas()` is imported by name into every instruction module.
+    _patch_everywhere(
+        fork_name,
+        "vm.interpreter",
+        get_instruction_stream_patches(fork_name),
+    )
+
+
+def monkey_patch_transaction_cache(fork_name: str) -> None:
+    """
+    Keep the encoding, hash and signing hashes of recently used transactions,
+    so that each is only computed once.
+
+    This function may be called after the fork has been imported.
+    """
+    from .transaction_cache import get_transaction_cache_patches
+
+    _patch_everywhere(
+        fork_name, "transactions", get_transaction_cache_patches(fork_name)
+    )
+
+
+def monkey_patch_stack_trie(fork_name: str) -> None:
+    """
+    Build the roots of each block's transactions, receipts and withdrawals
+    tries as their items are added, instead of from all of their keys at
+    once.
+
+    This function may be called after the fork has been imported.
+    """
+    from .stack_trie import get_stack_trie_patches
+
+    for module_name, patches in get_stack_trie_patches(fork_name).items():
+        _patch_everywhere(fork_name, module_name, patches)
+
+
+def monkey_patch_parallel_storage_roots(
+    fork_name: str, workers: Optional[int] = None
+) -> None:
+    """
+    Compute the storage roots of large storage tries on a pool of `workers`
+    processes, one per CPU by default, when computing the state root. This is
+    not applied by `monkey_patch()`, and has no effect on a state kept in a
+    database by `monkey_patch_optimized_state_db()`.
+
+    This function may be called after the fork has been imported.
+    """
+    from .parallel_roots import STORAGE_ROOTS, get_parallel_root_patches
+
+    if workers != STORAGE_ROOTS.workers:
+        STORAGE_ROOTS.shutdown()
+        STORAGE_ROOTS.workers = workers
+
+    _patch_everywhere(fork_name, "state", get_parallel_root_patches(fork_name))
+
+
+def _patch_everywhere(
+    fork_name: str, module_name: str, patches: Dict[str, Any]
+) -> None:
+    """
+    Replace names in one of the fork's modules, and in every module of the
+    fork that imported them by name.
+    """
+    prefix = "ethereum." + fork_name + "."
+    source = import_module(prefix + module_name)
+
+    for name, value in patches.items():
+        original = getattr(source, name)
+        for loaded_name, module in list(sys.modules.items()):
+            if not loaded_name.startswith(prefix):
+                continue
+            if getattr(module, name, None) is original:
+                setattr(module, name, value)
+
+
+def _patch_precompiles(
+    fork_name: str, module_names: List[str], patches: Dict[str, Any]
+) -> None:
+    """
+    Replace functions in the fork's precompiled contract modules that define
+    them, and in the precompile mapping, so that the patches also take effect
+    after the precompiles have been imported.
+    """
+    precompiles = "ethereum." + fork_name + ".vm.precompiled_contracts"
+    modules = [import_module(precompiles + "." + m) for m in module_names]
+    mapping = cast(Any, import_module(precompiles + ".mapping"))
+
+    for name, value in patches.items():
+        for module in modules:
+            original = getattr(module, name, None)
+            if original is None:
+                continue
+            setattr(module, name, value)
+            for address, function in mapping.PRE_COMPILED_CONTRACTS.items():
+                if function is original:
+                    mapping.PRE_COMPILED_CONTRACTS[address] = value
+
+
+def monkey_patch_bls12_381_msm(fork_name: str) -> None:
+    """
+    Replace the BLS12-381 G1 and G2 multi-scalar multiplication precompiles
+    with ones using Pippenger's algorithm.
+
+    This function may be called after the precompiles have been imported.
+    """
+    from .bls12_381_msm import get_bls12_381_msm_patches
+
+    _patch_precompiles(
+        fork_name,
+        ["bls12_381.bls12_381_g1", "bls12_381.bls12_381_g2"],
+        get_bls12_381_msm_patches(fork_name),
+    )
+
+
+def monkey_patch_pairing(fork_name: str) -> None:
+    """
+    Replace the pairing precompiles with ones computing a single final
+    exponentiation, and the BLS12-381 subgroup checks with endomorphism
+    based ones.
+
+    This function may be called after the precompiles have been imported.
+    """
+    from .pairing import (
+        get_alt_bn128_pairing_patches,
+        get_bls12_381_pairing_patches,
+    )
+
+    precompiles = "ethereum." + fork_name + ".vm.precompiled_contracts"
+
+    if find_spec(precompiles + ".alt_bn128"):
+        _patch_precompiles(
+            fork_name,
+            ["alt_bn128"],
+            get_alt_bn128_pairing_patches(fork_name),
+        )
+
+    if find_spec(precompiles + ".bls12_381"):
+        _patch_precompiles(
+            fork_name,
+            [
+                "bls12_381",
+                "bls12_381.bls12_381_g1",
+                "bls12_381.bls12_381_g2",
+                "bls12_381.bls12_381_pairing",
+            ],
+            get_bls12_381_pairing_patches(fork_name),
+        )
+
+
 def monkey_patch_optimized_spec(fork_name: str) -> None:
     """
     Replace the ethash implementation with one that supports higher
@@ -54,6 +405,8 @@ def monkey_patch_optimized_spec(fork_name: str) -> None:
     This function must be called before the spec interface is imported
     anywhere.
     """
+    from .fork import get_optimized_pow_patches
+
     slow_spec = import_module("ethereum." + fork_name + ".fork")
 
     optimized_pow_patches = get_optimized_pow_patches(fork_name)
@@ -62,6 +415,34 @@ def monkey_patch_optimized_spec(fork_name: str) -> None:
         setattr(slow_spec, name, value)
 
 
+# The forks `monkey_patch_in_memory()` has been applied to.
+_in_memory_forks: Set[str] = set()
+
+
+def monkey_patch_in_memory(fork_name: str) -> None:
+    """
+    Apply the patches suited to a state kept in memory, such as the one of
+    the t8n tool, to a fork: the incremental trie roots of
+    `monkey_patch_trie_cache()`, the undo journal of
+    `monkey_patch_journaled_state()`, the shared code of
+    `monkey_patch_code_store()` and the ordered trie roots of
+    `monkey_patch_stack_trie()`. This is not applied by
+    `monkey_patch()`, whose state is kept in a database.
+
+    This function may be called after the fork has been imported, but before
+    any state is created. Calling it again for the same fork does nothing, so
+    it may be called for every transition run in a process.
+    """
+    if fork_name in _in_memory_forks:
+        return
+    _in_memory_forks.add(fork_name)
+
+    monkey_patch_trie_cache(fork_name)
+    monkey_patch_journaled_state(fork_name)
+    monkey_patch_code_store(fork_name)
+    monkey_patch_stack_trie(fork_name)
+
+
 def monkey_patch(state_path: Optional[str]) -> None:
     """
     Apply all monkey patches to the specification.
@@ -74,3 +455,18 @@ def monkey_patch(state_path: Optional[str]) -> None:
         # Only patch the POW code on POW forks
         if fork.consensus.is_pow():
             monkey_patch_optimized_spec(fork.short_name)
+
+        if find_spec(fork.name + ".vm.precompiled_contracts.bls12_381"):
+            monkey_patch_bls12_381_msm(fork.short_name)
+
+        monkey_patch_pairing(fork.short_name)
+        monkey_patch_jumpdest_cache(fork.short_name)
+        monkey_patch_code_store(fork.short_name)
+        monkey_patch_log_accumulation(fork.short_name)
+        monkey_patch_access_sets(fork.short_name)
+        monkey_patch_transaction_cache(fork.short_name)
+        monkey_patch_block_history(fork.short_name)
+        monkey_patch_stack_trie(fork.short_name)
+
+        # Reads the instructions, so it comes after the patches to them.
+        monkey_patch_instruction_stream(fork.short_name)
@@ -0,0 +1,164 @@
+"""
+Optimized Access Sets
+^^^^^^^^^^^^^^^^^^^^^
+
+.. contents:: Table of Contents
+    :backlinks: none
+    :local:
+
+Introduction
+------------
+
+This module contains a replacement for the `Evm` class of forks with access
+lists ([EIP-2929]) that can be monkey patched into the fork's `interpreter`
+module, so that entering a message call no longer copies the sets of accessed
+addresses and storage keys.
+
+`generic_call()` and `generic_create()` in the specification give every child
+message copies of the caller's sets, so each call costs time proportional to
+the number of warm addresses and slots. Here the sets are `AccessSet`s, where
+`copy()` creates a new layer that looks up entries in the layers below it but
+only adds entries to itself. When a child frame succeeds, its parent adds only
+the entries of the child's own layer; when it fails, the layer is dropped.
+While a child runs its parent is suspended, so the layers below a child never
+change under it.
+
+[EIP-2929]: https://eips.ethereum.org/EIPS/eip-2929
+"""
+from dataclasses import dataclass, fields
+from importlib import import_module
+from typing import (
+    Any,
+    Dict,
+    Generic,
+    Iterable,
+    Iterator,
+    Optional,
+    Set,
+    TypeVar,
+    cast,
+)
+
+from .utils import add_item
+
+T = TypeVar("T")
+
+# Above this many layers, `copy()` flattens the layers into a new bottom layer
+# so that looking up entries in deeply nested calls doesn't visit every layer.
+MAX_LAYERS = 16
+
+
+class AccessSet(Generic[T]):
+    """
+    A set of accessed addresses or storage keys, made of a layer of its own
+    entries on top of the set it was copied from.
+    """
+
+    __slots__ = ("_entries", "_parent", "_layers")
+
+    _entries: Set[T]
+    _parent: Optional["AccessSet[T]"]
+    _layers: int
+
+    def __init__(
+        self,
+        entries: Iterable[T] = (),
+        parent: Optional["AccessSet[T]"] = None,
+    ) -> None:
+        self._entries = set(entries)
+        self._parent = parent
+        self._layers = 1 if parent is None else parent._layers + 1
+
+    def __contains__(self, entry: object) -> bool:
+        """
+        Check whether `entry` is in this layer or any layer below it.
+        """
+        layer: Optional[AccessSet[T]] = self
+        while layer is not None:
+            if entry in layer._entries:
+                return True
+            layer = layer._parent
+        return False
+
+    def __iter__(self) -> Iterator[T]:
+        """
+        Iterate over the entries of every layer.
+        """
+        entries: Set[T] = set()
+        layer: Optional[AccessSet[T]] = self
+        while layer is not None:
+            entries.update(layer._entries)
+            layer = layer._parent
+        return iter(entries)
+
+    def __len__(self) -> int:
+        """
+        Number of distinct entries in every layer.
+        """
+        return sum(1 for _ in self)
+
+    def add(self, entry: T) -> None:
+        """
+        Add `entry` to this layer.
+        """
+        self._entries.add(entry)
+
+    def copy(self) -> "AccessSet[T]":
+        """
+        Create a new layer on top of this set, for a child message.
+        """
+        if self._layers >= MAX_LAYERS:
+            return AccessSet(self)
+        return AccessSet(parent=self)
+
+    def update(self, other: Iterable[T]) -> None:
+        """
+        Add the entries of `other`. A layer copied from this set only adds its
+        own entries, since every entry below it is already in this set.
+        """
+        if isinstance(other, AccessSet) and other._parent is self:
+            self._entries.update(other._entries)
+        else:
+            self._entries.update(other)
+
+
+def get_access_set_patches(fork: str) -> Dict[str, Any]:
+    """
+    Get a dictionary of classes to be monkey patched into the fork's
+    `interpreter` module to use `AccessSet`s. Forks without access lists get
+    no patches.
+    """
+    patches: Dict[str, Any] = {}
+
+    interpreter = cast(
+        Any, import_module("ethereum." + fork + ".vm.interpreter")
+    )
+    # Subclass the class currently in use, so earlier patches are kept.
+    SpecEvm: Any = interpreter.Evm
+    if "accessed_addresses" not in {f.name for f in fields(SpecEvm)}:
+        return patches
+    spec_post_init = getattr(SpecEvm, "__post_init__", None)
+
+    @add_item(patches)
+    @dataclass
+    class Evm(SpecEvm):
+        """
+        The internal state of the virtual machine, with layered sets of
+        accessed addresses and storage keys.
+        """
+
+        def __post_init__(self) -> None:
+            if spec_post_init is not None:
+                spec_post_init(self)
+            # The sets given to the first frame of a transaction become the
+            # bottom layers, and `copy()` layers those of later frames on top.
+            if not isinstance(self.accessed_addresses, AccessSet):
+                self.accessed_addresses: AccessSet[Any] = AccessSet(
+                    self.accessed_addresses
+                )
+            if not isinstance(self.accessed_storage_keys, AccessSet):
+                self.accessed_storage_keys: AccessSet[Any] = AccessSet(
+                    self.accessed_storage_keys
+                )
+
+    return patches
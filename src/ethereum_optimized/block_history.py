@@ -0,0 +1,271 @@
+"""
+Optimized Block History
+^^^^^^^^^^^^^^^^^^^^^^^
+
+.. contents:: Table of Contents
+    :backlinks: none
+    :local:
+
+Introduction
+------------
+
+This module contains functions that can be monkey patched into the `fork`
+module of a fork so that the chain only remembers, and hashes once, the
+headers of its recent blocks.
+
+In the specification `BlockChain.blocks` is a list of the last 255 complete
+blocks, including their transactions, which `state_transition()` slices into
+a new list after every block. `get_last_256_block_hashes()` hashes the latest
+header again for every block, and `validate_ommers()` hashes the last seven
+headers and their ommers again for every block with ommers. Here `blocks` is a
+`BlockHistory`, a ring of the last 255 headers and ommers with their hashes,
+computed when they are appended, and an index of those hashes.
+"""
+from collections import deque
+from dataclasses import dataclass
+from importlib import import_module
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    cast,
+)
+
+from ethereum_rlp import rlp
+from ethereum_types.numeric import Uint
+
+from ethereum.crypto.hash import Hash32, keccak256
+from ethereum.exceptions import InvalidBlock
+
+from .utils import add_item
+
+# The number of blocks the specification keeps in `BlockChain.blocks`.
+HISTORY_LENGTH = 255
+
+
+class BlockEntry:
+    """
+    The parts of a block the chain needs to validate later blocks, with the
+    hashes of its header and ommers.
+    """
+
+    __slots__ = ("header", "ommers", "hash", "ommer_hashes", "position")
+
+    header: Any
+    ommers: Tuple[Any, ...]
+    hash: Hash32
+    ommer_hashes: Tuple[Hash32, ...]
+    position: int
+
+    def __init__(self, block: Any, position: int) -> None:
+        self.header = block.header
+        # Forks after the merge have no ommers.
+        self.ommers = getattr(block, "ommers", ())
+        self.hash = keccak256(rlp.encode(block.header))
+        self.ommer_hashes = tuple(
+            keccak256(rlp.encode(ommer)) for ommer in self.ommers
+        )
+        self.position = position
+
+
+class BlockHistory:
+    """
+    The entries of the last `max_blocks` blocks appended, oldest first, indexed
+    by the hash of their header.
+
+    Entries stand in for blocks: they have the `header` and `ommers` of the
+    block, but not its transactions or withdrawals.
+    """
+
+    max_blocks: int
+    _entries: Deque[BlockEntry]
+    _by_hash: Dict[Hash32, BlockEntry]
+    _appended: int
+
+    def __init__(
+        self, blocks: Iterable[Any] = (), max_blocks: int = HISTORY_LENGTH
+    ) -> None:
+        if max_blocks < 1:
+            raise ValueError("max_blocks must be at least 1")
+        self.max_blocks = max_blocks
+        self._entries = deque(maxlen=max_blocks)
+        self._by_hash = {}
+        self._appended = 0
+        for block in blocks:
+            self.append(block)
+
+    def append(self, block: Any) -> None:
+        """
+        Add `block` as the newest block, forgetting the oldest if full.
+        """
+        if len(self._entries) == self.max_blocks:
+            evicted = self._entries[0]
+            if self._by_hash.get(evicted.hash) is evicted:
+                del self._by_hash[evicted.hash]
+        entry = BlockEntry(block, self._appended)
+        self._entries.append(entry)
+        self._by_hash[entry.hash] = entry
+        self._appended += 1
+
+    def find(self, block_hash: Hash32) -> Optional[BlockEntry]:
+        """
+        Get the entry of the block whose header hashes to `block_hash`.
+        """
+        return self._by_hash.get(block_hash)
+
+    def recent(self, count: int) -> List[BlockEntry]:
+        """
+        Get the entries of the newest `count` blocks, oldest first.
+        """
+        if count <= 0:
+            return []
+        return list(self._entries)[-count:]
+
+    def is_recent(self, entry: BlockEntry, count: int) -> bool:
+        """
+        Check whether `entry` is one of the newest `count` blocks.
+        """
+        return entry.position >= self._appended - count
+
+    def block_hashes(self) -> List[Hash32]:
+        """
+        Get the parent hashes of the blocks, followed by the hash of the
+        newest, as returned by `get_last_256_block_hashes()`.
+        """
+        if not self._entries:
+            return []
+        hashes = [entry.header.parent_hash for entry in self._entries]
+        hashes.append(self._entries[-1].hash)
+        return hashes
+
+    def __len__(self) -> int:
+        """
+        Number of blocks remembered.
+        """
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[BlockEntry]:
+        """
+        Iterate over the entries, oldest first.
+        """
+        return iter(self._entries)
+
+    def __getitem__(self, index: Any) -> Any:
+        """
+        Get an entry, or a list of entries for a slice, by position.
+        """
+        if isinstance(index, slice):
+            return list(self._entries)[index]
+        return self._entries[index]
+
+
+def get_block_history_patches(fork: str) -> Dict[str, Any]:
+    """
+    Get a dictionary of functions and classes to be monkey patched into the
+    fork's `fork` module to keep the chain's recent blocks in a
+    `BlockHistory`.
+    """
+    patches: Dict[str, Any] = {}
+
+    fork_mod = cast(Any, import_module("ethereum." + fork + ".fork"))
+    # Subclass the class currently in use, so earlier patches are kept.
+    SpecBlockChain: Any = fork_mod.BlockChain
+    spec_post_init = getattr(SpecBlockChain, "__post_init__", None)
+    spec_get_last_256_block_hashes = fork_mod.get_last_256_block_hashes
+
+    @add_item(patches)
+    @dataclass
+    class BlockChain(SpecBlockChain):
+        """
+        History and current state of the block chain, with the history kept
+        in a `BlockHistory`.
+        """
+
+        def __post_init__(self) -> None:
+            if spec_post_init is not None:
+                spec_post_init(self)
+            # `state_transition()` never slices the history, because it never
+            # grows beyond 255 blocks.
+            if not isinstance(self.blocks, BlockHistory):
+                self.blocks: BlockHistory = BlockHistory(self.blocks)
+
+    @add_item(patches)
+    def get_last_256_block_hashes(chain: Any) -> List[Hash32]:
+        """
+        See `fork`.
+        """
+        if isinstance(chain.blocks, BlockHistory):
+            return chain.blocks.block_hashes()
+        return spec_get_last_256_block_hashes(chain)
+
+    # Forks after the merge have no ommers.
+    if not hasattr(fork_mod, "validate_ommers"):
+        return patches
+
+    spec_validate_ommers = fork_mod.validate_ommers
+
+    @add_item(patches)
+    def validate_ommers(
+        ommers: Tuple[Any, ...], block_header: Any, chain: Any
+    ) -> None:
+        """
+        See `fork`.
+        """
+        if not isinstance(chain.blocks, BlockHistory):
+            return spec_validate_ommers(ommers, block_header, chain)
+
+        if keccak256(rlp.encode(ommers)) != block_header.ommers_hash:
+            raise InvalidBlock
+
+        if len(ommers) == 0:
+            # Nothing to validate
+            return
+
+        # Check that each ommer satisfies the constraints of a header
+        for ommer in ommers:
+            if Uint(1) > ommer.number or ommer.number >= block_header.number:
+                raise InvalidBlock
+            fork_mod.validate_header(chain, ommer)
+        if len(ommers) > 2:
+            raise InvalidBlock
+
+        ommers_hashes = [keccak256(rlp.encode(ommer)) for ommer in ommers]
+        if len(ommers_hashes) != len(set(ommers_hashes)):
+            raise InvalidBlock
+
+        depth = int(fork_mod.MAX_OMMER_DEPTH) + 1
+        recent_ommers_hashes = {
+            ommer_hash
+            for entry in chain.blocks.recent(depth)
+            for ommer_hash in entry.ommer_hashes
+        }
+
+        def is_recent_canonical(block_hash: Hash32) -> bool:
+            entry = chain.blocks.find(block_hash)
+            return entry is not None and chain.blocks.is_recent(entry, depth)
+
+        block_hash = keccak256(rlp.encode(block_header))
+        for ommer_index, ommer in enumerate(ommers):
+            ommer_hash = ommers_hashes[ommer_index]
+            if ommer_hash == block_hash:
+                raise InvalidBlock
+            if is_recent_canonical(ommer_hash):
+                raise InvalidBlock
+            if ommer_hash in recent_ommers_hashes:
+                raise InvalidBlock
+
+            # Ommer age with respect to the current block.
+            ommer_age = block_header.number - ommer.number
+            if Uint(1) > ommer_age or ommer_age > fork_mod.MAX_OMMER_DEPTH:
+                raise InvalidBlock
+            if not is_recent_canonical(ommer.parent_hash):
+                raise InvalidBlock
+            if ommer.parent_hash == block_header.parent_hash:
+                raise InvalidBlock
+
+    return patches
@@ -0,0 +1,248 @@
+"""
+Optimized BLS12-381 Multi-Scalar Multiplication
+^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+.. contents:: Table of Contents
+    :backlinks: none
+    :local:
+
+Introduction
+------------
+
+This module contains replacements for the BLS12-381 G1 and G2 multi-scalar
+multiplication precompiles that can be monkey patched into the fork's
+`bls12_381` modules.
+
+The specification multiplies every point by its scalar and adds up the
+products, which costs about one doubling and half an addition per scalar bit
+for every pair. Here the products are summed with Pippenger's bucket method:
+every scalar is split into signed `c`-bit digits, and for each digit position
+the points are dropped into buckets by digit and the buckets are combined with
+a running sum. All pairs then share one set of doublings. The window size `c`
+is chosen from a cost estimate, and inputs too small to benefit fall back to
+the specification's approach.
+"""
+from importlib import import_module
+from typing import Any, Dict, List, Optional, Sequence, Tuple, cast
+
+from ethereum_types.numeric import Uint
+from py_ecc.optimized_bls12_381.optimized_curve import add, curve_order
+from py_ecc.optimized_bls12_381.optimized_curve import double as double_
+from py_ecc.optimized_bls12_381.optimized_curve import multiply, neg
+
+from .utils import add_item
+
+# A G1 or G2 point, as the `(x, y, z)` triple used by py_ecc.
+Point = Tuple[Any, Any, Any]
+
+# Largest window size considered by `window_size()`.
+MAX_WINDOW_SIZE = 16
+
+
+def window_size(count: int, bits: int) -> int:
+    """
+    Pick the window size that minimises the estimated number of group
+    operations needed by `pippenger()` for `count` scalars of `bits` bits, or
+    0 if multiplying every point separately is expected to be cheaper.
+    """
+    best_size = 0
+    best_cost = count * (bits + bits // 2)
+    for size in range(2, MAX_WINDOW_SIZE + 1):
+        windows = window_count(bits, size)
+        cost = windows * (count + 2**size) + bits
+        if cost < best_cost:
+            best_size, best_cost = size, cost
+    return best_size
+
+
+def window_count(bits: int, size: int) -> int:
+    """
+    Number of signed digits of `size` bits needed for a scalar of `bits` bits.
+    The most significant digit is signed too, so two bits of headroom are
+    kept for the carries.
+    """
+    return (bits + 1) // size + 1
+
+
+def signed_digits(scalar: int, size: int, windows: int) -> List[int]:
+    """
+    Split `scalar` into `windows` digits in base `2**size`, least significant
+    first, each in the range `[-2**(size - 1), 2**(size - 1))`. `size` must
+    be at least 2.
+    """
+    half = 1 << (size - 1)
+    mask = (1 << size) - 1
+    digits = []
+    for _ in range(windows):
+        digit = scalar & mask
+        scalar >>= size
+        if digit >= half:
+            digit -= 1 << size
+            scalar += 1
+        digits.append(digit)
+    assert scalar == 0
+    return digits
+
+
+def pippenger(points: Sequence[Point], scalars: Sequence[int]) -> Point:
+    """
+    Compute the sum of `points[i] * scalars[i]`. The points must be in the
+    subgroup of order `curve_order`.
+    """
+    assert len(points) == len(scalars) and len(points) > 0
+    one, zero = points[0][0].one(), points[0][0].zero()
+    infinity = (one, one, zero)
+
+    pairs: List[Tuple[Point, int]] = []
+    for point, scalar in zip(points, scalars):
+        scalar %= curve_order
+        if scalar != 0 and point[2] != zero:
+            pairs.append((point, scalar))
+    if not pairs:
+        return infinity
+
+    bits = max(scalar for _, scalar in pairs).bit_length()
+    size = window_size(len(pairs), bits)
+    if size == 0:
+        result: Optional[Point] = None
+        for point, scalar in pairs:
+            result = _add(result, multiply(point, scalar))
+        return infinity if result is None else result
+
+    windows = window_count(bits, size)
+    negated = [neg(point) for point, _ in pairs]
+    digits = [signed_digits(scalar, size, windows) for _, scalar in pairs]
+
+    total: Optional[Point] = None
+    for window in reversed(range(windows)):
+        if total is not None:
+            for _ in range(size):
+                total = double_(total)
+
+        buckets: List[Optional[Point]] = [None] * (1 << (size - 1))
+        for i, (point, _) in enumerate(pairs):
+            digit = digits[i][window]
+            if digit > 0:
+                buckets[digit - 1] = _add(buckets[digit - 1], point)
+            elif digit < 0:
+                buckets[-digit - 1] = _add(buckets[-digit - 1], negated[i])
+
+        # Bucket `b` has to be counted `b + 1` times, so the buckets are added
+        # to a running sum from the top down and the running sum is added to
+        # the window's total after every bucket.
+        running: Optional[Point] = None
+        window_sum: Optional[Point] = None
+        for bucket in reversed(buckets):
+            running = _add(running, bucket)
+            window_sum = _add(window_sum, running)
+
+        total = _add(total, window_sum)
+
+    return infinity if total is None else total
+
+
+def _add(p1: Optional[Point], p2: Optional[Point]) -> Optional[Point]:
+    """
+    Add two points, where `None` stands for the point at infinity.
+    """
+    if p1 is None:
+        return p2
+    if p2 is None:
+        return p1
+    return add(p1, p2)
+
+
+def get_bls12_381_msm_patches(fork: str) -> Dict[str, Any]:
+    """
+    Get a dictionary of functions to be monkey patched into the fork's
+    `bls12_381_g1` and `bls12_381_g2` modules to use Pippenger's algorithm
+    for multi-scalar multiplication.
+    """
+    patches: Dict[str, Any] = {}
+
+    package = "ethereum." + fork + ".vm.precompiled_contracts.bls12_381"
+    bls12_381 = cast(Any, import_module(package))
+    g1 = cast(Any, import_module(package + ".bls12_381_g1"))
+    g2 = cast(Any, import_module(package + ".bls12_381_g2"))
+    gas = cast(Any, import_module("ethereum." + fork + ".vm.gas"))
+    InvalidParameter = cast(
+        Any, import_module("ethereum." + fork + ".vm.exceptions")
+    ).InvalidParameter
+
+    def _decode(
+        data: bytes, length: int, decode_pair: Any
+    ) -> Tuple[List[Any], List[int]]:
+        """
+        Split the input of an MSM precompile into points and scalars.
+        """
+        points = []
+        scalars = []
+        for start in range(0, len(data), length):
+            point, scalar = decode_pair(data[start : start + length])
+            points.append(point)
+            scalars.append(scalar)
+        return points, scalars
+
+    def _charge(
+        evm: Any, k: int, discounts: Any, max_discount: int, gas_mul: Uint
+    ) -> None:
+        """
+        Charge the gas of an MSM precompile with `k` pairs.
+        """
+        if k <= 128:
+            discount = Uint(discounts[k - 1])
+        else:
+            discount = Uint(max_discount)
+
+        gas_cost = Uint(k) * gas_mul * discount // bls12_381.MULTIPLIER
+        gas.charge_gas(evm, gas_cost)
+
+    @add_item(patches)
+    def bls12_g1_msm(evm: Any) -> None:
+        """
+        See `bls12_381_g1`.
+        """
+        data = evm.message.data
+        if len(data) == 0 or len(data) % g1.LENGTH_PER_PAIR != 0:
+            raise InvalidParameter("Invalid Input Length")
+
+        # GAS
+        _charge(
+            evm,
+            len(data) // g1.LENGTH_PER_PAIR,
+            bls12_381.G1_K_DISCOUNT,
+            bls12_381.G1_MAX_DISCOUNT,
+            gas.GAS_BLS_G1_MUL,
+        )
+
+        # OPERATION
+        points, scalars = _decode(
+            data, g1.LENGTH_PER_PAIR, g1.decode_g1_scalar_pair
+        )
+        evm.output = g1.g1_to_bytes(pippenger(points, scalars))
+
+    @add_item(patches)
+    def bls12_g2_msm(evm: Any) -> None:
+        """
+        See `bls12_381_g2`.
+        """
+        data = evm.message.data
+        if len(data) == 0 or len(data) % g2.LENGTH_PER_PAIR != 0:
+            raise InvalidParameter("Invalid Input Length")
+
+        # GAS
+        _charge(
+            evm,
+            len(data) // g2.LENGTH_PER_PAIR,
+            bls12_381.G2_K_DISCOUNT,
+            bls12_381.G2_MAX_DISCOUNT,
+            gas.GAS_BLS_G2_MUL,
+        )
+
+        # OPERATION
+        points, scalars = _decode(
+            data, g2.LENGTH_PER_PAIR, g2.decode_g2_scalar_pair
+        )
+        evm.output = g2.g2_to_bytes(pippenger(points, scalars))
+
+    return patches
@@ -0,0 +1,190 @@
+"""
+Optimized Code Store
+^^^^^^^^^^^^^^^^^^^^
+
+.. contents:: Table of Contents
+    :backlinks: none
+    :local:
+
+Introduction
+------------
+
+This module contains functions that can be monkey patched into a fork so that
+contract code is deduplicated and hashed only once.
+
+In the specification every `Account` holds its code, `encode_account()`
+hashes that code every time the state root is computed, and `EXTCODEHASH`
+hashes it again on every call. Here code passes through a `CodeStore`, a
+content addressed store that keeps one copy of each distinct code under its
+hash. Every account written with `set_account()`, which `set_code()`, the
+other state functions and the t8n alloc loader all go through, has its code
+replaced by the stored copy, so accounts with the same code share one object,
+and the code hash of an account is looked up in the store by its contents
+instead of being recomputed.
+
+Accounts still hold their code, so the rest of the specification is
+unchanged. Code only has to be hashed when it first enters the state, or
+again if it was evicted from the store.
+"""
+from collections import OrderedDict
+from dataclasses import replace
+from importlib import import_module
+from typing import Any, Dict, Optional, cast
+
+from ethereum_rlp import rlp
+from ethereum_types.bytes import Bytes
+
+from ethereum.crypto.hash import Hash32, keccak256
+
+from .utils import add_item
+
+EMPTY_CODE_HASH = keccak256(b"")
+
+
+class CodeStore:
+    """
+    The most recently used distinct codes, each stored once under its hash,
+    up to a total of `max_bytes` of code.
+
+    Codes are also indexed by their contents, so finding the hash of code
+    that is already stored is a dictionary lookup rather than a hash of the
+    code. Only new code is hashed.
+    """
+
+    max_bytes: int
+    size: int
+    _codes: "OrderedDict[Hash32, Bytes]"
+    _hashes: Dict[bytes, Hash32]
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024) -> None:
+        if max_bytes < 1:
+            raise ValueError("max_bytes must be at least 1")
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._codes = OrderedDict()
+        self._hashes = {}
+
+    def add(self, code: Bytes) -> Bytes:
+        """
+        Store `code`, returning the stored copy that equal codes share.
+        """
+        return self._codes[self._store(code)]
+
+    def code_hash(self, code: Bytes) -> Hash32:
+        """
+        Get the hash of `code`, storing the code if it is new.
+        """
+        if not code:
+            return EMPTY_CODE_HASH
+        return self._store(code)
+
+    def get(self, code_hash: Hash32) -> Optional[Bytes]:
+        """
+        Get the stored code with the hash `code_hash`, if there is one.
+        """
+        if code_hash == EMPTY_CODE_HASH:
+            return b""
+        return self._codes.get(code_hash)
+
+    def clear(self) -> None:
+        """
+        Drop every stored code.
+        """
+        self._codes.clear()
+        self._hashes.clear()
+        self.size = 0
+
+    def __len__(self) -> int:
+        """
+        Number of distinct codes stored.
+        """
+        return len(self._codes)
+
+    def _store(self, code: Bytes) -> Hash32:
+        """
+        Get the hash of `code`, storing it if it is new.
+        """
+        # Code returned from memory is a `bytearray`, which can't be a key
+        # or be shared.
+        if not isinstance(code, bytes):
+            code = bytes(code)
+        # Python caches the hash of a `bytes` object, so the stored copies
+        # are found without reading them again.
+        code_hash = self._hashes.get(code)
+        if code_hash is None:
+            code_hash = keccak256(code)
+            self._codes[code_hash] = code
+            self._hashes[code] = code_hash
+            self.size += len(code)
+            self._evict()
+            return code_hash
+
+        self._codes.move_to_end(code_hash)
+        return code_hash
+
+    def _evict(self) -> None:
+        """
+        Drop the least recently used codes until at most `max_bytes` are
+        stored, always keeping the most recent one.
+        """
+        while self.size > self.max_bytes and len(self._codes) > 1:
+            _, code = self._codes.popitem(last=False)
+            del self._hashes[code]
+            self.size -= len(code)
+
+
+CODE_STORE = CodeStore()
+"""
+The store used by the patches from `get_code_store_patches()`.
+"""
+
+
+def get_code_store_patches(fork: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Get dictionaries of functions to be monkey patched into the fork's
+    `fork_types`, `state` and `vm.instructions.environment` modules to keep
+    contract code in `CODE_STORE`.
+
+    `set_account()` wraps the one the `state` module has when this is
+    called, so patches replacing it must be applied first.
+    """
+    fork_types_patches: Dict[str, Any] = {}
+    state_patches: Dict[str, Any] = {}
+    environment_patches: Dict[str, Any] = {}
+
+    state_mod = cast(Any, import_module("ethereum." + fork + ".state"))
+    spec_set_account = state_mod.set_account
+
+    @add_item(fork_types_patches)
+    def encode_account(raw_account_data: Any, storage_root: Bytes) -> Bytes:
+        """
+        See `fork_types`.
+        """
+        return rlp.encode(
+            (
+                raw_account_data.nonce,
+                raw_account_data.balance,
+                storage_root,
+                CODE_STORE.code_hash(raw_account_data.code),
+            )
+        )
+
+    @add_item(state_patches)
+    def set_account(state: Any, address: Any, account: Optional[Any]) -> None:
+        """
+        See `state`.
+        """
+        if account is not None and account.code:
+            code = CODE_STORE.add(account.code)
+            if code is not account.code:
+                account = replace(account, code=code)
+        spec_set_account(state, address, account)
+
+    # `keccak256` is only used to hash code in the environment instructions.
+    environment_patches["keccak256"] = CODE_STORE.code_hash
+
+    return {
+        "fork_types": fork_types_patches,
+        "state": state_patches,
+        "vm.instructions.environment": environment_patches,
+    }
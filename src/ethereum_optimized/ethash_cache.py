@@ -0,0 +1,346 @@
+"""
+Optimized Ethash Cache
+^^^^^^^^^^^^^^^^^^^^^^
+
+.. contents:: Table of Contents
+    :backlinks: none
+    :local:
+
+Introduction
+------------
+
+This module contains replacements for `generate_cache()` and
+`hashimoto_light()` that can be monkey patched into the `fork` module of
+proof-of-work forks.
+
+`validate_proof_of_work()` in the specification regenerates the ethash cache
+for every block, although the cache only depends on the epoch of the block
+and so only changes every `EPOCH_SIZE` blocks. Here the caches of the most
+recently used epochs are kept in memory and, optionally, written to a
+directory so that later runs can read them from disk instead of generating
+them again.
+
+The specification also holds the cache as a tuple of tuples of `U32`, and
+`fnv()` creates a new `U32` for every word it mixes. Here a cache is an
+`EthashCache`, a flat array of 32-bit words, and the words being mixed are
+packed into a single integer with one 64-bit lane per word. The FNV prime is
+below `2**25`, so multiplying the packed integer by it never carries from one
+lane into the next, and one multiplication, one XOR and one mask mix every
+word at once.
+"""
+import os
+import sys
+from array import array
+from collections import OrderedDict
+from importlib import import_module
+from typing import Any, Dict, Optional, Sequence, Tuple, Union, cast
+
+from ethereum_types.bytes import Bytes, Bytes8
+from ethereum_types.numeric import U32, Uint
+
+from ethereum import ethash
+from ethereum.crypto.hash import Hash32, keccak256, keccak512
+
+from .utils import add_item
+
+SpecCache = Tuple[Tuple[U32, ...], ...]
+
+# Number of 32-bit words in each item of the cache.
+WORDS_PER_ITEM = 16
+
+FNV_PRIME = 0x01000193
+WORD_MASK = 0xFFFFFFFF
+ITEM_MASK = sum(WORD_MASK << (64 * i) for i in range(WORDS_PER_ITEM))
+MIX_MASK = sum(WORD_MASK << (64 * i) for i in range(2 * WORDS_PER_ITEM))
+
+
+def _words(data: bytes) -> "array[int]":
+    """
+    Read little endian bytes as an array of 32-bit words.
+    """
+    words = array("I")
+    words.frombytes(data)
+    if sys.byteorder != "little":
+        words.byteswap()
+    return words
+
+
+def _bytes(words: "array[int]") -> bytes:
+    """
+    Get the little endian bytes of an array of 32-bit words.
+    """
+    if sys.byteorder != "little":
+        words = array("I", words)
+        words.byteswap()
+    return words.tobytes()
+
+
+def _pack(words: Sequence[int]) -> int:
+    """
+    Pack 32-bit words into an integer with one 64-bit lane per word.
+    """
+    lanes = array("Q", words)
+    return int.from_bytes(lanes.tobytes(), sys.byteorder)
+
+
+def _unpack(packed: int, count: int) -> bytes:
+    """
+    Get the little endian bytes of the first `count` words in `packed`.
+    """
+    return b"".join(
+        ((packed >> (64 * i)) & WORD_MASK).to_bytes(4, "little")
+        for i in range(count)
+    )
+
+
+class EthashCache:
+    """
+    An ethash cache held as a flat array of 32-bit words, `WORDS_PER_ITEM` to
+    an item. `_lanes` holds the same words spread over 64-bit lanes, so that
+    items can be read straight into the packed form used for mixing.
+    """
+
+    words: "array[int]"
+    _lanes: memoryview
+
+    def __init__(self, words: "array[int]") -> None:
+        if words.typecode != "I" or len(words) % WORDS_PER_ITEM != 0:
+            raise ValueError("invalid ethash cache")
+        self.words = words
+        self._lanes = memoryview(array("Q", words)).cast("B")
+
+    @classmethod
+    def from_spec(cls, cache: SpecCache) -> "EthashCache":
+        """
+        Convert a cache returned by `ethereum.ethash.generate_cache`.
+        """
+        return cls(array("I", (int(word) for item in cache for word in item)))
+
+    def to_spec(self) -> SpecCache:
+        """
+        Convert to the representation used by `ethereum.ethash`.
+        """
+        words = self.words
+        return tuple(
+            tuple(U32(word) for word in words[i : i + WORDS_PER_ITEM])
+            for i in range(0, len(words), WORDS_PER_ITEM)
+        )
+
+    def __len__(self) -> int:
+        """
+        Number of items in the cache.
+        """
+        return len(self.words) // WORDS_PER_ITEM
+
+    def packed_item(self, index: int) -> int:
+        """
+        Get the item at `index`, packed with one 64-bit lane per word.
+        """
+        start = index * 8 * WORDS_PER_ITEM
+        return int.from_bytes(
+            self._lanes[start : start + 8 * WORDS_PER_ITEM], sys.byteorder
+        )
+
+
+def generate_cache(block_number: Uint) -> EthashCache:
+    """
+    Generate the cache for the block identified by `block_number`. See
+    `ethereum.ethash.generate_cache`.
+    """
+    seed = ethash.generate_seed(block_number)
+    size = int(ethash.cache_size(block_number) // ethash.HASH_BYTES)
+
+    items = [keccak512(seed)]
+    for _ in range(1, size):
+        items.append(keccak512(items[-1]))
+
+    for _ in range(ethash.CACHE_ROUNDS):
+        for index in range(size):
+            # `items[-1]` is the last item, as in the specification.
+            first = int.from_bytes(items[index - 1], "little")
+            second = int.from_bytes(
+                items[int.from_bytes(items[index][:4], "little") % size],
+                "little",
+            )
+            items[index] = keccak512((first ^ second).to_bytes(64, "little"))
+
+    return EthashCache(_words(b"".join(items)))
+
+
+def generate_dataset_item(cache: EthashCache, index: int) -> bytes:
+    """
+    Generate the dataset item at `index`. See
+    `ethereum.ethash.generate_dataset_item`.
+    """
+    size = len(cache)
+    start = (index % size) * WORDS_PER_ITEM
+    seed = int.from_bytes(
+        _bytes(cache.words[start : start + WORDS_PER_ITEM]), "little"
+    )
+    mix = _pack(_words(keccak512((seed ^ index).to_bytes(64, "little"))))
+
+    for j in range(int(ethash.DATASET_PARENTS)):
+        word = (mix >> (64 * (j % WORDS_PER_ITEM))) & WORD_MASK
+        parent = ((((index ^ j) * FNV_PRIME) ^ word) & WORD_MASK) % size
+        mix = ((mix * FNV_PRIME) ^ cache.packed_item(parent)) & ITEM_MASK
+
+    return keccak512(_unpack(mix, WORDS_PER_ITEM))
+
+
+def hashimoto_light(
+    header_hash: Hash32,
+    nonce: Bytes8,
+    cache: Union[EthashCache, SpecCache],
+    dataset_size: Uint,
+) -> Tuple[Bytes, Hash32]:
+    """
+    See `ethereum.ethash.hashimoto_light`. `cache` may also be in the
+    representation used by the specification.
+    """
+    if not isinstance(cache, EthashCache):
+        cache = EthashCache.from_spec(cache)
+
+    seed_hash = keccak512(header_hash + bytes(reversed(nonce)))
+    seed_head = int.from_bytes(seed_hash[:4], "little")
+    rows = int(dataset_size) // 128
+
+    mix_words = 2 * WORDS_PER_ITEM
+    mix = _pack(_words(seed_hash + seed_hash))
+
+    for i in range(ethash.HASHIMOTO_ACCESSES):
+        word = (mix >> (64 * (i % mix_words))) & WORD_MASK
+        parent = ((((i ^ seed_head) * FNV_PRIME) ^ word) & WORD_MASK) % rows
+        data = generate_dataset_item(cache, 2 * parent)
+        data += generate_dataset_item(cache, 2 * parent + 1)
+        mix = ((mix * FNV_PRIME) ^ _pack(_words(data))) & MIX_MASK
+
+    compressed = []
+    for i in range(0, mix_words, 4):
+        value = (mix >> (64 * i)) & WORD_MASK
+        for k in range(i + 1, i + 4):
+            word = (mix >> (64 * k)) & WORD_MASK
+            value = ((value * FNV_PRIME) ^ word) & WORD_MASK
+        compressed.append(value.to_bytes(4, "little"))
+
+    mix_digest = Bytes(b"".join(compressed))
+    return mix_digest, keccak256(seed_hash + mix_digest)
+
+
+class EthashCacheStore:
+    """
+    The ethash caches of the `max_epochs` most recently used epochs. When
+    `directory` is set, generated caches are also saved there as raw little
+    endian words and read back in when needed again.
+    """
+
+    max_epochs: int
+    directory: Optional[str]
+    _caches: "OrderedDict[Uint, EthashCache]"
+
+    def __init__(
+        self, max_epochs: int = 2, directory: Optional[str] = None
+    ) -> None:
+        if max_epochs < 1:
+            raise ValueError("max_epochs must be at least 1")
+        self.max_epochs = max_epochs
+        self.directory = directory
+        self._caches = OrderedDict()
+
+    def get(self, block_number: Uint) -> EthashCache:
+        """
+        Get the cache for the block identified by `block_number`. See
+        `ethereum.ethash.generate_cache`.
+        """
+        epoch_number = ethash.epoch(block_number)
+        cache = self._caches.get(epoch_number)
+        if cache is not None:
+            self._caches.move_to_end(epoch_number)
+            return cache
+
+        cache = self._load(block_number)
+        if cache is None:
+            cache = generate_cache(block_number)
+            self._save(block_number, cache)
+
+        self._caches[epoch_number] = cache
+        while len(self._caches) > self.max_epochs:
+            self._caches.popitem(last=False)
+        return cache
+
+    def clear(self) -> None:
+        """
+        Drop the caches held in memory.
+        """
+        self._caches.clear()
+
+    def _path(self, block_number: Uint) -> Optional[str]:
+        if self.directory is None:
+            return None
+        return os.path.join(
+            self.directory, f"ethash-cache-{ethash.epoch(block_number)}.bin"
+        )
+
+    def _load(self, block_number: Uint) -> Optional[EthashCache]:
+        """
+        Read a saved cache from disk, if there is one of the right size.
+        """
+        path = self._path(block_number)
+        if path is None or not os.path.exists(path):
+            return None
+
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size != int(ethash.cache_size(block_number)):
+                return None
+            # Read straight into the array, without an intermediate `bytes`.
+            words = array("I")
+            words.fromfile(f, size // 4)
+
+        if sys.byteorder != "little":
+            words.byteswap()
+        return EthashCache(words)
+
+    def _save(self, block_number: Uint, cache: EthashCache) -> None:
+        """
+        Write a cache to disk, if a directory is configured.
+        """
+        path = self._path(block_number)
+        if path is None:
+            return
+
+        os.makedirs(cast(str, self.directory), exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(_bytes(cache.words))
+        os.replace(temporary_path, path)
+
+
+ETHASH_CACHE_STORE = EthashCacheStore()
+"""
+The store used by the patches from `get_ethash_cache_patches()`.
+"""
+
+
+def get_ethash_cache_patches(fork: str) -> Dict[str, Any]:
+    """
+    Get a dictionary of functions to be monkey patched into the fork module
+    of a proof-of-work fork to reuse ethash caches between blocks.
+    """
+    patches: Dict[str, Any] = {}
+
+    mod = cast(Any, import_module("ethereum." + fork + ".fork"))
+    if not hasattr(mod, "validate_proof_of_work"):
+        raise Exception(
+            "Attempted to get ethash cache patches for non-pow fork"
+        )
+
+    @add_item(patches)
+    def generate_cache(block_number: Uint) -> EthashCache:
+        """
+        See `ethereum.ethash`.
+        """
+        return ETHASH_CACHE_STORE.get(block_number)
+
+    patches["hashimoto_light"] = hashimoto_light
+
+    return patches
@@ -0,0 +1,141 @@
+"""
+Optimized Hashed Trie Keys
+^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+.. contents:: Table of Contents
+    :backlinks: none
+    :local:
+
+Introduction
+------------
+
+This module contains a cache of the nibble paths of the keys of secured
+tries, so that keys are hashed and split into nibbles once, rather than every
+time a trie holding them is built.
+
+The specification's `_prepare_trie()` hashes every address or storage slot of
+a secured trie, and converts the hash to nibbles, each time `root()` is
+called, although most keys are the same from one block or transition to the
+next. `ethereum_optimized.trie_cache` already keeps the paths of the keys of
+each trie, and looks up those of new keys in `HASHED_KEYS`, one cache shared
+by the state trie and the storage tries of every account, including those of
+states created later in the same process.
+
+The cache is a segmented LRU. New keys go into a probationary segment, and
+only keys found there again are moved into a protected segment, so a run of
+tests touching many slots once each only ever evicts other slots that were
+used once, and keeps the ones that keep coming back.
+"""
+from collections import OrderedDict
+from typing import Optional
+
+from ethereum_types.bytes import Bytes
+
+from ethereum.crypto.hash import keccak256
+
+from .stack_trie import nibble_path
+
+
+class HashedKeyCache:
+    """
+    The nibble paths of the hashes of the `max_entries` trie keys most
+    worth keeping, with statistics on how often they are found.
+
+    Up to `protected_entries` of them are keys that were used more than once
+    since they were added.
+    """
+
+    max_entries: int
+    protected_entries: int
+    hits: int
+    misses: int
+    evictions: int
+    _probation: "OrderedDict[Bytes, Bytes]"
+    _protected: "OrderedDict[Bytes, Bytes]"
+
+    def __init__(
+        self,
+        max_entries: int = 1 << 18,
+        protected_entries: Optional[int] = None,
+    ) -> None:
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        if protected_entries is None:
+            protected_entries = max_entries * 4 // 5
+        if not 0 <= protected_entries <= max_entries:
+            raise ValueError("protected_entries must be within max_entries")
+        self.max_entries = max_entries
+        self.protected_entries = protected_entries
+        self._probation = OrderedDict()
+        self._protected = OrderedDict()
+        self.reset_statistics()
+
+    def path(self, preimage: Bytes) -> Bytes:
+        """
+        Get the nibble path of `preimage` in a secured trie.
+        """
+        protected = self._protected
+        path = protected.get(preimage)
+        if path is not None:
+            self.hits += 1
+            protected.move_to_end(preimage)
+            return path
+
+        path = self._probation.pop(preimage, None)
+        if path is not None:
+            self.hits += 1
+            protected[preimage] = path
+            if len(protected) > self.protected_entries:
+                # The least recently used protected key gets another chance
+                # on probation.
+                demoted, demoted_path = protected.popitem(last=False)
+                self._probation[demoted] = demoted_path
+            return path
+
+        self.misses += 1
+        path = nibble_path(keccak256(preimage))
+        self._probation[preimage] = path
+        if len(self._probation) + len(protected) > self.max_entries:
+            self.evictions += 1
+            if self._probation:
+                self._probation.popitem(last=False)
+            else:
+                protected.popitem(last=False)
+        return path
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        Fraction of the keys looked up since the statistics were reset that
+        were found in the cache.
+        """
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def reset_statistics(self) -> None:
+        """
+        Set the counts of hits, misses and evictions back to zero.
+        """
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def clear(self) -> None:
+        """
+        Drop every key, and the statistics.
+        """
+        self._probation.clear()
+        self._protected.clear()
+        self.reset_statistics()
+
+    def __len__(self) -> int:
+        """
+        Number of keys in the cache.
+        """
+        return len(self._probation) + len(self._protected)
+
+
+HASHED_KEYS = HashedKeyCache()
+"""
+The cache used by `ethereum_optimized.trie_cache`.
+"""
@@ -0,0 +1,553 @@
+"""
+Optimized Instruction Dispatch
+^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+.. contents:: Table of Contents
+    :backlinks: none
+    :local:
+
+Introduction
+------------
+
+This module contains a replacement for `execute_code()` that can be monkey
+patched into the fork's `interpreter` module.
+
+On every step the specification's interpreter loop builds an `Ops` member
+from the byte at `evm.pc`, looks its implementation up in `op_implementation`,
+and every `PUSH*` instruction then slices its immediate out of the code again.
+Here a code blob is decoded once into an instruction stream holding, for every
+`pc`, the opcode and the function implementing it. Each `PUSH*` instruction
+gets a function with its immediate and the `pc` of the following instruction
+already bound, so executing it only charges gas and pushes the value.
+
+The stream has an entry for every byte of the code, so a jump lands on the same
+instruction as in the specification, and bytes that are not opcodes only raise
+`InvalidOpcode` when they are executed. Decoded streams are cached by code, so
+contracts that are called repeatedly are only decoded once.
+
+Code is also split into blocks of consecutive instructions that only work on
+the stack and have a fixed gas cost, such as arithmetic, `PUSH*`, `DUP*` and
+`SWAP*`. Each block starts at a `JUMPDEST`, or after an instruction that is
+not in a block, and the analysis records its total gas cost and the stack
+heights with which it can run without underflowing or overflowing. When
+untraced execution reaches the start of a block with enough gas and a stack
+height in those bounds, the gas for the whole block is charged at once and its
+instructions run on the stack without any further checks. Otherwise the block
+is executed one instruction at a time as usual, so running out of gas or stack
+in the middle of a block fails at exactly the same instruction, with the same
+error, as in the specification.
+
+All of this only happens while the active tracer is `discard_evm_trace()`,
+so no trace events are built only to be thrown away. With any other tracer
+`execute_code()` and `charge_gas()` hand over to the specification's own,
+which emit exactly the events the tracer expects.
+"""
+from dataclasses import fields
+from functools import lru_cache, partial
+from importlib import import_module
+from typing import Any, Callable, Dict, List, Optional, Tuple, cast
+
+from ethereum_types.bytes import Bytes
+from ethereum_types.numeric import U256, Uint, ulen
+
+from ethereum.trace import discard_evm_trace, get_evm_trace
+
+from .utils import add_item
+
+# An instruction working only on the stack.
+StackOperation = Callable[[List[U256]], None]
+
+# The total gas cost of a block, the lowest and highest stack heights at which
+# it can run, its instructions, and the `pc` after it.
+Block = Tuple[Uint, int, int, Tuple[StackOperation, ...], Uint]
+
+# The opcode at a `pc` (or `None` if the byte there is not an opcode), the
+# function executing it, and the block starting there, if any.
+Instruction = Tuple[
+    Optional[Any], Optional[Callable[[Any], None]], Optional[Block]
+]
+
+# Number of decoded instruction streams kept per fork.
+STREAM_CACHE_SIZE = 1024
+
+# Most instructions in a block, so that a failed check only makes that many
+# instructions run one at a time.
+MAX_BLOCK_LENGTH = 64
+
+STACK_LIMIT = 1024
+
+
+def _binary(operation: Callable[[U256, U256], U256]) -> StackOperation:
+    """
+    Create a stack operation replacing the top two items with the result of
+    `operation` on them, the top item first.
+    """
+
+    def run(stack: List[U256]) -> None:
+        x = stack.pop()
+        y = stack.pop()
+        stack.append(operation(x, y))
+
+    return run
+
+
+def _single(operation: Callable[[U256], U256]) -> StackOperation:
+    """
+    Create a stack operation replacing the top item with the result of
+    `operation` on it.
+    """
+
+    def run(stack: List[U256]) -> None:
+        stack.append(operation(stack.pop()))
+
+    return run
+
+
+def _shl(shift: U256, value: U256) -> U256:
+    """
+    See `bitwise_shl`.
+    """
+    if Uint(shift) < Uint(256):
+        return U256((Uint(value) << Uint(shift)) & Uint(U256.MAX_VALUE))
+    else:
+        return U256(0)
+
+
+def _push_value(value: U256) -> StackOperation:
+    """
+    Create a stack operation pushing `value`.
+    """
+
+    def run(stack: List[U256]) -> None:
+        stack.append(value)
+
+    return run
+
+
+def _dup(item_number: int) -> StackOperation:
+    """
+    Create a stack operation duplicating the item `item_number` places below
+    the top.
+    """
+
+    def run(stack: List[U256]) -> None:
+        stack.append(stack[-1 - item_number])
+
+    return run
+
+
+def _swap(item_number: int) -> StackOperation:
+    """
+    Create a stack operation swapping the top with the item `item_number`
+    places below it.
+    """
+
+    def run(stack: List[U256]) -> None:
+        stack[-1], stack[-1 - item_number] = stack[-1 - item_number], stack[-1]
+
+    return run
+
+
+def _pop(stack: List[U256]) -> None:
+    """
+    A stack operation dropping the top item.
+    """
+    stack.pop()
+
+
+def _ignore(stack: List[U256]) -> None:  # noqa: U100
+    """
+    A stack operation doing nothing.
+    """
+
+
+# Instructions of the specification, by module and function name, that can
+# run in a block: the name of their gas cost, the number of stack items they
+# need, the change in stack height they make, and their operation.
+STACK_OPERATIONS: Dict[Tuple[str, str], Tuple[str, int, int, StackOperation]]
+STACK_OPERATIONS = {
+    ("arithmetic", "add"): (
+        "GAS_VERY_LOW",
+        2,
+        -1,
+        _binary(lambda x, y: x.wrapping_add(y)),
+    ),
+    ("arithmetic", "sub"): (
+        "GAS_VERY_LOW",
+        2,
+        -1,
+        _binary(lambda x, y: x.wrapping_sub(y)),
+    ),
+    ("arithmetic", "mul"): (
+        "GAS_LOW",
+        2,
+        -1,
+        _binary(lambda x, y: x.wrapping_mul(y)),
+    ),
+    ("arithmetic", "div"): (
+        "GAS_LOW",
+        2,
+        -1,
+        _binary(lambda x, y: U256(0) if y == 0 else x // y),
+    ),
+    ("arithmetic", "mod"): (
+        "GAS_LOW",
+        2,
+        -1,
+        _binary(lambda x, y: U256(0) if y == 0 else x % y),
+    ),
+    ("comparison", "less_than"): (
+        "GAS_VERY_LOW",
+        2,
+        -1,
+        _binary(lambda x, y: U256(x < y)),
+    ),
+    ("comparison", "greater_than"): (
+        "GAS_VERY_LOW",
+        2,
+        -1,
+        _binary(lambda x, y: U256(x > y)),
+    ),
+    ("comparison", "equal"): (
+        "GAS_VERY_LOW",
+        2,
+        -1,
+        _binary(lambda x, y: U256(x == y)),
+    ),
+    ("comparison", "is_zero"): (
+        "GAS_VERY_LOW",
+        1,
+        0,
+        _single(lambda x: U256(x == 0)),
+    ),
+    ("bitwise", "bitwise_and"): (
+        "GAS_VERY_LOW",
+        2,
+        -1,
+        _binary(lambda x, y: x & y),
+    ),
+    ("bitwise", "bitwise_or"): (
+        "GAS_VERY_LOW",
+        2,
+        -1,
+        _binary(lambda x, y: x | y),
+    ),
+    ("bitwise", "bitwise_xor"): (
+        "GAS_VERY_LOW",
+        2,
+        -1,
+        _binary(lambda x, y: x ^ y),
+    ),
+    ("bitwise", "bitwise_not"): ("GAS_VERY_LOW", 1, 0, _single(lambda x: ~x)),
+    ("bitwise", "bitwise_shl"): ("GAS_VERY_LOW", 2, -1, _binary(_shl)),
+    ("bitwise", "bitwise_shr"): (
+        "GAS_VERY_LOW",
+        2,
+        -1,
+        _binary(lambda x, y: y >> x if x < U256(256) else U256(0)),
+    ),
+    ("stack", "pop"): ("GAS_BASE", 1, -1, _pop),
+    ("control_flow", "jumpdest"): ("GAS_JUMPDEST", 0, 0, _ignore),
+}
+
+
+def get_instruction_stream_patches(fork: str) -> Dict[str, Any]:
+    """
+    Get a dictionary of functions to be monkey patched into the fork's
+    `interpreter` module, and every module importing `charge_gas()`, to
+    execute code from a pre-decoded instruction stream.
+    """
+    patches: Dict[str, Any] = {}
+
+    vm = cast(Any, import_module("ethereum." + fork + ".vm"))
+    # `Evm`, `get_valid_jump_destinations` and the precompiles are looked up
+    # on every call so that patches applied to the interpreter afterwards are
+    # picked up.
+    interpreter = cast(
+        Any, import_module("ethereum." + fork + ".vm.interpreter")
+    )
+    instructions = cast(
+        Any, import_module("ethereum." + fork + ".vm.instructions")
+    )
+    stack_instructions = cast(
+        Any, import_module("ethereum." + fork + ".vm.instructions.stack")
+    )
+    exceptions = cast(
+        Any, import_module("ethereum." + fork + ".vm.exceptions")
+    )
+    gas = cast(Any, import_module("ethereum." + fork + ".vm.gas"))
+    stack = cast(Any, import_module("ethereum." + fork + ".vm.stack"))
+
+    # Used while tracing.
+    spec_execute_code = interpreter.execute_code
+    spec_charge_gas = gas.charge_gas
+
+    Ops = instructions.Ops
+    ExceptionalHalt = exceptions.ExceptionalHalt
+    InvalidOpcode = exceptions.InvalidOpcode
+    OutOfGasError = exceptions.OutOfGasError
+    # Forks before Byzantium have no `REVERT`, and keep the output of a frame
+    # that halted exceptionally. `except ()` catches nothing.
+    has_revert = hasattr(exceptions, "Revert")
+    Revert = exceptions.Revert if has_revert else ()
+
+    evm_fields = {f.name for f in fields(vm.Evm)}
+    has_disable_precompiles = "disable_precompiles" in {
+        f.name for f in fields(vm.Message)
+    }
+
+    # For every byte, the opcode and its implementation, the size of its
+    # immediate if it is a `PUSH*` instruction, and its gas cost, stack
+    # bounds and stack operation if it can run in a block.
+    opcodes: List[Tuple[Optional[Any], Optional[Callable[[Any], None]]]] = []
+    push_sizes: List[int] = []
+    stack_operations: List[Optional[Tuple[Uint, int, int, StackOperation]]]
+    stack_operations = []
+    for byte in range(256):
+        try:
+            op = Ops(byte)
+        except ValueError:
+            opcodes.append((None, None))
+            push_sizes.append(0)
+            stack_operations.append(None)
+            continue
+
+        implementation = instructions.op_implementation[op]
+        opcodes.append((op, implementation))
+        push_size = 0
+        stack_operation = None
+        if isinstance(implementation, partial):
+            func = implementation.func
+            keywords = implementation.keywords
+            if func is stack_instructions.push_n:
+                push_size = keywords["num_bytes"]
+                if push_size == 0:
+                    stack_operation = (
+                        gas.GAS_BASE,
+                        0,
+                        1,
+                        _push_value(U256(0)),
+                    )
+            elif func is stack_instructions.dup_n:
+                item_number = keywords["item_number"]
+                stack_operation = (
+                    gas.GAS_VERY_LOW,
+                    item_number + 1,
+                    1,
+                    _dup(item_number),
+                )
+            elif func is stack_instructions.swap_n:
+                item_number = keywords["item_number"]
+                stack_operation = (
+                    gas.GAS_VERY_LOW,
+                    item_number + 1,
+                    0,
+                    _swap(item_number),
+                )
+        else:
+            # Only the specification's own functions, not replacements.
+            package, _, module_name = implementation.__module__.rpartition(".")
+            operation = STACK_OPERATIONS.get(
+                (module_name, implementation.__name__)
+            )
+            if package == instructions.__name__ and operation is not None:
+                cost_name, needed, change, run = operation
+                stack_operation = (
+                    getattr(gas, cost_name),
+                    needed,
+                    change,
+                    run,
+                )
+        push_sizes.append(push_size)
+        stack_operations.append(stack_operation)
+
+    @add_item(patches)
+    def charge_gas(evm: Any, amount: Uint) -> None:
+        """
+        See `gas`.
+        """
+        if get_evm_trace() is not discard_evm_trace:
+            spec_charge_gas(evm, amount)
+            return
+        if evm.gas_left < amount:
+            raise OutOfGasError
+        else:
+            evm.gas_left -= amount
+
+    def _push(value: U256, length: Uint) -> Callable[[Any], None]:
+        """
+        Create the function executing a `PUSH*` instruction of `length` bytes
+        with the immediate `value`. See `push_n()`.
+        """
+
+        def push(evm: Any) -> None:
+            # GAS
+            gas.charge_gas(evm, gas.GAS_VERY_LOW)
+
+            # OPERATION
+            stack.push(evm.stack, value)
+
+            # PROGRAM COUNTER
+            evm.pc += length
+
+        return push
+
+    @lru_cache(maxsize=STREAM_CACHE_SIZE)
+    def decode(code: Bytes) -> Tuple[Instruction, ...]:
+        """
+        Decode `code` into an instruction stream with an entry for every byte.
+        `PUSH*` instructions reached by stepping through the code from its
+        start get their immediate bound, and blocks are found among those
+        instructions; bytes inside an immediate keep the plain entry for their
+        opcode.
+        """
+        stream: List[Instruction] = [opcodes[byte] + (None,) for byte in code]
+
+        start = 0
+        block: List[StackOperation] = []
+        cost = Uint(0)
+        height = 0
+        needed = 0
+        peak = 0
+
+        def end_block(pc: int) -> None:
+            if block:
+                stream[start] = stream[start][:2] + (
+                    (
+                        cost,
+                        needed,
+                        STACK_LIMIT - peak,
+                        tuple(block),
+                        Uint(pc),
+                    ),
+                )
+
+        pc = 0
+        while pc < len(code):
+            size = push_sizes[code[pc]]
+            stack_operation = stack_operations[code[pc]]
+            if size > 0:
+                immediate = code[pc + 1 : pc + 1 + size].ljust(size, b"\x00")
+                value = U256.from_be_bytes(immediate)
+                stream[pc] = (
+                    stream[pc][0],
+                    _push(value, Uint(1 + size)),
+                    None,
+                )
+                stack_operation = (gas.GAS_VERY_LOW, 0, 1, _push_value(value))
+
+            # Jumps only land on a `JUMPDEST`, so blocks start there.
+            if (
+                stack_operation is None
+                or stream[pc][0] == Ops.JUMPDEST
+                or len(block) == MAX_BLOCK_LENGTH
+            ):
+                end_block(pc)
+                block = []
+
+            if stack_operation is not None:
+                if not block:
+                    start = pc
+                    cost = Uint(0)
+                    height = needed = peak = 0
+                operation_cost, operation_needed, change, run = stack_operation
+                block.append(run)
+                cost += operation_cost
+                needed = max(needed, operation_needed - height)
+                height += change
+                peak = max(peak, height)
+            pc += 1 + size
+
+        end_block(pc)
+        return tuple(stream)
+
+    def _evm(message: Any) -> Any:
+        """
+        Create the frame executing `message`, with the fields the fork's `Evm`
+        has.
+        """
+        code = message.code
+        values = dict(
+            pc=Uint(0),
+            stack=[],
+            memory=bytearray(),
+            code=code,
+            gas_left=message.gas,
+            valid_jump_destinations=interpreter.get_valid_jump_destinations(
+                code
+            ),
+            logs=(),
+            refund_counter=0,
+            running=True,
+            message=message,
+            output=b"",
+            accounts_to_delete=set(),
+            touched_accounts=set(),
+            return_data=b"",
+            error=None,
+        )
+        if "accessed_addresses" in evm_fields:
+            values["accessed_addresses"] = message.accessed_addresses
+            values["accessed_storage_keys"] = message.accessed_storage_keys
+        return interpreter.Evm(
+            **{k: v for k, v in values.items() if k in evm_fields}
+        )
+
+    def _run(evm: Any) -> None:
+        """
+        Execute the code of `evm` from its instruction stream without emitting
+        any trace events, running blocks at once wherever their gas and stack
+        bounds allow.
+        """
+        code = evm.code
+        code_length = ulen(code)
+        # Init code read from memory is a `bytearray`, which can't be cached.
+        stream = decode(bytes(code))
+        while evm.running and evm.pc < code_length:
+            op, implementation, block = stream[evm.pc]
+            if block is not None:
+                cost, lowest, highest, operations, end = block
+                evm_stack = evm.stack
+                if (
+                    evm.gas_left >= cost
+                    and lowest <= len(evm_stack) <= highest
+                ):
+                    evm.gas_left -= cost
+                    for operation in operations:
+                        operation(evm_stack)
+                    evm.pc = end
+                    continue
+
+            if op is None:
+                raise InvalidOpcode(code[evm.pc])
+            implementation(evm)
+
+    @add_item(patches)
+    def execute_code(message: Any) -> Any:
+        """
+        See `interpreter`.
+        """
+        if get_evm_trace() is not discard_evm_trace:
+            return spec_execute_code(message)
+
+        evm = _evm(message)
+        try:
+            precompiles = interpreter.PRE_COMPILED_CONTRACTS
+            if evm.message.code_address in precompiles:
+                if has_disable_precompiles and message.disable_precompiles:
+                    return evm
+                precompiles[evm.message.code_address](evm)
+                return evm
+
+            _run(evm)
+
+        except ExceptionalHalt as error:
+            evm.gas_left = Uint(0)
+            if has_revert:
+                evm.output = b""
+            evm.error = error
+        except Revert as error:
+            evm.error = error
+        return evm
+
+    return patches
@@ -0,0 +1,146 @@
+"""
+Optimized Jump Destination Analysis
+^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+.. contents:: Table of Contents
+    :backlinks: none
+    :local:
+
+Introduction
+------------
+
+This module contains a replacement for `get_valid_jump_destinations()` that
+can be monkey patched into the fork's `runtime` and `interpreter` modules.
+
+The specification analyzes the code again on every call to `execute_code()`,
+building an `Ops` member for every byte it steps over. Here the analysis is
+done by a regular expression that matches `JUMPDEST` and each `PUSH*` opcode
+together with its immediate, so the bytes in between are skipped without
+running any Python. The results are kept in a process-wide cache keyed by
+the code itself, shared by all forks since the encoding of `JUMPDEST` and
+`PUSH*` has never changed. Python caches the hash of a `bytes` object, so
+calling a contract whose code is shared through `CODE_STORE` again costs a
+dictionary lookup, and other code, such as init code, is never hashed with
+keccak.
+
+The destinations are returned as a `frozenset` rather than the `set` of the
+specification, so that the cached results can't be changed by a caller. The
+interpreter only tests them for membership.
+"""
+import re
+from collections import OrderedDict
+from importlib import import_module
+from typing import Any, Dict, FrozenSet, cast
+
+from ethereum_types.bytes import Bytes
+from ethereum_types.numeric import Uint
+
+from .utils import add_item
+
+JUMPDEST = 0x5B
+PUSH1 = 0x60
+PUSH32 = 0x7F
+
+# Matches a `JUMPDEST` or a `PUSH*` opcode followed by its immediate, which may
+# be cut short by the end of the code.
+INSTRUCTION = re.compile(
+    b"|".join(
+        [re.escape(bytes([JUMPDEST]))]
+        + [
+            re.escape(bytes([opcode])) + b".{0,%d}" % (opcode - PUSH1 + 1)
+            for opcode in range(PUSH1, PUSH32 + 1)
+        ]
+    ),
+    re.DOTALL,
+)
+
+
+def find_jump_destinations(code: Bytes) -> FrozenSet[Uint]:
+    """
+    Find the valid jump destinations in `code`. See
+    `get_valid_jump_destinations()` in the fork's `runtime` module.
+    """
+    return frozenset(
+        Uint(match.start())
+        for match in INSTRUCTION.finditer(code)
+        if code[match.start()] == JUMPDEST
+    )
+
+
+class JumpdestCache:
+    """
+    The jump destinations of the most recently analyzed codes, up to a total
+    of `max_bytes` of code, keyed by the code.
+    """
+
+    max_bytes: int
+    size: int
+    _destinations: "OrderedDict[bytes, FrozenSet[Uint]]"
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024) -> None:
+        if max_bytes < 1:
+            raise ValueError("max_bytes must be at least 1")
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._destinations = OrderedDict()
+
+    def get(self, code: Bytes) -> FrozenSet[Uint]:
+        """
+        Get the valid jump destinations in `code`.
+        """
+        # Init code read from memory is a `bytearray`, which can't be a key.
+        if not isinstance(code, bytes):
+            code = bytes(code)
+        destinations = self._destinations.get(code)
+        if destinations is not None:
+            self._destinations.move_to_end(code)
+            return destinations
+
+        destinations = find_jump_destinations(code)
+        self._destinations[code] = destinations
+        self.size += len(code)
+        # Always keep the most recent analysis.
+        while self.size > self.max_bytes and len(self._destinations) > 1:
+            evicted, _ = self._destinations.popitem(last=False)
+            self.size -= len(evicted)
+        return destinations
+
+    def clear(self) -> None:
+        """
+        Drop every cached analysis.
+        """
+        self._destinations.clear()
+        self.size = 0
+
+    def __len__(self) -> int:
+        """
+        Number of codes whose analysis is cached.
+        """
+        return len(self._destinations)
+
+
+JUMPDEST_CACHE = JumpdestCache()
+"""
+The cache used by the patches from `get_jumpdest_patches()`.
+"""
+
+
+def get_jumpdest_patches(fork: str) -> Dict[str, Any]:
+    """
+    Get a dictionary of functions to be monkey patched into the fork's
+    `runtime` and `interpreter` modules to cache jump destination analysis.
+    """
+    patches: Dict[str, Any] = {}
+
+    Ops = cast(Any, import_module("ethereum." + fork + ".vm.instructions")).Ops
+    assert Ops.JUMPDEST.value == JUMPDEST
+    assert (Ops.PUSH1.value, Ops.PUSH32.value) == (PUSH1, PUSH32)
+
+    @add_item(patches)
+    def get_valid_jump_destinations(code: Bytes) -> FrozenSet[Uint]:
+        """
+        See `runtime`.
+        """
+        return JUMPDEST_CACHE.get(code)
+
+    return patches
@@ -0,0 +1,156 @@
+"""
+Optimized Log Accumulation
+^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+.. contents:: Table of Contents
+    :backlinks: none
+    :local:
+
+Introduction
+------------
+
+This module contains replacements for the classes and functions of a fork that
+collect logs, so that collecting `n` logs takes `O(n)` time.
+
+In the specification, logs are gathered in tuples. Each `LOG*` instruction
+builds a new tuple one entry longer than the last, each successful child
+frame is merged into its parent by concatenation, and each transaction's logs
+and receipt key are concatenated onto those of the block. All of these copy
+everything collected so far, so a frame or block emitting thousands of logs
+takes quadratic time.
+
+Here a frame's logs and the block's logs and receipt keys are kept in lists
+that are only ever appended to or extended in place. The `+=` in the
+specification extends a list in place. The logs of a message call are frozen
+into a tuple once, when its `MessageCallOutput` is created, so receipts are
+built from tuples exactly as before.
+"""
+from dataclasses import dataclass, field
+from functools import partial
+from importlib import import_module
+from typing import Any, Dict, List, Tuple, cast
+
+from ethereum_types.bytes import Bytes
+from ethereum_types.numeric import Uint
+
+from .utils import add_item
+
+
+def get_log_patches(fork: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Get dictionaries of classes and functions to be monkey patched into the
+    fork's `vm`, `vm.interpreter` and `vm.instructions.log` modules to collect
+    logs in lists.
+    """
+    vm_patches: Dict[str, Any] = {}
+    interpreter_patches: Dict[str, Any] = {}
+    log_patches: Dict[str, Any] = {}
+
+    vm = cast(Any, import_module("ethereum." + fork + ".vm"))
+    interpreter = cast(
+        Any, import_module("ethereum." + fork + ".vm.interpreter")
+    )
+    log_mod = cast(
+        Any, import_module("ethereum." + fork + ".vm.instructions.log")
+    )
+    # The gas, memory and stack functions are looked up on every call so that
+    # patches applied to them afterwards are picked up.
+    gas = cast(Any, import_module("ethereum." + fork + ".vm.gas"))
+    memory = cast(Any, import_module("ethereum." + fork + ".vm.memory"))
+    stack = cast(Any, import_module("ethereum." + fork + ".vm.stack"))
+    Log = cast(Any, import_module("ethereum." + fork + ".blocks")).Log
+    SpecBlockOutput: Any = vm.BlockOutput
+    # Subclass the class currently in use, so earlier patches are kept.
+    SpecEvm: Any = interpreter.Evm
+    spec_post_init = getattr(SpecEvm, "__post_init__", None)
+    SpecMessageCallOutput: Any = interpreter.MessageCallOutput
+
+    # Forks before Byzantium have no static calls.
+    has_static_calls = hasattr(log_mod, "WriteInStaticContext")
+
+    @add_item(vm_patches)
+    @dataclass
+    class BlockOutput(SpecBlockOutput):
+        """
+        Output from applying the block body to the present state, with the
+        receipt keys and logs collected in lists.
+        """
+
+        receipt_keys: List[Bytes] = field(default_factory=list)
+        block_logs: List[Any] = field(default_factory=list)
+
+    @add_item(interpreter_patches)
+    @dataclass
+    class Evm(SpecEvm):
+        """
+        The internal state of the virtual machine, with the logs collected in
+        a list.
+        """
+
+        def __post_init__(self) -> None:
+            if spec_post_init is not None:
+                spec_post_init(self)
+            self.logs: List[Any] = list(self.logs)
+
+    @add_item(interpreter_patches)
+    @dataclass
+    class MessageCallOutput(SpecMessageCallOutput):
+        """
+        Output of a particular message call, with the logs frozen into a
+        tuple.
+        """
+
+        def __post_init__(self) -> None:
+            self.logs: Tuple[Any, ...] = tuple(self.logs)
+
+    @add_item(log_patches)
+    def log_n(evm: Evm, num_topics: int) -> None:
+        """
+        See `log`.
+        """
+        # STACK
+        memory_start_index = stack.pop(evm.stack)
+        size = stack.pop(evm.stack)
+
+        topics = []
+        for _ in range(num_topics):
+            topic = stack.pop(evm.stack).to_be_bytes32()
+            topics.append(topic)
+
+        # GAS
+        extend_memory = gas.calculate_gas_extend_memory(
+            evm.memory, [(memory_start_index, size)]
+        )
+        gas.charge_gas(
+            evm,
+            gas.GAS_LOG
+            + gas.GAS_LOG_DATA * Uint(size)
+            + gas.GAS_LOG_TOPIC * Uint(num_topics)
+            + extend_memory.cost,
+        )
+
+        # OPERATION
+        evm.memory += b"\x00" * extend_memory.expand_by
+        if has_static_calls and evm.message.is_static:
+            raise log_mod.WriteInStaticContext
+        log_entry = Log(
+            address=evm.message.current_target,
+            topics=tuple(topics),
+            data=memory.memory_read_bytes(
+                evm.memory, memory_start_index, size
+            ),
+        )
+
+        evm.logs.append(log_entry)
+
+        # PROGRAM COUNTER
+        evm.pc += Uint(1)
+
+    for num_topics in range(5):
+        log_patches[f"log{num_topics}"] = partial(log_n, num_topics=num_topics)
+
+    return {
+        "vm": vm_patches,
+        "vm.interpreter": interpreter_patches,
+        "vm.instructions.log": log_patches,
+    }
@@ -0,0 +1,409 @@
+"""
+Optimized Pairing Precompiles
+^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+.. contents:: Table of Contents
+    :backlinks: none
+    :local:
+
+Introduction
+------------
+
+This module contains replacements for the BLS12-381 and alt_bn128 pairing
+precompiles, and for the BLS12-381 subgroup checks, that can be monkey
+patched into the fork's precompiled contract modules.
+
+The specification computes a full pairing, including its final
+exponentiation, for every pair and multiplies the results. Since the final
+exponentiation is a homomorphism, the product of the pairings is the final
+exponentiation of the product of the Miller loops. Here the Miller loops of
+all pairs run in step, sharing the squaring of the accumulator, and a single
+final exponentiation is done at the end.
+
+The specification also checks that a point is in the prime order subgroup by
+multiplying it by the (255 bit) group order. Here the checks use an
+endomorphism whose eigenvalue on the subgroup is known:
+
+* BLS12-381 G1: `phi(x, y) = (beta * x, y)` acts as `-z**2` on G1.
+* BLS12-381 G2: the untwist-Frobenius-twist map `psi` acts as `z` on G2.
+* alt_bn128 G2: `psi` acts as `6 * x**2` on G2.
+
+where `z` and `x` are the curve parameters, so only a 64 or 128 bit
+multiplication is needed. alt_bn128 G1 has cofactor one, so every point on
+the curve is in the subgroup.
+
+Gas is charged by running the fork's own precompile on zeroes of the same
+length as the input. Every point is then at infinity, so it charges exactly
+what it would for the real input but skips the pairings.
+"""
+from importlib import import_module
+from typing import Any, Dict, List, Sequence, Tuple, cast
+
+from ethereum_types.numeric import U256
+from py_ecc import optimized_bls12_381 as bls12_381
+from py_ecc import optimized_bn128 as bn128
+from py_ecc.optimized_bls12_381.optimized_pairing import (
+    cast_point_to_fq12 as bls12_381_cast_point_to_fq12,
+)
+from py_ecc.optimized_bls12_381.optimized_pairing import (
+    linefunc as bls12_381_linefunc,
+)
+from py_ecc.optimized_bls12_381.optimized_pairing import (
+    pseudo_binary_encoding as bls12_381_loop,
+)
+from py_ecc.optimized_bn128.optimized_pairing import (
+    cast_point_to_fq12 as bn128_cast_point_to_fq12,
+)
+from py_ecc.optimized_bn128.optimized_pairing import linefunc as bn128_linefunc
+from py_ecc.optimized_bn128.optimized_pairing import (
+    pseudo_binary_encoding as bn128_loop,
+)
+
+from .utils import add_item
+
+# A point as the `(x, y, z)` triple used by py_ecc's optimized curves.
+Point = Tuple[Any, Any, Any]
+
+# The BLS12-381 parameter is `-BLS12_381_Z`.
+BLS12_381_Z = 0xD201000000010000
+# The alt_bn128 parameter.
+BN128_X = 4965661367192848881
+
+# A primitive cube root of unity in the BLS12-381 base field.
+BLS12_381_BETA = bls12_381.FQ(
+    0x5F19672FDF76CE51BA69C6076A0F77EADDB3A93BE6F89688DE17D813620A00022E01FFFFFFFEFFFE  # noqa: E501
+)
+# Coefficients of `psi` for BLS12-381, `1 / (1 + i) ** ((p - 1) / 3)` and
+# `1 / (1 + i) ** ((p - 1) / 2)`.
+BLS12_381_PSI_X = bls12_381.FQ2.one() / bls12_381.FQ2([1, 1]) ** (
+    (bls12_381.field_modulus - 1) // 3
+)
+BLS12_381_PSI_Y = bls12_381.FQ2.one() / bls12_381.FQ2([1, 1]) ** (
+    (bls12_381.field_modulus - 1) // 2
+)
+# Coefficients of `psi` for alt_bn128, `(9 + i) ** ((p - 1) / 3)` and
+# `(9 + i) ** ((p - 1) / 2)`.
+BN128_PSI_X = bn128.FQ2([9, 1]) ** ((bn128.field_modulus - 1) // 3)
+BN128_PSI_Y = bn128.FQ2([9, 1]) ** ((bn128.field_modulus - 1) // 2)
+
+
+def _is_inf(point: Point) -> bool:
+    return point[2] == point[2].zero()
+
+
+def _equal(p1: Point, p2: Point) -> bool:
+    """
+    Compare two points given in projective coordinates.
+    """
+    if _is_inf(p1) or _is_inf(p2):
+        return _is_inf(p1) and _is_inf(p2)
+    x1, y1, z1 = p1
+    x2, y2, z2 = p2
+    return x1 * z2 == x2 * z1 and y1 * z2 == y2 * z1
+
+
+def _conjugate(value: Any) -> Any:
+    """
+    Apply the Frobenius map to an element of `FQ2`.
+    """
+    c0, c1 = value.coeffs
+    return type(value)([c0, -c1])
+
+
+def _psi(point: Point, x_coefficient: Any, y_coefficient: Any) -> Point:
+    """
+    Apply the untwist-Frobenius-twist endomorphism to a G2 point.
+    """
+    x, y, z = point
+    return (
+        _conjugate(x) * x_coefficient,
+        _conjugate(y) * y_coefficient,
+        _conjugate(z),
+    )
+
+
+def is_in_bls12_381_g1(point: Point) -> bool:
+    """
+    Check whether a point on the BLS12-381 curve is in G1.
+    """
+    if _is_inf(point):
+        return True
+    x, y, z = point
+    return _equal(
+        (x * BLS12_381_BETA, y, z),
+        bls12_381.neg(bls12_381.multiply(point, BLS12_381_Z**2)),
+    )
+
+
+def is_in_bls12_381_g2(point: Point) -> bool:
+    """
+    Check whether a point on the BLS12-381 twisted curve is in G2.
+    """
+    if _is_inf(point):
+        return True
+    return _equal(
+        _psi(point, BLS12_381_PSI_X, BLS12_381_PSI_Y),
+        bls12_381.neg(bls12_381.multiply(point, BLS12_381_Z)),
+    )
+
+
+def is_in_bn128_g2(point: Point) -> bool:
+    """
+    Check whether a point on the alt_bn128 twisted curve is in G2.
+    """
+    if _is_inf(point):
+        return True
+    return _equal(
+        _psi(point, BN128_PSI_X, BN128_PSI_Y),
+        bn128.multiply(point, 6 * BN128_X**2),
+    )
+
+
+def bls12_381_pairing_check(pairs: Sequence[Tuple[Point, Point]]) -> bool:
+    """
+    Check whether the product of the pairings of `(g1_point, g2_point)` pairs
+    is one. The points must be in G1 and G2.
+    """
+    FQ12 = bls12_381.FQ12
+    loops = []
+    for p, q in pairs:
+        if not _is_inf(p) and not _is_inf(q):
+            loops.append(
+                (q, bls12_381.twist(q), bls12_381_cast_point_to_fq12(p))
+            )
+    if not loops:
+        return True
+
+    f_num, f_den = FQ12.one(), FQ12.one()
+    rs = [q for q, _, _ in loops]
+    for bit in bls12_381_loop[62::-1]:
+        f_num = f_num * f_num
+        f_den = f_den * f_den
+        for i, (q, twist_q, p) in enumerate(loops):
+            r = rs[i]
+            twist_r = bls12_381.twist(r)
+            numerator, denominator = bls12_381_linefunc(twist_r, twist_r, p)
+            f_num = f_num * numerator
+            f_den = f_den * denominator
+            r = bls12_381.double(r)
+            if bit == 1:
+                numerator, denominator = bls12_381_linefunc(
+                    bls12_381.twist(r), twist_q, p
+                )
+                f_num = f_num * numerator
+                f_den = f_den * denominator
+                r = bls12_381.add(r, q)
+            rs[i] = r
+
+    return bls12_381.final_exponentiate(f_num / f_den) == FQ12.one()
+
+
+def bn128_pairing_check(pairs: Sequence[Tuple[Point, Point]]) -> bool:
+    """
+    Check whether the product of the pairings of `(g1_point, g2_point)` pairs
+    is one. The points must be in G1 and G2.
+    """
+    FQ12 = bn128.FQ12
+    modulus = bn128.field_modulus
+    loops = []
+    for p, q in pairs:
+        if not _is_inf(p) and not _is_inf(q):
+            twist_q = bn128.twist(q)
+            loops.append(
+                (twist_q, bn128.neg(twist_q), bn128_cast_point_to_fq12(p))
+            )
+    if not loops:
+        return True
+
+    f_num, f_den = FQ12.one(), FQ12.one()
+    rs = [q for q, _, _ in loops]
+    for bit in bn128_loop[63::-1]:
+        f_num = f_num * f_num
+        f_den = f_den * f_den
+        for i, (q, neg_q, p) in enumerate(loops):
+            r = rs[i]
+            numerator, denominator = bn128_linefunc(r, r, p)
+            f_num = f_num * numerator
+            f_den = f_den * denominator
+            r = bn128.double(r)
+            if bit != 0:
+                addend = q if bit == 1 else neg_q
+                numerator, denominator = bn128_linefunc(r, addend, p)
+                f_num = f_num * numerator
+                f_den = f_den * denominator
+                r = bn128.add(r, addend)
+            rs[i] = r
+
+    for i, (q, _, p) in enumerate(loops):
+        q1 = (q[0] ** modulus, q[1] ** modulus, q[2] ** modulus)
+        neg_q2 = (q1[0] ** modulus, -(q1[1] ** modulus), q1[2] ** modulus)
+        numerator, denominator = bn128_linefunc(rs[i], q1, p)
+        f_num = f_num * numerator
+        f_den = f_den * denominator
+        numerator, denominator = bn128_linefunc(
+            bn128.add(rs[i], q1), neg_q2, p
+        )
+        f_num = f_num * numerator
+        f_den = f_den * denominator
+
+    return bn128.final_exponentiate(f_num / f_den) == FQ12.one()
+
+
+def _charge_spec_gas(spec_precompile: Any, evm: Any) -> None:
+    """
+    Charge the gas `spec_precompile` charges for the input of `evm`, and
+    raise the errors it raises for the length of that input.
+    """
+    message = evm.message
+    data = message.data
+    message.data = bytes(len(data))
+    try:
+        spec_precompile(evm)
+    finally:
+        message.data = data
+
+
+def get_bls12_381_pairing_patches(fork: str) -> Dict[str, Any]:
+    """
+    Get a dictionary of functions to be monkey patched into the fork's
+    `bls12_381` modules to speed up subgroup checks and the pairing
+    precompile.
+    """
+    patches: Dict[str, Any] = {}
+
+    package = "ethereum." + fork + ".vm.precompiled_contracts.bls12_381"
+    bls_mod = cast(Any, import_module(package))
+    spec_pairing = cast(
+        Any, import_module(package + ".bls12_381_pairing")
+    ).bls12_pairing
+    memory = cast(Any, import_module("ethereum." + fork + ".vm.memory"))
+    InvalidParameter = cast(
+        Any, import_module("ethereum." + fork + ".vm.exceptions")
+    ).InvalidParameter
+
+    @add_item(patches)
+    def decode_g1_scalar_pair(data: bytes) -> Tuple[Point, int]:
+        """
+        See `bls12_381`.
+        """
+        point = bls_mod.bytes_to_g1(data[:128])
+        if not is_in_bls12_381_g1(point):
+            raise InvalidParameter("Sub-group check failed.")
+
+        m = int.from_bytes(
+            memory.buffer_read(data, U256(128), U256(32)), "big"
+        )
+
+        return point, m
+
+    @add_item(patches)
+    def decode_g2_scalar_pair(data: bytes) -> Tuple[Point, int]:
+        """
+        See `bls12_381`.
+        """
+        point = bls_mod.bytes_to_g2(data[:256])
+
+        if not is_in_bls12_381_g2(point):
+            raise InvalidParameter("Point failed sub-group check.")
+
+        n = int.from_bytes(data[256 : 256 + 32], "big")
+
+        return point, n
+
+    @add_item(patches)
+    def bls12_pairing(evm: Any) -> None:
+        """
+        See `bls12_381_pairing`.
+        """
+        data = evm.message.data
+
+        # GAS
+        _charge_spec_gas(spec_pairing, evm)
+
+        # OPERATION
+        k = len(data) // 384
+        pairs: List[Tuple[Point, Point]] = []
+        for i in range(k):
+            g1_start = 384 * i
+            g2_start = 384 * i + 128
+
+            g1_point = bls_mod.bytes_to_g1(data[g1_start : g1_start + 128])
+            if not is_in_bls12_381_g1(g1_point):
+                raise InvalidParameter("Sub-group check failed for G1 point.")
+
+            g2_point = bls_mod.bytes_to_g2(data[g2_start : g2_start + 256])
+            if not is_in_bls12_381_g2(g2_point):
+                raise InvalidParameter("Sub-group check failed for G2 point.")
+
+            pairs.append((g1_point, g2_point))
+
+        if bls12_381_pairing_check(pairs):
+            evm.output = b"\x00" * 31 + b"\x01"
+        else:
+            evm.output = b"\x00" * 32
+
+    return patches
+
+
+def get_alt_bn128_pairing_patches(fork: str) -> Dict[str, Any]:
+    """
+    Get a dictionary of functions to be monkey patched into the fork's
+    `alt_bn128` module to speed up the pairing check precompile.
+    """
+    patches: Dict[str, Any] = {}
+
+    alt_bn128 = cast(
+        Any,
+        import_module(
+            "ethereum." + fork + ".vm.precompiled_contracts.alt_bn128"
+        ),
+    )
+    spec_pairing_check = alt_bn128.alt_bn128_pairing_check
+    exceptions = cast(
+        Any, import_module("ethereum." + fork + ".vm.exceptions")
+    )
+    memory = cast(Any, import_module("ethereum." + fork + ".vm.memory"))
+    InvalidParameter = exceptions.InvalidParameter
+    OutOfGasError = exceptions.OutOfGasError
+
+    @add_item(patches)
+    def alt_bn128_pairing_check(evm: Any) -> None:
+        """
+        See `alt_bn128`.
+        """
+        data = evm.message.data
+
+        # GAS
+        _charge_spec_gas(spec_pairing_check, evm)
+
+        # OPERATION
+        pairs: List[Tuple[Point, Point]] = []
+        for i in range(len(data) // 192):
+            try:
+                p = alt_bn128.bytes_to_G1(
+                    memory.buffer_read(data, U256(192 * i), U256(64))
+                )
+                q = alt_bn128.bytes_to_G2(
+                    memory.buffer_read(data, U256(192 * i + 64), U256(128))
+                )
+            except InvalidParameter as e:
+                raise OutOfGasError from e
+            # G1 has cofactor one, so a point on the curve is in G1.
+            if q is not None:
+                q = (
+                    bn128.FQ2([int(c) for c in q[0].coeffs]),
+                    bn128.FQ2([int(c) for c in q[1].coeffs]),
+                    bn128.FQ2.one(),
+                )
+                if not is_in_bn128_g2(q):
+                    raise OutOfGasError
+            if p is not None and q is not None:
+                p = (bn128.FQ(int(p[0])), bn128.FQ(int(p[1])), bn128.FQ.one())
+                pairs.append((p, q))
+
+        if bn128_pairing_check(pairs):
+            evm.output = U256(1).to_be_bytes32()
+        else:
+            evm.output = U256(0).to_be_bytes32()
+
+    return patches
@@ -0,0 +1,206 @@
+"""
+Optimized Parallel Storage Roots
+^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+.. contents:: Table of Contents
+    :backlinks: none
+    :local:
+
+Introduction
+------------
+
+This module contains functions that can be monkey patched into the fork's
+`state` module so that `state_root()` computes the storage roots of
+different accounts at the same time.
+
+In the specification `state_root()` asks for the storage root of each account
+as the account is encoded, so the storage tries are built one after another.
+The storage root of one account doesn't depend on any other, though. Here
+`state_root()` first hands each large storage trie to `STORAGE_ROOTS`, which
+computes them on a pool of worker processes while the small ones are
+computed in this process, and then builds the account trie with the results.
+
+Each storage trie is sent to its worker as two buffers: the 32 byte keys one
+after another, and the 32 byte big-endian values in the same order. The
+workers hash the keys and build the trie with a `StackTrie`. A storage root
+depends only on the trie's contents, so the state root is the same however
+the work is split.
+
+Workers send back the whole `TrieCache` of the trie, which is installed in
+tries kept by `ethereum_optimized.trie_cache`. Their later roots are then
+updated in this process, and only tries that have no cache yet, such as those
+of a freshly loaded state, are ever sent to a worker.
+"""
+import multiprocessing
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from importlib import import_module
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple, cast
+
+from ethereum_rlp import rlp
+from ethereum_types.numeric import U256
+
+from ethereum.crypto.hash import Hash32, keccak256
+
+from .stack_trie import StackTrie, nibble_path
+from .trie_cache import TrieCache
+from .utils import add_item
+
+Root = Hash32
+
+# The size of each storage key and value in the buffers sent to workers.
+WORD_SIZE = 32
+
+
+def pack_storage(trie: Any) -> Optional[Tuple[bytes, bytes]]:
+    """
+    Get the keys and values of a storage trie as two buffers, or `None` if
+    they aren't all 32 byte keys and `U256` values.
+    """
+    keys = bytearray()
+    values = bytearray()
+    for key, value in trie._data.items():
+        if len(key) != WORD_SIZE or not isinstance(value, U256):
+            return None
+        keys += key
+        values += value.to_be_bytes32()
+    return bytes(keys), bytes(values)
+
+
+def storage_trie_cache(keys: bytes, values: bytes) -> TrieCache:
+    """
+    Build the storage trie held by the buffers made by `pack_storage()`,
+    returning its root along with everything `ethereum_optimized.trie_cache`
+    keeps to update it.
+    """
+    cache = TrieCache()
+    for start in range(0, len(keys), WORD_SIZE):
+        end = start + WORD_SIZE
+        path = nibble_path(keccak256(keys[start:end]))
+        cache.paths[keys[start:end]] = path
+        cache.values[path] = rlp.encode(U256.from_be_bytes(values[start:end]))
+
+    cache.keys = sorted(cache.values)
+    stack_trie = StackTrie(cache.nodes)
+    for path in cache.keys:
+        stack_trie.update_path(path, cache.values[path])
+    cache.root = stack_trie.root()
+    return cache
+
+
+class StorageRootPool:
+    """
+    Computes storage roots with at least `min_slots` slots on a pool of
+    `workers` processes, and smaller ones in this process.
+    """
+
+    workers: Optional[int]
+    min_slots: int
+    _pool: Optional[Executor]
+
+    def __init__(
+        self, workers: Optional[int] = None, min_slots: int = 256
+    ) -> None:
+        self.workers = workers
+        self.min_slots = min_slots
+        self._pool = None
+
+    def roots(
+        self,
+        tries: Mapping[Any, Any],
+        root: Callable[[Any], Root],
+    ) -> Dict[Any, Root]:
+        """
+        Get the root of each of `tries`, computing with `root` those that are
+        too small to be worth sending to a worker, and those that already
+        have a `TrieCache`.
+        """
+        packed: Dict[Any, Tuple[bytes, bytes]] = {}
+        for address, trie in tries.items():
+            if (
+                len(trie._data) >= self.min_slots
+                and getattr(trie, "_cache", None) is None
+            ):
+                buffers = pack_storage(trie)
+                if buffers is not None:
+                    packed[address] = buffers
+
+        # A single trie is computed as quickly here as in a worker.
+        if len(packed) < 2:
+            packed = {}
+        elif self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+
+        futures: Dict[Any, "Future[TrieCache]"] = {}
+        for address, buffers in packed.items():
+            assert self._pool is not None
+            futures[address] = self._pool.submit(storage_trie_cache, *buffers)
+
+        roots = {}
+        for address, trie in tries.items():
+            if address not in futures:
+                roots[address] = root(trie)
+        for address, future in futures.items():
+            cache = future.result()
+            assert cache.root is not None
+            roots[address] = cache.root
+            trie = tries[address]
+            if hasattr(trie, "_cache"):
+                trie._cache = cache
+        return roots
+
+    def shutdown(self) -> None:
+        """
+        Stop the worker processes, if any were started.
+        """
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+STORAGE_ROOTS = StorageRootPool()
+"""
+The pool used by the patches from `get_parallel_root_patches()`.
+"""
+
+
+def get_parallel_root_patches(fork: str) -> Dict[str, Any]:
+    """
+    Get a dictionary of functions to be monkey patched into the fork's
+    `state` module, and every module importing them, to compute storage roots
+    with `STORAGE_ROOTS`. States that don't keep their storage in tries get
+    no patches.
+    """
+    patches: Dict[str, Any] = {}
+
+    state_mod = cast(Any, import_module("ethereum." + fork + ".state"))
+    state_fields = getattr(state_mod.State, "__dataclass_fields__", {})
+    if "_storage_tries" not in state_fields:
+        return patches
+    EMPTY_TRIE_ROOT = state_mod.EMPTY_TRIE_ROOT
+
+    @add_item(patches)
+    def state_root(state: Any) -> Root:
+        """
+        See `state`.
+        """
+        assert not state._snapshots
+
+        accounts = state._main_trie._data
+        tries = {
+            address: trie
+            for address, trie in state._storage_tries.items()
+            if address in accounts
+        }
+        # Look `root()` up at call time, so later patches to it are used.
+        storage_roots = STORAGE_ROOTS.roots(tries, state_mod.root)
+
+        def get_storage_root(address: Any) -> Root:
+            return storage_roots.get(address, EMPTY_TRIE_ROOT)
+
+        return state_mod.root(
+            state._main_trie, get_storage_root=get_storage_root
+        )
+
+    return patches
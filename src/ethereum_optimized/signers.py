@@ -0,0 +1,381 @@
+"""
+Optimized Signer Recovery
+^^^^^^^^^^^^^^^^^^^^^^^^^
+
+.. contents:: Table of Contents
+    :backlinks: none
+    :local:
+
+Introduction
+------------
+
+This module contains functions that can be monkey patched into a fork so that
+the senders of a block's transactions, and the authorities of its [EIP-7702]
+authorizations, are recovered in parallel before the block is executed.
+
+In the specification `check_transaction()` recovers each sender when its
+transaction is reached, and `set_delegation()` does the same for each
+authority, so the signing hashes and elliptic curve recoveries of a block all
+run one after another. Here `apply_body()` first hands every transaction in
+the block to `SIGNER_RECOVERY`, which recovers its sender and authorities on
+a pool of worker processes, and `recover_sender()` and `recover_authority()`
+then wait for the result started for their arguments. A recovery that failed
+raises its error only when execution reaches it, so an invalid signature
+fails the block at the same transaction, with the same error, as in the
+specification. Recoveries that were not started ahead are run as usual.
+
+Processes are used rather than threads because most of a recovery holds the
+GIL: the signing hash is encoded in Python, and `secp256k1_recover()` checks
+that `r` is on the curve with a Python `pow()` before calling into
+`coincurve`. The specification's frozen dataclasses can be pickled but not
+unpickled, so workers are sent typed transactions as they are encoded in the
+block, and legacy transactions as their field values.
+
+[EIP-7702]: https://eips.ethereum.org/EIPS/eip-7702
+"""
+import multiprocessing
+import os
+from concurrent.futures import (
+    BrokenExecutor,
+    CancelledError,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+)
+from dataclasses import fields, is_dataclass
+from importlib import import_module
+from importlib.util import find_spec
+from inspect import signature
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+    cast,
+)
+
+from ethereum_types.bytes import Bytes
+
+from .utils import add_item
+
+# A recovery function of the specification followed by its frozen arguments.
+Recovery = Tuple[Any, ...]
+
+
+def freeze(value: Any) -> Any:
+    """
+    Get a hashable value equal for equal transactions or authorizations,
+    which themselves can't be hashed.
+    """
+    if is_dataclass(value):
+        return (type(value),) + tuple(
+            freeze(getattr(value, field.name)) for field in fields(value)
+        )
+    elif isinstance(value, tuple):
+        return tuple(freeze(item) for item in value)
+    else:
+        return value
+
+
+def recover_signers(
+    fork: str, chain_id: Any, txs: Sequence[Union[Bytes, Tuple[Any, ...]]]
+) -> List[Any]:
+    """
+    Recover the sender of each transaction of `fork` in `txs`, each followed
+    by the authorities of its authorizations, with the specification's
+    functions. A transaction is either a typed transaction as encoded in a
+    block body, or the field values of a legacy transaction. Each result is
+    the recovered address, or the error its recovery raised.
+
+    This runs in the worker processes of `SIGNER_RECOVERY`.
+    """
+    transactions = cast(
+        Any, import_module("ethereum." + fork + ".transactions")
+    )
+    # Forks before Berlin only have what later became legacy transactions.
+    legacy = getattr(transactions, "LegacyTransaction", None)
+    legacy = legacy or transactions.Transaction
+    recover_sender = transactions.recover_sender
+    has_chain_id = len(signature(recover_sender).parameters) == 2
+
+    recover_authority = None
+    delegation = "ethereum." + fork + ".vm.eoa_delegation"
+    if find_spec(delegation):
+        recover_authority = cast(
+            Any, import_module(delegation)
+        ).recover_authority
+
+    recoveries: List[Tuple[Any, Tuple[Any, ...]]] = []
+    for encoded_tx in txs:
+        if isinstance(encoded_tx, bytes):
+            tx = transactions.decode_transaction(encoded_tx)
+        else:
+            tx = legacy(*encoded_tx)
+        sender_args = (chain_id, tx) if has_chain_id else (tx,)
+        recoveries.append((recover_sender, sender_args))
+        if recover_authority is not None:
+            for authorization in getattr(tx, "authorizations", ()):
+                recoveries.append((recover_authority, (authorization,)))
+
+    results: List[Any] = []
+    for recover, args in recoveries:
+        try:
+            results.append(recover(*args))
+        except Exception as error:
+            results.append(error)
+    return results
+
+
+class SignerRecovery:
+    """
+    Recoveries of transaction senders and authorization authorities running
+    on a pool of `workers` processes, by function and arguments.
+    """
+
+    workers: Optional[int]
+    _pool: Optional[Executor]
+    _pending: Dict[Recovery, Tuple["Future[List[Any]]", int]]
+    _blocks: Dict[str, Callable[[Any, Sequence[Any]], List[Recovery]]]
+
+    def __init__(self, workers: Optional[int] = None) -> None:
+        self.workers = workers
+        self._pool = None
+        self._pending = {}
+        self._blocks = {}
+
+    def processes(self) -> int:
+        """
+        Number of worker processes the recoveries are spread over.
+        """
+        return self.workers or os.cpu_count() or 1
+
+    def submit(
+        self,
+        recoveries: Sequence[Recovery],
+        function: Callable[..., List[Any]],
+        *args: Any,
+    ) -> None:
+        """
+        Start running `function(*args)` in a worker process, returning the
+        results of `recoveries` in order, unless they have already been
+        started.
+        """
+        if recoveries[0] in self._pending:
+            return
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        try:
+            future = self._pool.submit(function, *args)
+        except BrokenExecutor:
+            # The recoveries run when they are needed, and a new pool is
+            # started for the next ones.
+            self._pool = None
+            return
+        for index, recovery in enumerate(recoveries):
+            self._pending[recovery] = (future, index)
+
+    def result(self, recover: Callable[..., Any], *args: Any) -> Any:
+        """
+        Get the result of `recover(*args)`, from the recovery started for it
+        if there is one, raising the same error it would.
+        """
+        pending = self._pending.pop((recover,) + freeze(args), None)
+        if pending is None:
+            return recover(*args)
+
+        future, index = pending
+        try:
+            result = future.result()[index]
+        except (BrokenExecutor, CancelledError):
+            # The recovery never ran, so it is run here instead.
+            return recover(*args)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def discard(self, recoveries: Sequence[Recovery]) -> None:
+        """
+        Forget the results of `recoveries` that were never used.
+        """
+        for recovery in recoveries:
+            pending = self._pending.pop(recovery, None)
+            if pending is not None:
+                pending[0].cancel()
+
+    def add_fork(
+        self,
+        fork: str,
+        recover_block: Callable[[Any, Sequence[Any]], List[Recovery]],
+    ) -> None:
+        """
+        Set the function starting the recoveries for a block of `fork`.
+        """
+        self._blocks[fork] = recover_block
+
+    def recover_block(
+        self, fork: str, chain_id: Any, transactions: Sequence[Any]
+    ) -> List[Recovery]:
+        """
+        Start recovering the signers of `transactions`, the body of a block of
+        `fork` on the chain `chain_id`. Nothing is started for forks without
+        the patches from `get_signer_patches()`.
+        """
+        recover_block = self._blocks.get(fork)
+        if recover_block is None:
+            return []
+        return recover_block(chain_id, transactions)
+
+    def clear(self) -> None:
+        """
+        Forget every started recovery.
+        """
+        self.discard(list(self._pending))
+
+    def shutdown(self) -> None:
+        """
+        Forget every started recovery, and stop the worker processes, if any
+        were started.
+        """
+        self.clear()
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+SIGNER_RECOVERY = SignerRecovery()
+"""
+The recoveries used by the patches from `get_signer_patches()`.
+"""
+
+
+def get_signer_patches(fork: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Get dictionaries of functions to be monkey patched into the fork's `fork`
+    module, and `vm.eoa_delegation` module if it has one, to recover the
+    signers of a block ahead of its execution with `SIGNER_RECOVERY`.
+    """
+    fork_patches: Dict[str, Any] = {}
+    eoa_delegation_patches: Dict[str, Any] = {}
+
+    fork_mod = cast(Any, import_module("ethereum." + fork + ".fork"))
+    transactions_mod = cast(
+        Any, import_module("ethereum." + fork + ".transactions")
+    )
+    spec_apply_body = fork_mod.apply_body
+    spec_recover_sender = transactions_mod.recover_sender
+    # Forks before Berlin have no typed transactions to decode.
+    decode_transaction = getattr(
+        transactions_mod, "decode_transaction", lambda tx: tx
+    )
+    # Forks before Spurious Dragon have no chain id in their signatures.
+    has_chain_id = len(signature(spec_recover_sender).parameters) == 2
+
+    spec_recover_authority: Optional[Callable[[Any], Any]] = None
+    try:
+        eoa_delegation = cast(
+            Any, import_module("ethereum." + fork + ".vm.eoa_delegation")
+        )
+    except ModuleNotFoundError:
+        pass
+    else:
+        spec_recover_authority = eoa_delegation.recover_authority
+
+    def recover_block(
+        chain_id: Any, transactions: Sequence[Any]
+    ) -> List[Recovery]:
+        """
+        Start recovering the senders and authorities of `transactions`.
+        """
+        recoveries: List[List[Recovery]] = []
+        encoded_txs: List[Union[Bytes, Tuple[Any, ...]]] = []
+        for encoded_tx in transactions:
+            try:
+                tx = decode_transaction(encoded_tx)
+            except Exception:
+                # The specification rejects the block when it gets here.
+                continue
+
+            sender_args = (chain_id, tx) if has_chain_id else (tx,)
+            tx_recoveries = [(spec_recover_sender,) + freeze(sender_args)]
+            if spec_recover_authority is not None:
+                for authorization in getattr(tx, "authorizations", ()):
+                    tx_recoveries.append(
+                        (spec_recover_authority, freeze(authorization))
+                    )
+            recoveries.append(tx_recoveries)
+
+            # Typed transactions are already encoded in the block body.
+            # Encoding a legacy transaction would cost about as much as
+            # recovering its sender, so its fields are sent instead.
+            if isinstance(encoded_tx, bytes):
+                encoded_txs.append(encoded_tx)
+            else:
+                encoded_txs.append(
+                    tuple(
+                        getattr(encoded_tx, field.name)
+                        for field in fields(encoded_tx)
+                    )
+                )
+
+        # One batch per worker, as each one costs a round trip.
+        size = -(-len(encoded_txs) // SIGNER_RECOVERY.processes())
+        started: List[Recovery] = []
+        for start in range(0, len(encoded_txs), size):
+            batch = [
+                recovery
+                for tx_recoveries in recoveries[start : start + size]
+                for recovery in tx_recoveries
+            ]
+            SIGNER_RECOVERY.submit(
+                batch,
+                recover_signers,
+                fork,
+                chain_id,
+                encoded_txs[start : start + size],
+            )
+            started.extend(batch)
+        return started
+
+    SIGNER_RECOVERY.add_fork(fork, recover_block)
+
+    @add_item(fork_patches)
+    def apply_body(
+        block_env: Any, transactions: Tuple[Any, ...], *args: Any
+    ) -> Any:
+        """
+        See `fork`.
+        """
+        chain_id = getattr(block_env, "chain_id", None)
+        recoveries = recover_block(chain_id, transactions)
+        try:
+            return spec_apply_body(block_env, transactions, *args)
+        finally:
+            SIGNER_RECOVERY.discard(recoveries)
+
+    @add_item(fork_patches)
+    def recover_sender(*args: Any) -> Any:
+        """
+        See `transactions`.
+        """
+        return SIGNER_RECOVERY.result(spec_recover_sender, *args)
+
+    if spec_recover_authority is None:
+        return {"fork": fork_patches}
+
+    @add_item(eoa_delegation_patches)
+    def recover_authority(authorization: Any) -> Any:
+        """
+        See `vm.eoa_delegation`.
+        """
+        return SIGNER_RECOVERY.result(spec_recover_authority, authorization)
+
+    return {
+        "fork": fork_patches,
+        "vm.eoa_delegation": eoa_delegation_patches,
+    }
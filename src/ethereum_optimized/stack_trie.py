@@ -0,0 +1,376 @@
+"""
+Optimized Ordered Trie Roots
+^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+.. contents:: Table of Contents
+    :backlinks: none
+    :local:
+
+Introduction
+------------
+
+This module contains functions that can be monkey patched into a fork so that
+the roots of a block's transactions, receipts and withdrawals tries are built
+as their items are added.
+
+In the specification these tries are ordinary `Trie`s, and `root()` converts
+every key to nibbles and patricializes them all from scratch once the block
+is done. Their keys, though, are the RLP encodings of consecutive indices,
+written in order. A `StackTrie` builds the root of a trie from keys given in
+increasing order: a node is encoded as soon as the next key shows that no
+later key can fall below it, so only the nodes along the path of the last
+key are kept. Here `BlockOutput` gives each of these tries an
+`IndexStackTrie`, which `trie_set()` feeds, and `root()` reads.
+
+Any other use of these tries, such as overwriting or deleting a key, drops
+the `IndexStackTrie` and leaves the root to be computed as usual.
+"""
+from dataclasses import dataclass, field
+from importlib import import_module
+from typing import Any, Dict, List, Optional, cast
+
+from ethereum_rlp import Extended, rlp
+from ethereum_types.bytes import Bytes
+from ethereum_types.numeric import Uint
+
+from ethereum.crypto.hash import Hash32, keccak256
+
+from .utils import add_item
+
+# The RLP encoding of the index zero, which sorts after those of one to 127.
+INDEX_ZERO = rlp.encode(Uint(0))
+
+
+# Tables converting hexadecimal digits to nibbles and back.
+_TO_NIBBLES = bytes.maketrans(b"0123456789abcdef", bytes(range(16)))
+_FROM_NIBBLES = bytes.maketrans(bytes(range(16)), b"0123456789abcdef")
+
+
+def nibble_path(key: Bytes) -> Bytes:
+    """
+    Split `key` into nibbles.
+    """
+    return Bytes(key.hex().encode().translate(_TO_NIBBLES))
+
+
+def _compact(nibbles: Bytes, is_leaf: bool) -> Bytes:
+    """
+    Compact encoding of a path in a leaf or extension node.
+    """
+    flag = 2 * is_leaf
+    if len(nibbles) % 2 == 0:
+        first = bytes([16 * flag])
+        rest = nibbles
+    else:
+        first = bytes([16 * (flag + 1) + nibbles[0]])
+        rest = nibbles[1:]
+    return Bytes(first + bytes.fromhex(rest.translate(_FROM_NIBBLES).decode()))
+
+
+def _reference(unencoded: Extended) -> Extended:
+    """
+    Refer to a node from its parent: inline if its encoding is short,
+    otherwise by hash.
+    """
+    encoded = rlp.encode(unencoded)
+    if len(encoded) < 32:
+        return unencoded
+    return keccak256(encoded)
+
+
+class _Branch:
+    """
+    A branch node of a `StackTrie` that later keys may still add children
+    to, `depth` nibbles below the root, with the value of the key ending
+    there if there is one.
+    """
+
+    __slots__ = ("depth", "children", "value")
+
+    depth: int
+    children: List[Extended]
+    value: Bytes
+
+    def __init__(
+        self,
+        depth: int,
+        children: Optional[List[Extended]] = None,
+        value: Bytes = b"",
+    ) -> None:
+        self.depth = depth
+        self.children = [b""] * 16 if children is None else children
+        self.value = value
+
+
+class StackTrie:
+    """
+    The root of a trie built from keys given in increasing order, with
+    encoded values.
+
+    If `nodes` is given, every node encoded is also recorded in it under its
+    nibble prefix, as `encode_internal_node()` would encode it. Nodes are
+    only final once every key is added, so this is for tries whose root is
+    only read after that.
+    """
+
+    _key: Optional[Bytes]
+    _value: Bytes
+    _branches: List[_Branch]
+    _nodes: Optional[Dict[Bytes, Extended]]
+
+    def __init__(self, nodes: Optional[Dict[Bytes, Extended]] = None) -> None:
+        self._key = None
+        self._value = b""
+        self._branches = []
+        self._nodes = nodes
+
+    def update(self, key: Bytes, value: Bytes) -> None:
+        """
+        Add `key`, which must follow every key added so far, with the encoded
+        `value`.
+        """
+        self.update_path(nibble_path(key), value)
+
+    def update_path(self, path: Bytes, value: Bytes) -> None:
+        """
+        Add a key given as the nibbles `path`, which must follow every key
+        added so far, with the encoded `value`.
+        """
+        previous = self._key
+        if previous is not None:
+            if path <= previous:
+                raise ValueError("keys must be given in increasing order")
+            if path[: len(previous)] == previous:
+                # The last key ends in a branch on the path of this one.
+                self._branches.append(
+                    _Branch(len(previous), value=self._value)
+                )
+            else:
+                depth = 0
+                while path[depth] == previous[depth]:
+                    depth += 1
+                self._close(depth)
+        self._key = path
+        self._value = value
+
+    def _close(self, depth: int) -> None:
+        """
+        Move the last key into the branch `depth` nibbles below the root,
+        encoding every branch below that as no later key can reach them.
+        """
+        assert self._key is not None
+        branches = self._branches
+        closed: Optional[_Branch] = None
+        while branches and branches[-1].depth > depth:
+            branch = branches.pop()
+            self._attach(branch, closed)
+            closed = branch
+        if not branches or branches[-1].depth < depth:
+            branches.append(_Branch(depth))
+        self._attach(branches[-1], closed)
+
+    def _attach(self, parent: _Branch, closed: Optional[_Branch]) -> None:
+        """
+        Set the child of `parent` on the path of the last key, which is the
+        last key's leaf if `closed` is `None`, or else `closed`.
+        """
+        assert self._key is not None
+        depth = parent.depth + 1
+        parent.children[self._key[parent.depth]] = self._reference(
+            depth, self._node(depth, closed)
+        )
+
+    def _reference(self, depth: int, unencoded: Extended) -> Extended:
+        """
+        Refer to the node `depth` nibbles below the root on the path of the
+        last key, recording it if nodes are recorded.
+        """
+        reference = _reference(unencoded)
+        if self._nodes is not None:
+            assert self._key is not None
+            self._nodes[self._key[:depth]] = reference
+        return reference
+
+    def _node(self, depth: int, closed: Optional[_Branch]) -> Extended:
+        """
+        Get the node `depth` nibbles below the root on the path of the last
+        key, which leads to its leaf if `closed` is `None`, or else to
+        `closed`.
+        """
+        assert self._key is not None
+        if closed is None:
+            return (_compact(self._key[depth:], True), self._value)
+        branch: Extended = closed.children + [closed.value]
+        if closed.depth == depth:
+            return branch
+        return (
+            _compact(self._key[depth : closed.depth], False),
+            self._reference(closed.depth, branch),
+        )
+
+    def copy(self) -> "StackTrie":
+        """
+        Get a `StackTrie` with the same keys, to which keys can be added
+        separately.
+        """
+        copy = StackTrie()
+        copy._key = self._key
+        copy._value = self._value
+        copy._branches = [
+            _Branch(branch.depth, list(branch.children), branch.value)
+            for branch in self._branches
+        ]
+        return copy
+
+    def root(self) -> Hash32:
+        """
+        Get the root of the trie of the keys added so far.
+        """
+        if self._key is None:
+            return keccak256(rlp.encode(b""))
+
+        # Encode the open branches without closing them, so that more keys
+        # can still be added.
+        closed: Optional[_Branch] = None
+        for branch in reversed(self._branches):
+            copy = _Branch(branch.depth, list(branch.children), branch.value)
+            self._attach(copy, closed)
+            closed = copy
+        root_node = self._node(0, closed)
+        if self._nodes is not None:
+            self._nodes[b""] = _reference(root_node)
+        return keccak256(rlp.encode(root_node))
+
+
+class IndexStackTrie(StackTrie):
+    """
+    A `StackTrie` whose keys are RLP encoded indices given in increasing
+    order, with gaps allowed.
+
+    The encoding of zero sorts after those of one to 127, so it is held back
+    until a key that sorts after it is added. It can only be given first.
+    """
+
+    _held: Optional[Bytes]
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._held = None
+
+    def update(self, key: Bytes, value: Bytes) -> None:
+        """
+        See `StackTrie`.
+        """
+        if key == INDEX_ZERO:
+            if self._key is not None:
+                # Either zero was already held and is being overwritten, or
+                # it comes after other keys.
+                raise ValueError("index zero must be given first")
+            self._held = value
+            return
+        if self._held is not None and key > INDEX_ZERO:
+            held = self._held
+            self._held = None
+            super().update(INDEX_ZERO, held)
+        super().update(key, value)
+
+    def root(self) -> Hash32:
+        """
+        See `StackTrie`.
+        """
+        if self._held is None:
+            return super().root()
+        # Keys up to 127 may still follow, so the held key is only added to
+        # a copy.
+        copy = self.copy()
+        copy.update(INDEX_ZERO, self._held)
+        return copy.root()
+
+
+def get_stack_trie_patches(fork: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Get dictionaries of functions and classes to be monkey patched into the
+    fork's `trie` module, and every module importing them, and `vm` module
+    to build the roots of each block's ordered tries with `IndexStackTrie`s.
+    """
+    trie_patches: Dict[str, Any] = {}
+    vm_patches: Dict[str, Any] = {}
+
+    trie_mod = cast(Any, import_module("ethereum." + fork + ".trie"))
+    vm = cast(Any, import_module("ethereum." + fork + ".vm"))
+    # Wrap the functions and classes currently in use, so earlier patches are
+    # kept.
+    SpecTrie: Any = trie_mod.Trie
+    SpecBlockOutput: Any = vm.BlockOutput
+    spec_trie_set = trie_mod.trie_set
+    spec_root = trie_mod.root
+    encode_node = trie_mod.encode_node
+    spec_post_init = getattr(SpecBlockOutput, "__post_init__", None)
+
+    @dataclass
+    class OrderedTrie(SpecTrie):
+        """
+        A trie written in key order, with the root of what has been written
+        so far.
+        """
+
+        _stack_trie: Optional[IndexStackTrie] = field(
+            default=None, compare=False, repr=False
+        )
+
+    @add_item(trie_patches)
+    def trie_set(trie: Any, key: Bytes, value: Any) -> None:
+        """
+        See `trie`.
+        """
+        spec_trie_set(trie, key, value)
+        stack_trie = getattr(trie, "_stack_trie", None)
+        if stack_trie is None:
+            return
+        try:
+            if value == trie.default:
+                raise ValueError("deleted key")
+            stack_trie.update(key, encode_node(value))
+        except ValueError:
+            trie._stack_trie = None
+
+    @add_item(trie_patches)
+    def root(trie: Any, get_storage_root: Optional[Any] = None) -> Hash32:
+        """
+        See `trie`.
+        """
+        stack_trie = getattr(trie, "_stack_trie", None)
+        if stack_trie is None:
+            return spec_root(trie, get_storage_root)
+        return stack_trie.root()
+
+    @add_item(vm_patches)
+    @dataclass
+    class BlockOutput(SpecBlockOutput):
+        """
+        Output from applying the block body to the present state, with its
+        ordered tries' roots built as they are written.
+        """
+
+        def __post_init__(self) -> None:
+            if spec_post_init is not None:
+                spec_post_init(self)
+            for name in (
+                "transactions_trie",
+                "receipts_trie",
+                "withdrawals_trie",
+            ):
+                trie = getattr(self, name, None)
+                if trie is None or trie._data:
+                    continue
+                setattr(
+                    self,
+                    name,
+                    OrderedTrie(
+                        secured=trie.secured,
+                        default=trie.default,
+                        _stack_trie=IndexStackTrie(),
+                    ),
+                )
+
+    return {"trie": trie_patches, "vm": vm_patches}
@@ -0,0 +1,337 @@
+"""
+Optimized Journaled State
+^^^^^^^^^^^^^^^^^^^^^^^^^
+
+.. contents:: Table of Contents
+    :backlinks: none
+    :local:
+
+Introduction
+------------
+
+This module contains functions that can be monkey patched into the fork's
+`state` module to replace the snapshot based transactions of the in-memory
+state with an undo journal.
+
+`begin_transaction()` in the specification copies the main trie and every
+storage trie, so the cost of entering a message call grows with the size of
+the state. Here entering a transaction only records the current length of a
+journal. Every write made inside a transaction appends the value it replaced
+to the journal, so `rollback_transaction()` only has to undo the keys that
+were actually written.
+"""
+from dataclasses import dataclass, field
+from importlib import import_module
+from typing import Any, Dict, List, Optional, Tuple, cast
+
+from ethereum_types.bytes import Bytes20, Bytes32
+from ethereum_types.numeric import U256
+
+from .utils import add_item
+
+Address = Bytes20
+Account_ = Any
+Trie_ = Any
+
+# Journal entry tags.
+ACCOUNT_WRITE = 0
+STORAGE_WRITE = 1
+STORAGE_DESTROY = 2
+
+
+def get_journaled_state_patches(fork: str) -> Dict[str, Any]:
+    """
+    Get a dictionary of functions/objects to be monkey patched into the state
+    to replace trie snapshots with an undo journal.
+    """
+    patches: Dict[str, Any] = {}
+
+    state_mod = cast(Any, import_module("ethereum." + fork + ".state"))
+    # The trie functions are looked up on every call so that patches applied
+    # to the trie module afterwards are picked up.
+    trie_mod = cast(Any, import_module("ethereum." + fork + ".trie"))
+    SpecState: Any = state_mod.State
+
+    has_transient_storage = hasattr(state_mod, "TransientStorage")
+    has_created_accounts = hasattr(state_mod, "mark_account_created")
+
+    @add_item(patches)
+    @dataclass
+    class State(SpecState):
+        """
+        The in-memory state, with an undo journal instead of trie snapshots.
+
+        `_snapshots` holds the length of `_journal` at the start of each
+        (nested) transaction. `_storage_originals` and `_destroyed_tries`
+        remember the storage as it was when the outermost transaction began,
+        for `get_storage_original()`.
+        """
+
+        _journal: List[Tuple[Any, ...]] = field(default_factory=list)
+        _storage_originals: Dict[Address, Dict[Bytes32, U256]] = field(
+            default_factory=dict
+        )
+        _destroyed_tries: Dict[Address, Optional[Trie_]] = field(
+            default_factory=dict
+        )
+
+    @add_item(patches)
+    def close_state(state: State) -> None:
+        """
+        See `state`.
+        """
+        del state._main_trie
+        del state._storage_tries
+        del state._snapshots
+        del state._journal
+        del state._storage_originals
+        del state._destroyed_tries
+        if has_created_accounts:
+            del state.created_accounts
+
+    def _begin_transaction(state: State) -> None:
+        """
+        Record a restore point in the journal.
+        """
+        state._snapshots.append(len(state._journal))
+
+    def _end_transaction(state: State) -> None:
+        """
+        Forget everything tied to the outermost transaction once it is over.
+        """
+        if not state._snapshots:
+            state._journal.clear()
+            state._storage_originals.clear()
+            state._destroyed_tries.clear()
+            if has_created_accounts:
+                state.created_accounts.clear()
+
+    def _commit_transaction(state: State) -> None:
+        """
+        Drop the latest restore point, keeping the journal entries so that an
+        enclosing transaction can still undo them.
+        """
+        state._snapshots.pop()
+        _end_transaction(state)
+
+    def _rollback_transaction(state: State) -> None:
+        """
+        Undo every journal entry recorded since the latest restore point.
+        """
+        restore_point = state._snapshots.pop()
+        journal = state._journal
+        while len(journal) > restore_point:
+            entry = journal.pop()
+            if entry[0] == ACCOUNT_WRITE:
+                trie_mod.trie_set(state._main_trie, entry[1], entry[2])
+            elif entry[0] == STORAGE_WRITE:
+                _write_storage(
+                    state._storage_tries, entry[1], entry[2], entry[3]
+                )
+            else:
+                if entry[2] is None:
+                    state._storage_tries.pop(entry[1], None)
+                else:
+                    state._storage_tries[entry[1]] = entry[2]
+        _end_transaction(state)
+
+    def _write_storage(
+        tries: Dict[Address, Trie_],
+        address: Address,
+        key: Bytes32,
+        value: U256,
+    ) -> None:
+        """
+        Write a storage value, creating and deleting the account's storage
+        trie in the same way as `set_storage()`.
+        """
+        trie = tries.get(address)
+        if trie is None:
+            trie = trie_mod.Trie(secured=True, default=U256(0))
+            tries[address] = trie
+        trie_mod.trie_set(trie, key, value)
+        if trie._data == {}:
+            del tries[address]
+
+    if has_transient_storage:
+        SpecTransientStorage: Any = state_mod.TransientStorage
+
+        @add_item(patches)
+        @dataclass
+        class TransientStorage(SpecTransientStorage):
+            """
+            Transient storage, with an undo journal instead of trie
+            snapshots. `_snapshots` holds the length of `_journal` at the
+            start of each (nested) transaction.
+            """
+
+            _journal: List[Tuple[Address, Bytes32, U256]] = field(
+                default_factory=list
+            )
+
+        @add_item(patches)
+        def begin_transaction(
+            state: State, transient_storage: TransientStorage
+        ) -> None:
+            """
+            See `state`.
+            """
+            _begin_transaction(state)
+            transient_storage._snapshots.append(
+                len(transient_storage._journal)
+            )
+
+        @add_item(patches)
+        def commit_transaction(
+            state: State, transient_storage: TransientStorage
+        ) -> None:
+            """
+            See `state`.
+            """
+            _commit_transaction(state)
+            transient_storage._snapshots.pop()
+            if not transient_storage._snapshots:
+                transient_storage._journal.clear()
+
+        @add_item(patches)
+        def rollback_transaction(
+            state: State, transient_storage: TransientStorage
+        ) -> None:
+            """
+            See `state`.
+            """
+            _rollback_transaction(state)
+            restore_point = transient_storage._snapshots.pop()
+            journal = transient_storage._journal
+            while len(journal) > restore_point:
+                address, key, value = journal.pop()
+                _write_storage(transient_storage._tries, address, key, value)
+
+        @add_item(patches)
+        def set_transient_storage(
+            transient_storage: TransientStorage,
+            address: Address,
+            key: Bytes32,
+            value: U256,
+        ) -> None:
+            """
+            See `state`.
+            """
+            if transient_storage._snapshots:
+                transient_storage._journal.append(
+                    (
+                        address,
+                        key,
+                        state_mod.get_transient_storage(
+                            transient_storage, address, key
+                        ),
+                    )
+                )
+            _write_storage(transient_storage._tries, address, key, value)
+
+    else:
+
+        @add_item(patches)
+        def begin_transaction(state: State) -> None:
+            """
+            See `state`.
+            """
+            _begin_transaction(state)
+
+        @add_item(patches)
+        def commit_transaction(state: State) -> None:
+            """
+            See `state`.
+            """
+            _commit_transaction(state)
+
+        @add_item(patches)
+        def rollback_transaction(state: State) -> None:
+            """
+            See `state`.
+            """
+            _rollback_transaction(state)
+
+    @add_item(patches)
+    def set_account(
+        state: State, address: Address, account: Optional[Account_]
+    ) -> None:
+        """
+        See `state`.
+        """
+        if state._snapshots:
+            state._journal.append(
+                (
+                    ACCOUNT_WRITE,
+                    address,
+                    trie_mod.trie_get(state._main_trie, address),
+                )
+            )
+        trie_mod.trie_set(state._main_trie, address, account)
+
+    @add_item(patches)
+    def set_storage(
+        state: State, address: Address, key: Bytes32, value: U256
+    ) -> None:
+        """
+        See `state`.
+        """
+        assert trie_mod.trie_get(state._main_trie, address) is not None
+
+        if state._snapshots:
+            old_value = state_mod.get_storage(state, address, key)
+            originals = state._storage_originals.setdefault(address, {})
+            if key not in originals:
+                if address in state._destroyed_tries:
+                    destroyed = state._destroyed_tries[address]
+                    originals[key] = (
+                        U256(0)
+                        if destroyed is None
+                        else trie_mod.trie_get(destroyed, key)
+                    )
+                else:
+                    originals[key] = old_value
+            state._journal.append((STORAGE_WRITE, address, key, old_value))
+
+        _write_storage(state._storage_tries, address, key, value)
+
+    @add_item(patches)
+    def destroy_storage(state: State, address: Address) -> None:
+        """
+        See `state`.
+        """
+        trie = state._storage_tries.pop(address, None)
+        if state._snapshots:
+            if address not in state._destroyed_tries:
+                state._destroyed_tries[address] = trie
+            state._journal.append((STORAGE_DESTROY, address, trie))
+
+    if hasattr(state_mod, "get_storage_original"):
+
+        @add_item(patches)
+        def get_storage_original(
+            state: State, address: Address, key: Bytes32
+        ) -> U256:
+            """
+            See `state`.
+            """
+            if has_created_accounts and address in state.created_accounts:
+                return U256(0)
+
+            assert state._snapshots
+
+            originals = state._storage_originals.get(address)
+            if originals is not None and key in originals:
+                return originals[key]
+
+            if address in state._destroyed_tries:
+                destroyed = state._destroyed_tries[address]
+                if destroyed is None:
+                    return U256(0)
+                value = trie_mod.trie_get(destroyed, key)
+                assert isinstance(value, U256)
+                return value
+
+            return state_mod.get_storage(state, address, key)
+
+    return patches
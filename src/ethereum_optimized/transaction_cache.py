@@ -0,0 +1,201 @@
+"""
+Optimized Transaction Encodings
+^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+.. contents:: Table of Contents
+    :backlinks: none
+    :local:
+
+Introduction
+------------
+
+This module contains functions that can be monkey patched into a fork so that
+each transaction is encoded and hashed only once.
+
+In the specification `process_transaction()` encodes every transaction once
+for the transactions trie and again for its hash, the sender's signature is
+checked against a signing hash built from yet another encoding, and the `t8n`
+tool hashes the encodings in the trie once more for its receipts. Here the
+encoding, hash and signing hashes of a transaction are kept in a
+`TransactionCache` alongside the transaction, and looked up there instead of
+being recomputed.
+
+Transactions can't be hashed and don't have room for more attributes, so the
+cache holds on to the transactions themselves and finds them by identity. A
+transaction's encoding is found by identity in the same way, which works
+because the encoding returned by `encode_transaction()` is the object that is
+put in the trie and hashed.
+"""
+from collections import OrderedDict
+from importlib import import_module
+from typing import Any, Callable, Dict, Optional, Tuple, cast
+
+from ethereum.crypto.hash import Hash32
+
+from .utils import add_item
+
+
+class TransactionEntry:
+    """
+    The encoding, hash and signing hashes of a transaction, each computed the
+    first time it is needed.
+    """
+
+    __slots__ = ("tx", "encoding", "hash", "signing_hashes")
+
+    tx: Any
+    encoding: Optional[Any]
+    hash: Optional[Hash32]
+    signing_hashes: Dict[Tuple[Any, ...], Hash32]
+
+    def __init__(self, tx: Any) -> None:
+        self.tx = tx
+        self.encoding = None
+        self.hash = None
+        self.signing_hashes = {}
+
+
+class TransactionCache:
+    """
+    The entries of the `max_entries` most recently used transactions, by the
+    identity of the transaction and of its encoding.
+    """
+
+    max_entries: int
+    _entries: "OrderedDict[int, TransactionEntry]"
+    _encodings: Dict[int, TransactionEntry]
+
+    def __init__(self, max_entries: int = 16384) -> None:
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._encodings = {}
+
+    def get(self, tx: Any) -> TransactionEntry:
+        """
+        Get the entry of `tx`, adding one if there is none.
+        """
+        entry = self._entries.get(id(tx))
+        if entry is not None and entry.tx is tx:
+            self._entries.move_to_end(id(tx))
+            return entry
+
+        entry = TransactionEntry(tx)
+        self._entries[id(tx)] = entry
+        while len(self._entries) > self.max_entries:
+            _, evicted = self._entries.popitem(last=False)
+            if evicted.encoding is not None:
+                self._encodings.pop(id(evicted.encoding), None)
+        return entry
+
+    def set_encoding(self, entry: TransactionEntry, encoding: Any) -> None:
+        """
+        Record `encoding` as the encoding of the transaction of `entry`.
+        """
+        entry.encoding = encoding
+        # An entry evicted in the meantime can't be found by encoding.
+        if self._entries.get(id(entry.tx)) is entry:
+            self._encodings[id(encoding)] = entry
+
+    def find_encoding(self, encoding: Any) -> Optional[TransactionEntry]:
+        """
+        Get the entry of the transaction whose encoding is `encoding`, if any.
+        """
+        entry = self._encodings.get(id(encoding))
+        if entry is None or entry.encoding is not encoding:
+            return None
+        return entry
+
+    def clear(self) -> None:
+        """
+        Drop every entry.
+        """
+        self._entries.clear()
+        self._encodings.clear()
+
+    def __len__(self) -> int:
+        """
+        Number of transactions with an entry.
+        """
+        return len(self._entries)
+
+
+TRANSACTION_CACHE = TransactionCache()
+"""
+The cache used by the patches from `get_transaction_cache_patches()`.
+"""
+
+
+def get_transaction_cache_patches(fork: str) -> Dict[str, Any]:
+    """
+    Get a dictionary of functions to be monkey patched into the fork's
+    `transactions` module, and every module importing them, to encode and
+    hash each transaction once.
+    """
+    patches: Dict[str, Any] = {}
+
+    transactions = cast(
+        Any, import_module("ethereum." + fork + ".transactions")
+    )
+    spec_get_transaction_hash = transactions.get_transaction_hash
+
+    # Forks before Berlin have no typed transactions, and hash transactions
+    # themselves instead of their encodings.
+    if hasattr(transactions, "encode_transaction"):
+        spec_encode_transaction = transactions.encode_transaction
+
+        @add_item(patches)
+        def encode_transaction(tx: Any) -> Any:
+            """
+            See `transactions`.
+            """
+            entry = TRANSACTION_CACHE.get(tx)
+            if entry.encoding is None:
+                TRANSACTION_CACHE.set_encoding(
+                    entry, spec_encode_transaction(tx)
+                )
+            return entry.encoding
+
+    @add_item(patches)
+    def get_transaction_hash(tx: Any) -> Hash32:
+        """
+        See `transactions`.
+        """
+        if isinstance(tx, bytes):
+            found = TRANSACTION_CACHE.find_encoding(tx)
+            if found is None:
+                return spec_get_transaction_hash(tx)
+            entry = found
+        else:
+            entry = TRANSACTION_CACHE.get(tx)
+
+        if entry.hash is None:
+            entry.hash = spec_get_transaction_hash(tx)
+        return entry.hash
+
+    def _signing_hash(
+        spec_signing_hash: Callable[..., Hash32]
+    ) -> Callable[..., Hash32]:
+        """
+        Create a replacement for `spec_signing_hash`, a signing hash function
+        of the fork, whose results are kept in the transaction's entry.
+        """
+
+        def signing_hash(tx: Any, *args: Any) -> Hash32:
+            entry = TRANSACTION_CACHE.get(tx)
+            key = (spec_signing_hash,) + args
+            signing_hash = entry.signing_hashes.get(key)
+            if signing_hash is None:
+                signing_hash = spec_signing_hash(tx, *args)
+                entry.signing_hashes[key] = signing_hash
+            return signing_hash
+
+        signing_hash.__doc__ = "See `transactions`."
+        return signing_hash
+
+    for name in dir(transactions):
+        if name.startswith("signing_hash"):
+            patches[name] = _signing_hash(getattr(transactions, name))
+
+    return patches
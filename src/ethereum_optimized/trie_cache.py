@@ -0,0 +1,351 @@
+"""
+Optimized Incremental Trie Roots
+^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+.. contents:: Table of Contents
+    :backlinks: none
+    :local:
+
+Introduction
+------------
+
+This module contains functions that can be monkey patched into the fork's
+`trie` module so that `root()` only re-encodes the parts of a trie that
+changed since the previous call.
+
+The specification's `root()` prepares and patricializes every key of the trie
+each time it is called. Here each `Trie` carries a `TrieCache` holding the
+sorted nibble paths of its keys, their encoded values and the encoded node
+found at every prefix visited while building the trie. `trie_set()` records
+which keys were written. The next `root()` re-encodes only those keys and
+drops the cached nodes along their paths; every other subtree is reused.
+
+The node at a given prefix depends only on the keys below that prefix, so a
+cached node stays valid until one of those keys changes. When no node is
+cached, as for the first root of a trie, the keys are instead given in order
+to a `StackTrie`, which builds every node in one sweep by comparing each key
+with the one before it, and records them for the next call.
+"""
+import copy
+from bisect import bisect_left, insort
+from dataclasses import dataclass, field
+from importlib import import_module
+from typing import Any, Callable, Dict, List, Optional, Set, TypeVar, cast
+
+from ethereum_rlp import Extended, rlp
+from ethereum_types.bytes import Bytes
+
+from ethereum.crypto.hash import Hash32, keccak256
+
+from .hashed_keys import HASHED_KEYS
+from .stack_trie import StackTrie
+from .utils import add_item
+
+Root = Hash32
+K = TypeVar("K")
+V = TypeVar("V")
+
+# Above this many keys added to or removed from a trie between two roots, the
+# sorted key list is rebuilt instead of being updated one key at a time.
+BATCH_THRESHOLD = 64
+
+
+@dataclass
+class TrieCache:
+    """
+    Derived data kept alongside a trie between calls to `root()`.
+
+    `paths` maps preimages to nibble paths, `keys` holds the nibble paths in
+    sorted order, `values` maps nibble paths to encoded values and `nodes`
+    maps a nibble prefix to the encoded node rooted there. `storage_roots`
+    remembers the storage root each account was encoded with. `dirty` holds
+    preimages written since the last call to `root()`.
+    """
+
+    paths: Dict[Bytes, Bytes] = field(default_factory=dict)
+    keys: List[Bytes] = field(default_factory=list)
+    values: Dict[Bytes, Bytes] = field(default_factory=dict)
+    nodes: Dict[Bytes, Extended] = field(default_factory=dict)
+    storage_roots: Dict[Bytes, Root] = field(default_factory=dict)
+    dirty: Set[Bytes] = field(default_factory=set)
+    root: Optional[Root] = None
+
+
+def copy_trie_cache(cache: TrieCache) -> TrieCache:
+    """
+    Create a copy of `cache`. The cached nodes and values are immutable, so
+    only the containers are copied.
+    """
+    return TrieCache(
+        copy.copy(cache.paths),
+        copy.copy(cache.keys),
+        copy.copy(cache.values),
+        copy.copy(cache.nodes),
+        copy.copy(cache.storage_roots),
+        copy.copy(cache.dirty),
+        cache.root,
+    )
+
+
+def get_trie_cache_patches(fork: str) -> Dict[str, Any]:
+    """
+    Get a dictionary of functions/objects to be monkey patched into the trie
+    module to compute roots incrementally.
+    """
+    patches: Dict[str, Any] = {}
+
+    trie_mod = cast(Any, import_module("ethereum." + fork + ".trie"))
+    types_mod = cast(Any, import_module("ethereum." + fork + ".fork_types"))
+    Account = types_mod.Account
+    Address = types_mod.Address
+    LeafNode = trie_mod.LeafNode
+    ExtensionNode = trie_mod.ExtensionNode
+    BranchNode = trie_mod.BranchNode
+    encode_node = trie_mod.encode_node
+    encode_internal_node = trie_mod.encode_internal_node
+    bytes_to_nibble_list = trie_mod.bytes_to_nibble_list
+    common_prefix_length = trie_mod.common_prefix_length
+    SpecTrie: Any = trie_mod.Trie
+    spec_trie_set = trie_mod.trie_set
+
+    @add_item(patches)
+    @dataclass
+    class Trie(SpecTrie[K, V]):
+        """
+        The Merkle Trie, with a cache of the work done by the last `root()`.
+        """
+
+        _cache: Optional[TrieCache] = field(
+            default=None, compare=False, repr=False
+        )
+
+    @add_item(patches)
+    def copy_trie(trie: Trie) -> Trie:
+        """
+        See `trie`.
+        """
+        cache = getattr(trie, "_cache", None)
+        return Trie(
+            trie.secured,
+            trie.default,
+            copy.copy(trie._data),
+            None if cache is None else copy_trie_cache(cache),
+        )
+
+    @add_item(patches)
+    def trie_set(trie: Trie, key: Bytes, value: Any) -> None:
+        """
+        See `trie`.
+        """
+        spec_trie_set(trie, key, value)
+        cache = getattr(trie, "_cache", None)
+        if cache is not None:
+            cache.dirty.add(key)
+            cache.root = None
+
+    def _path(trie: Trie, cache: TrieCache, preimage: Bytes) -> Bytes:
+        """
+        Get the nibble path of `preimage`. The paths of secured keys are
+        shared with other tries through `HASHED_KEYS`.
+        """
+        path = cache.paths.get(preimage)
+        if path is None:
+            if trie.secured:
+                path = HASHED_KEYS.path(preimage)
+            else:
+                path = bytes_to_nibble_list(preimage)
+            cache.paths[preimage] = path
+        return path
+
+    def _invalidate(cache: TrieCache, path: Bytes) -> None:
+        """
+        Drop the cached nodes on every prefix of `path`.
+        """
+        nodes = cache.nodes
+        for i in range(len(path) + 1):
+            nodes.pop(path[:i], None)
+        cache.root = None
+
+    def _update(
+        trie: Trie,
+        cache: TrieCache,
+        preimage: Bytes,
+        encoded: Bytes,
+        added: List[Bytes],
+    ) -> None:
+        """
+        Store a freshly encoded value, invalidating its path if it changed.
+        Paths that are new to the trie are appended to `added`.
+        """
+        if encoded == b"":
+            raise AssertionError
+        path = _path(trie, cache, preimage)
+        previous = cache.values.get(path)
+        if previous == encoded:
+            return
+        if previous is None:
+            added.append(path)
+        cache.values[path] = encoded
+        _invalidate(cache, path)
+
+    def _remove(
+        cache: TrieCache, preimage: Bytes, removed: List[Bytes]
+    ) -> None:
+        """
+        Forget a key that is no longer in the trie. Its path is appended to
+        `removed`.
+        """
+        path = cache.paths.pop(preimage, None)
+        cache.storage_roots.pop(preimage, None)
+        if path is None or path not in cache.values:
+            return
+        del cache.values[path]
+        removed.append(path)
+        _invalidate(cache, path)
+
+    def _merge_keys(
+        cache: TrieCache, added: List[Bytes], removed: List[Bytes]
+    ) -> None:
+        """
+        Bring the sorted key list up to date. A handful of changes are applied
+        in place, larger batches are merged by re-sorting once.
+        """
+        keys = cache.keys
+        if len(removed) > BATCH_THRESHOLD:
+            values = cache.values
+            keys[:] = [key for key in keys if key in values]
+        else:
+            for path in removed:
+                del keys[bisect_left(keys, path)]
+
+        if len(added) > BATCH_THRESHOLD:
+            keys.extend(added)
+            keys.sort()
+        else:
+            for path in added:
+                insort(keys, path)
+
+    def _node(cache: TrieCache, lo: int, hi: int, level: int) -> Extended:
+        """
+        Encode the node holding the keys `cache.keys[lo:hi]`, which all share
+        their first `level` nibbles.
+        """
+        keys = cache.keys
+        prefix = keys[lo][:level]
+        encoded = cache.nodes.get(prefix)
+        if encoded is not None:
+            return encoded
+
+        first = keys[lo]
+        if hi - lo == 1:
+            node = LeafNode(first[level:], cache.values[first])
+        else:
+            # The keys are sorted, so the prefix shared by the first and last
+            # key is shared by all of them.
+            prefix_length = common_prefix_length(
+                first[level:], keys[hi - 1][level:]
+            )
+            if prefix_length > 0:
+                node = ExtensionNode(
+                    first[level : level + prefix_length],
+                    _node(cache, lo, hi, level + prefix_length),
+                )
+            else:
+                value = b""
+                if len(first) == level:
+                    value = cache.values[first]
+                    lo += 1
+                subnodes: List[Extended] = []
+                for nibble in range(16):
+                    start = lo
+                    lo = bisect_left(
+                        keys, prefix + bytes([nibble + 1]), lo, hi
+                    )
+                    if start == lo:
+                        subnodes.append(b"")
+                    else:
+                        subnodes.append(_node(cache, start, lo, level + 1))
+                node = BranchNode(tuple(subnodes), value)
+
+        encoded = encode_internal_node(node)
+        cache.nodes[prefix] = encoded
+        return encoded
+
+    @add_item(patches)
+    def root(
+        trie: Trie,
+        get_storage_root: Optional[Callable[[Any], Root]] = None,
+    ) -> Root:
+        """
+        See `trie`.
+        """
+        cache = getattr(trie, "_cache", None)
+        if cache is None:
+            cache = TrieCache(dirty=set(trie._data))
+            trie._cache = cache
+
+        data = trie._data
+        dirty = cache.dirty
+        added: List[Bytes] = []
+        removed: List[Bytes] = []
+        if dirty:
+            cache.dirty = set()
+            for preimage in dirty:
+                if preimage not in data:
+                    _remove(cache, preimage, removed)
+                elif get_storage_root is None:
+                    _update(
+                        trie,
+                        cache,
+                        preimage,
+                        encode_node(data[preimage]),
+                        added,
+                    )
+
+        if get_storage_root is not None:
+            # Storage roots change without the account being written, so
+            # every account has to be checked.
+            storage_roots = cache.storage_roots
+            for preimage, value in data.items():
+                storage_root = get_storage_root(Address(preimage))
+                if (
+                    preimage in dirty
+                    or storage_roots.get(preimage) != storage_root
+                ):
+                    assert isinstance(value, Account)
+                    storage_roots[preimage] = storage_root
+                    _update(
+                        trie,
+                        cache,
+                        preimage,
+                        encode_node(value, storage_root),
+                        added,
+                    )
+
+        if added or removed:
+            _merge_keys(cache, added, removed)
+
+        if cache.root is None and cache.keys and not cache.nodes:
+            # Nothing is cached yet, as on the first call, so every node is
+            # built in one sweep over the sorted keys.
+            stack_trie = StackTrie(cache.nodes)
+            values = cache.values
+            for path in cache.keys:
+                stack_trie.update_path(path, values[path])
+            cache.root = stack_trie.root()
+
+        if cache.root is None:
+            root_node: Extended
+            if cache.keys:
+                root_node = _node(cache, 0, len(cache.keys), 0)
+            else:
+                root_node = b""
+            if len(rlp.encode(root_node)) < 32:
+                cache.root = keccak256(rlp.encode(root_node))
+            else:
+                assert isinstance(root_node, Bytes)
+                cache.root = Root(root_node)
+
+        return cache.root
+
+    return patches
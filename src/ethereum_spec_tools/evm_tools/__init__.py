@@ -5,6 +5,7 @@ Defines EVM tools for use in the Ethereum specification.
 import argparse
 import subprocess
 import sys
+from functools import lru_cache
 from typing import Optional, Sequence, Text, TextIO
 
 from ethereum import __version__
@@ -34,9 +35,12 @@ The following forks are supported:
 )
 
 
+@lru_cache(maxsize=None)
 def create_parser() -> argparse.ArgumentParser:
     """
-    Create a command-line argument parser for the evm tool.
+    Create a command-line argument parser for the evm tool. The parser is
+    only built once and then shared, since the daemon parses the arguments of
+    every request, and the state test tool those of every test case.
     """
     new_parser = argparse.ArgumentParser(
         description=DESCRIPTION,
@@ -65,9 +69,11 @@ def create_parser() -> argparse.ArgumentParser:
     return new_parser
 
 
+@lru_cache(maxsize=None)
 def get_git_commit_hash() -> str:
     """
-    Run the 'git rev-parse HEAD' command to get the commit hash
+    Run the 'git rev-parse HEAD' command to get the commit hash. The result
+    is cached, so it is only run once per process.
     """
     try:
         result = subprocess.run(
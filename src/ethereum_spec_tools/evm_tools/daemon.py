@@ -3,15 +3,20 @@ Run ethereum-spec-evm as a daemon.
 """
 
 import argparse
+import importlib
 import json
+import multiprocessing
 import os.path
 import socketserver
 import time
+import traceback
 from http.server import BaseHTTPRequestHandler
 from io import StringIO, TextIOWrapper
+from multiprocessing.connection import Connection
+from queue import Queue
 from socket import socket
-from threading import Thread
-from typing import Any, Tuple, Union
+from threading import BoundedSemaphore, Lock, Thread
+from typing import Any, List, Optional, Tuple, Union
 from urllib.parse import parse_qs, urlparse
 
 from typing_extensions import override
@@ -29,6 +34,28 @@ def daemon_arguments(subparsers: argparse._SubParsersAction) -> None:
         " (0 for no timeout)",
         type=int,
     )
+    parser.add_argument(
+        "--workers",
+        help="Number of worker processes serving requests concurrently"
+        " (0 to serve requests one at a time in the daemon process)",
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "--max-pending",
+        help="Number of requests allowed to wait for a free worker before"
+        " new requests are refused",
+        type=int,
+        default=64,
+    )
+    parser.add_argument(
+        "--request-timeout",
+        help="Seconds a request may run on a worker before it is killed,"
+        " not counting the time spent waiting for a free worker"
+        " (0 for no timeout)",
+        type=float,
+        default=0,
+    )
 
 
 class _EvmToolHandler(BaseHTTPRequestHandler):
@@ -39,15 +66,16 @@ class _EvmToolHandler(BaseHTTPRequestHandler):
         """Don't log requests"""
         pass
 
-    def do_POST(self) -> None:
-        from . import main
-
+    def _read_request(self) -> Tuple[List[str], str]:
+        """
+        Read the request body and turn it into `ethereum-spec-evm` arguments
+        and the input to feed through stdin.
+        """
         content_length = int(self.headers["Content-Length"])
         content_bytes = self.rfile.read(content_length)
         content = json.loads(content_bytes)
 
         input_string = json.dumps(content["input"])
-        input = StringIO(input_string)
 
         args = [
             "t8n",
@@ -90,6 +118,18 @@ class _EvmToolHandler(BaseHTTPRequestHandler):
             )
             args += query.get("arg", [])
 
+        return args, input_string
+
+    def do_POST(self) -> None:
+        args, input_string = self._read_request()
+
+        pool = getattr(self.server, "pool", None)
+        if pool is not None:
+            self._dispatch(pool, args, input_string)
+            return
+
+        from . import main
+
         self.send_response(200)
         self.send_header("Content-type", "application/octet-stream")
         self.end_headers()
@@ -100,17 +140,224 @@ class _EvmToolHandler(BaseHTTPRequestHandler):
         with TextIOWrapper(
             self.wfile, encoding="utf-8"  # type: ignore[type-var]
         ) as out_wrapper:
-            main(args=args, out_file=out_wrapper, in_file=input)
+            main(
+                args=args,
+                out_file=out_wrapper,
+                in_file=StringIO(input_string),
+            )
+
+    def _dispatch(
+        self, pool: "_WorkerPool", args: List[str], input_string: str
+    ) -> None:
+        """
+        Run the request on one of the pool's worker processes.
+        """
+        try:
+            output = pool.run(args, input_string)
+        except _DaemonBusy as e:
+            self._send_text(503, str(e))
+        except _RequestTimeout as e:
+            self._send_text(504, str(e))
+        except _WorkerFailed as e:
+            self._send_text(500, str(e))
+        else:
+            self._send_text(200, output)
+
+    def _send_text(self, code: int, text: str) -> None:
+        body = text.encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _DaemonBusy(Exception):
+    """
+    Raised when every worker is busy and too many requests are waiting.
+    """
+
+
+class _RequestTimeout(Exception):
+    """
+    Raised when a request does not finish within the request timeout.
+    """
+
+
+class _WorkerFailed(Exception):
+    """
+    Raised when a worker process fails to produce an output.
+    """
+
+
+def _worker_main(connection: Connection) -> None:
+    """
+    Entry point of a worker process. Every fork is imported up front, then
+    requests are read from `connection` and answered until it is closed.
+    """
+    from ethereum import trace
+    from ethereum_spec_tools.forks import Hardfork
+
+    from . import main
+
+    for fork in Hardfork.discover():
+        importlib.import_module(fork.name + ".fork")
+
+    connection.send(None)
+
+    while True:
+        try:
+            args, input_string = connection.recv()
+        except EOFError:
+            break
+
+        out_file = StringIO()
+        try:
+            main(args=args, out_file=out_file, in_file=StringIO(input_string))
+        except (Exception, SystemExit):
+            connection.send((False, traceback.format_exc()))
+        else:
+            connection.send((True, out_file.getvalue()))
+        finally:
+            # The tracer is global, don't leak it into the next request.
+            trace.set_evm_trace(trace.discard_evm_trace)
+
+
+class _Worker:
+    """
+    A worker process and the pipe used to talk to it.
+    """
+
+    connection: Connection
+    process: Any
+
+    def __init__(self, context: Any) -> None:
+        self.connection, child = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child,), daemon=True
+        )
+        self.process.start()
+        child.close()
+
+    def wait_ready(self) -> None:
+        """
+        Block until the worker has finished importing the forks.
+        """
+        self.connection.recv()
+
+    def stop(self) -> None:
+        """
+        Kill the worker process.
+        """
+        self.connection.close()
+        self.process.terminate()
+        self.process.join()
+
+
+class _WorkerPool:
+    """
+    A fixed number of worker processes. Requests wait in line for an idle
+    worker, and are refused once `max_pending` requests are already
+    waiting. A worker that exceeds the request timeout or dies is replaced.
+    """
+
+    def __init__(
+        self, workers: int, max_pending: int, request_timeout: float
+    ) -> None:
+        self._context = multiprocessing.get_context("spawn")
+        self._idle: "Queue[_Worker]" = Queue()
+        self._slots = BoundedSemaphore(workers + max_pending)
+        self._lock = Lock()
+        self._closed = False
+        self.request_timeout = request_timeout or None
+
+        self._workers = [_Worker(self._context) for _ in range(workers)]
+        for worker in self._workers:
+            worker.wait_ready()
+            self._idle.put(worker)
+
+    def _replace(self, worker: _Worker) -> None:
+        """
+        Kill `worker` and start a new one in the background.
+        """
+        worker.stop()
+        with self._lock:
+            self._workers.remove(worker)
+            if self._closed:
+                return
+            replacement = _Worker(self._context)
+            self._workers.append(replacement)
+
+        def wait_ready() -> None:
+            try:
+                replacement.wait_ready()
+            except (EOFError, OSError):
+                return
+            self._idle.put(replacement)
+
+        Thread(target=wait_ready, daemon=True).start()
+
+    def run(self, args: List[str], input_string: str) -> str:
+        """
+        Run `ethereum-spec-evm` with `args` on a worker and return its
+        output.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise _DaemonBusy("too many requests waiting for a worker")
+
+        try:
+            # At most `max_pending` requests wait here, and the request
+            # timeout only starts once a worker picks the request up.
+            worker = self._idle.get()
+
+            try:
+                worker.connection.send((args, input_string))
+                if not worker.connection.poll(self.request_timeout):
+                    self._replace(worker)
+                    raise _RequestTimeout(
+                        f"request took longer than {self.request_timeout}s"
+                    )
+                success, output = worker.connection.recv()
+            except (EOFError, OSError) as e:
+                self._replace(worker)
+                raise _WorkerFailed("worker process exited") from e
+
+            self._idle.put(worker)
+        finally:
+            self._slots.release()
+
+        if not success:
+            raise _WorkerFailed(output)
+        return output
+
+    def close(self) -> None:
+        """
+        Kill every worker process.
+        """
+        with self._lock:
+            self._closed = True
+            workers = list(self._workers)
+        for worker in workers:
+            worker.stop()
 
 
 class _UnixSocketHttpServer(socketserver.UnixStreamServer):
     last_response: float
     shutdown_timeout: int
+    pool: Optional[_WorkerPool]
+    active_requests: int
 
     def __init__(
-        self, *args: Any, shutdown_timeout: int, **kwargs: Any
+        self,
+        *args: Any,
+        shutdown_timeout: int,
+        pool: Optional[_WorkerPool] = None,
+        **kwargs: Any,
     ) -> None:
         self.shutdown_timeout = shutdown_timeout
+        self.pool = pool
+        self.active_requests = 0
+        self._active_lock = Lock()
         # Add a 60-second allowance to prevent server from timing out during
         # startup
         self.last_response = time.monotonic() + 60.0
@@ -123,9 +370,13 @@ class _UnixSocketHttpServer(socketserver.UnixStreamServer):
     def finish_request(
         self, request: Union[socket, Tuple[bytes, socket]], client_address: Any
     ) -> None:
+        with self._active_lock:
+            self.active_requests += 1
         try:
             super().finish_request(request, client_address)
         finally:
+            with self._active_lock:
+                self.active_requests -= 1
             self.last_response = time.monotonic()
 
     def check_timeout(self) -> None:
@@ -135,11 +386,24 @@ class _UnixSocketHttpServer(socketserver.UnixStreamServer):
             last_response = self.last_response
             if last_response is None:
                 self.last_response = now
+            elif self.active_requests > 0:
+                continue
             elif now - last_response > float(self.shutdown_timeout):
                 self.shutdown()
                 break
 
 
+class _ThreadingUnixSocketHttpServer(
+    socketserver.ThreadingMixIn, _UnixSocketHttpServer
+):
+    """
+    Handles every connection on its own thread, so requests can be passed
+    to the worker pool concurrently.
+    """
+
+    daemon_threads = True
+
+
 class Daemon:
     """
     Converts HTTP requests into ethereum-spec-evm calls.
@@ -164,6 +428,9 @@ class Daemon:
             self.uds = options.uds
 
         self.timeout = options.timeout
+        self.workers = options.workers
+        self.max_pending = options.max_pending
+        self.request_timeout = options.request_timeout
 
     def _run(self) -> int:
         try:
@@ -171,8 +438,27 @@ class Daemon:
         except IOError:
             pass
 
-        with _UnixSocketHttpServer(
-            (self.uds), _EvmToolHandler, shutdown_timeout=self.timeout
+        if self.workers > 0:
+            pool = _WorkerPool(
+                self.workers, self.max_pending, self.request_timeout
+            )
+            try:
+                return self._serve(_ThreadingUnixSocketHttpServer, pool)
+            finally:
+                pool.close()
+
+        return self._serve(_UnixSocketHttpServer, None)
+
+    def _serve(
+        self,
+        server_class: Any,
+        pool: Optional[_WorkerPool],
+    ) -> int:
+        with server_class(
+            (self.uds),
+            _EvmToolHandler,
+            shutdown_timeout=self.timeout,
+            pool=pool,
         ) as server:
             server.timeout = 7.0
             timer = Thread(target=server.check_timeout, daemon=True)
@@ -5,7 +5,7 @@ Loader for code from the relevant fork.
 import importlib
 from typing import Any
 
-from ethereum_spec_tools.forks import Hardfork
+from ..utils import discover_forks
 
 
 class ForkLoad:
@@ -18,7 +18,7 @@ class ForkLoad:
 
     def __init__(self, fork_module: str):
         self._fork_module = fork_module
-        self._forks = Hardfork.discover()
+        self._forks = discover_forks()
 
     @property
     def fork_module(self) -> str:
@@ -257,6 +257,26 @@ class ForkLoad:
         """state_root function of the fork"""
         return self._module("state").state_root
 
+    @property
+    def TransientStorage(self) -> Any:
+        """Transient storage class of the fork"""
+        return self._module("state").TransientStorage
+
+    @property
+    def begin_transaction(self) -> Any:
+        """begin_transaction function of the fork"""
+        return self._module("state").begin_transaction
+
+    @property
+    def commit_transaction(self) -> Any:
+        """commit_transaction function of the fork"""
+        return self._module("state").commit_transaction
+
+    @property
+    def rollback_transaction(self) -> Any:
+        """rollback_transaction function of the fork"""
+        return self._module("state").rollback_transaction
+
     @property
     def close_state(self) -> Any:
         """close_state function of the fork"""
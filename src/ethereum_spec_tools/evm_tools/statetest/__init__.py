@@ -5,11 +5,22 @@ Execute state tests.
 import argparse
 import json
 import logging
+import multiprocessing
 import sys
-from copy import deepcopy
+from collections import OrderedDict, deque
 from dataclasses import dataclass
 from io import StringIO
-from typing import Any, Dict, Iterable, List, Optional, TextIO
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    TextIO,
+    Tuple,
+)
 
 from ethereum.utils.hexadecimal import hex_to_bytes
 
@@ -83,19 +94,21 @@ def run_test_case(
     """
     from .. import create_parser
 
-    env = deepcopy(test_case.env)
+    # The inputs are only serialized below, so a shallow copy of the
+    # environment (the only dictionary modified) is enough. This keeps the
+    # test case untouched, so it can be shared between runs.
+    env = dict(test_case.env)
     try:
         env["blockHashes"] = {"0": env["previousHash"]}
     except KeyError:
         env["blockHashes"] = {}
     env["withdrawals"] = []
 
-    alloc = deepcopy(test_case.pre)
+    alloc = test_case.pre
 
-    post = deepcopy(test_case.post)
-    d = post["indexes"]["data"]
-    g = post["indexes"]["gas"]
-    v = post["indexes"]["value"]
+    d = test_case.post["indexes"]["data"]
+    g = test_case.post["indexes"]["gas"]
+    v = test_case.post["indexes"]["value"]
 
     tx = {}
     for k, value in test_case.transaction.items():
@@ -174,6 +187,19 @@ def state_test_arguments(subparsers: argparse._SubParsersAction) -> None:
     statetest_parser.add_argument(
         "--nomemory", dest="memory", action="store_false", default=True
     )
+    statetest_parser.add_argument(
+        "--optimized",
+        action="store_true",
+        default=False,
+        help="Use the optimized in-memory state from ethereum_optimized",
+    )
+    statetest_parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Number of processes to run test cases in (0 to run them in"
+        " this process)",
+    )
 
 
 class _PrefixFormatter(logging.Formatter):
@@ -182,6 +208,183 @@ class _PrefixFormatter(logging.Formatter):
         return "\n".join("# " + x for x in output.splitlines())
 
 
+def _supported_test_cases(
+    path: str, supported_forks: Tuple[str, ...]
+) -> List[TestCase]:
+    """
+    Read the test cases in `path` that target one of `supported_forks`.
+    """
+    return [
+        test_case
+        for test_case in read_test_cases(path)
+        if test_case.fork_name.casefold() in supported_forks
+    ]
+
+
+def _run_and_check(
+    test_case: TestCase, t8n_extra: List[str], stderr: TextIO
+) -> Dict[str, Any]:
+    """
+    Run `test_case`, writing traces and the state root to `stderr`, and
+    compare the post state root with the expected one.
+    """
+    result = run_test_case(
+        test_case,
+        t8n_extra=t8n_extra,
+        output_basedir=stderr,
+    )
+
+    # Always output the state root on stderr (even with tracing
+    # disabled) for the holiman/goevmlab integration.
+    json.dump(
+        {"stateRoot": "0x" + result.state_root.hex()},
+        stderr,
+    )
+    stderr.write("\n")
+
+    passed = hex_to_bytes(test_case.post["hash"]) == result.state_root
+    result_dict: Dict[str, Any] = {
+        "stateRoot": "0x" + result.state_root.hex(),
+        "fork": test_case.fork_name,
+        "name": test_case.key,
+        "pass": passed,
+    }
+
+    if not passed:
+        actual = result.state_root.hex()
+        expected = test_case.post["hash"][2:]
+        result_dict[
+            "error"
+        ] = f"post state root mismatch: got {actual}, want {expected}"
+
+    return result_dict
+
+
+# State of a worker process of the pool used by `StateTest.run_parallel()`.
+_worker_log_handler: Optional[logging.StreamHandler] = None
+_worker_files: "OrderedDict[str, List[TestCase]]" = OrderedDict()
+
+# Number of parsed files a worker process keeps. The remaining test cases of
+# a file are queued together once it is started, so a worker rarely needs
+# more than the file it is running and the one it is starting.
+_WORKER_FILES = 2
+
+
+def _init_worker() -> None:
+    """
+    Send the T8N log of a worker process to a stream that can be swapped
+    for every test case, so it is written out with the case's other output.
+    """
+    global _worker_log_handler
+
+    logger = logging.getLogger("T8N")
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    _worker_log_handler = logging.StreamHandler()
+    _worker_log_handler.setFormatter(
+        _PrefixFormatter("%(levelname)s:%(name)s:%(message)s")
+    )
+    logger.addHandler(_worker_log_handler)
+
+
+def _worker_test_cases(
+    path: str, supported_forks: Tuple[str, ...]
+) -> List[TestCase]:
+    """
+    Get the supported test cases of the file at `path`, parsing it only if
+    this worker hasn't recently.
+    """
+    test_cases = _worker_files.get(path)
+    if test_cases is None:
+        test_cases = _supported_test_cases(path, supported_forks)
+        _worker_files[path] = test_cases
+        while len(_worker_files) > _WORKER_FILES:
+            _worker_files.popitem(last=False)
+    else:
+        _worker_files.move_to_end(path)
+    return test_cases
+
+
+def _start_in_worker(
+    task: Tuple[str, List[str], Tuple[str, ...]]
+) -> Tuple[int, Optional[Tuple[str, Dict[str, Any]]]]:
+    """
+    Parse the file at `path` and run its first supported test case. Returns
+    the number of supported test cases, and the output of the first one if
+    there is one.
+    """
+    path, t8n_extra, supported_forks = task
+    test_cases = _worker_test_cases(path, supported_forks)
+    if not test_cases:
+        return 0, None
+    return len(test_cases), _run_in_worker(
+        (path, 0, t8n_extra, supported_forks)
+    )
+
+
+def _run_in_worker(
+    task: Tuple[str, int, List[str], Tuple[str, ...]]
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Run the `index`th supported test case of the file at `path`.
+    """
+    path, index, t8n_extra, supported_forks = task
+    test_case = _worker_test_cases(path, supported_forks)[index]
+
+    stderr = StringIO()
+    if _worker_log_handler is not None:
+        _worker_log_handler.setStream(stderr)
+    result_dict = _run_and_check(test_case, t8n_extra, stderr)
+    return stderr.getvalue(), result_dict
+
+
+class _ParallelFile:
+    """
+    The test cases of a file being run by `StateTest.run_parallel()`.
+    """
+
+    def __init__(
+        self,
+        pool: Any,
+        path: str,
+        t8n_extra: List[str],
+        supported_forks: Tuple[str, ...],
+    ) -> None:
+        self.rest: List[Any] = []
+
+        def start_rest(started: Tuple[int, Any]) -> None:
+            # Runs on the pool's result thread as soon as the file is
+            # started, before `self.start.get()` returns.
+            try:
+                self.rest = [
+                    pool.apply_async(
+                        _run_in_worker,
+                        ((path, index, t8n_extra, supported_forks),),
+                    )
+                    for index in range(1, started[0])
+                ]
+            except ValueError:
+                # The pool was closed by an error in an earlier file, so
+                # these results will never be read.
+                pass
+
+        self.start = pool.apply_async(
+            _start_in_worker,
+            ((path, t8n_extra, supported_forks),),
+            callback=start_rest,
+        )
+
+    def outputs(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Wait for the output of each test case, in order.
+        """
+        _, first = self.start.get()
+        if first is not None:
+            yield first
+        for result in self.rest:
+            yield result.get()
+
+
 class StateTest:
     """
     Run one or more state tests.
@@ -200,6 +403,8 @@ class StateTest:
         self.memory: bool = options.memory
         self.stack: bool = options.stack
         self.return_data: bool = options.return_data
+        self.workers: int = options.workers
+        self.optimized: bool = options.optimized
 
     def run(self) -> int:
         """
@@ -217,63 +422,44 @@ class StateTest:
         else:
             return self.run_one(self.file)
 
+    def t8n_extra(self) -> List[str]:
+        """
+        Extra arguments passed to the t8n tool for every test case.
+        """
+        t8n_extra: List[str] = []
+
+        if self.optimized:
+            t8n_extra.append("--optimized")
+
+        if self.trace:
+            t8n_extra.append("--trace")
+
+        if self.memory:
+            t8n_extra.append("--trace.memory")
+        else:
+            t8n_extra.append("--trace.nomemory")
+
+        if not self.stack:
+            t8n_extra.append("--trace.nostack")
+
+        if self.return_data:
+            t8n_extra.append("--trace.returndata")
+        else:
+            t8n_extra.append("--trace.noreturndata")
+
+        return t8n_extra
+
     def run_one(self, path: str) -> int:
         """
         Execute state tests from a single file.
         """
-        results = []
-        for test_case in read_test_cases(path):
-            if test_case.fork_name.casefold() not in self.supported_forks:
-                continue
-
-            t8n_extra: List[str] = []
-
-            if self.trace:
-                t8n_extra.append("--trace")
-
-            if self.memory:
-                t8n_extra.append("--trace.memory")
-            else:
-                t8n_extra.append("--trace.nomemory")
-
-            if not self.stack:
-                t8n_extra.append("--trace.nostack")
-
-            if self.return_data:
-                t8n_extra.append("--trace.returndata")
-            else:
-                t8n_extra.append("--trace.noreturndata")
-
-            result = run_test_case(
-                test_case,
-                t8n_extra=t8n_extra,
-                output_basedir=sys.stderr,
-            )
-
-            # Always output the state root on stderr (even with tracing
-            # disabled) for the holiman/goevmlab integration.
-            json.dump(
-                {"stateRoot": "0x" + result.state_root.hex()},
-                sys.stderr,
-            )
-            sys.stderr.write("\n")
-
-            passed = hex_to_bytes(test_case.post["hash"]) == result.state_root
-            result_dict = {
-                "stateRoot": "0x" + result.state_root.hex(),
-                "fork": test_case.fork_name,
-                "name": test_case.key,
-                "pass": passed,
-            }
+        if self.workers > 0:
+            return self.run_parallel([path])
 
-            if not passed:
-                actual = result.state_root.hex()
-                expected = test_case.post["hash"][2:]
-                result_dict[
-                    "error"
-                ] = f"post state root mismatch: got {actual}, want {expected}"
-
-            results.append(result_dict)
+        t8n_extra = self.t8n_extra()
+        results = []
+        for test_case in _supported_test_cases(path, self.supported_forks):
+            results.append(_run_and_check(test_case, t8n_extra, sys.stderr))
 
         json.dump(results, self.out_file, indent=4)
         self.out_file.write("\n")
@@ -284,8 +470,61 @@ class StateTest:
         Execute state tests from a line-delimited list of files provided from
         `self.in_file`.
         """
+        if self.workers > 0:
+            return self.run_parallel(line[:-1] for line in self.in_file)
+
         for line in self.in_file:
             result = self.run_one(line[:-1])
             if result != 0:
                 return result
         return 0
+
+    def run_parallel(self, paths: Iterable[str]) -> int:
+        """
+        Execute state tests from the files in `paths`, spreading the test
+        cases over `self.workers` processes.
+
+        The output is identical to running the files one after another: the
+        results of each file are written once all of its test cases are
+        done, in the order the files and test cases were given. Meanwhile
+        the next files are started, so that workers are kept busy even when
+        files only hold a few test cases. A worker starts a file by parsing
+        it and running its first test case, and its remaining test cases are
+        queued as soon as their number is known. An error reading a file, or
+        running a test case, is raised here once the results of the files
+        before it are written, as it would be when running them one after
+        another.
+        """
+        t8n_extra = self.t8n_extra()
+        supported_forks = self.supported_forks
+        max_started = 2 * self.workers
+
+        with multiprocessing.Pool(
+            self.workers, initializer=_init_worker
+        ) as pool:
+            files: Deque[_ParallelFile] = deque()
+            for path in paths:
+                if len(files) > max_started:
+                    self._write_results(files.popleft().outputs())
+                files.append(
+                    _ParallelFile(pool, path, t8n_extra, supported_forks)
+                )
+
+            while files:
+                self._write_results(files.popleft().outputs())
+
+        return 0
+
+    def _write_results(
+        self, outputs: Iterator[Tuple[str, Dict[str, Any]]]
+    ) -> None:
+        """
+        Write the traces and results of the test cases of one file.
+        """
+        results = []
+        for stderr, result_dict in outputs:
+            sys.stderr.write(stderr)
+            results.append(result_dict)
+
+        json.dump(results, self.out_file, indent=4)
+        self.out_file.write("\n")
@@ -7,19 +7,19 @@ import fnmatch
 import json
 import os
 from functools import partial
-from typing import Any, TextIO
+from typing import Any, TextIO, Tuple
 
 from ethereum_rlp import rlp
 from ethereum_types.numeric import U64, Uint
 
 from ethereum import trace
 from ethereum.exceptions import EthereumException, InvalidBlock
-from ethereum_spec_tools.forks import Hardfork
 
 from ..loaders.fixture_loader import Load
 from ..loaders.fork_loader import ForkLoad
 from ..utils import (
     FatalException,
+    discover_forks,
     get_module_name,
     get_stream_logger,
     parse_hex_or_int,
@@ -66,6 +66,19 @@ def t8n_arguments(subparsers: argparse._SubParsersAction) -> None:
     t8n_parser.add_argument(
         "--state.reward", dest="state_reward", type=int, default=0
     )
+    t8n_parser.add_argument(
+        "--state.root-workers",
+        dest="state_root_workers",
+        type=int,
+        default=None,
+        help="processes computing storage roots, 0 for one per CPU",
+    )
+    t8n_parser.add_argument(
+        "--optimized",
+        action="store_true",
+        help="use the optimized in-memory state and, unless tracing, the"
+        " optimized interpreter from ethereum_optimized",
+    )
     t8n_parser.add_argument("--trace", action="store_true")
     t8n_parser.add_argument("--trace.memory", action="store_true")
     t8n_parser.add_argument("--trace.nomemory", action="store_true")
@@ -85,7 +98,7 @@ class T8N(Load):
         self.out_file = out_file
         self.in_file = in_file
         self.options = options
-        self.forks = Hardfork.discover()
+        self.forks = discover_forks()
 
         if "stdin" in (
             options.input_env,
@@ -101,6 +114,26 @@ class T8N(Load):
         )
         self.fork = ForkLoad(fork_module)
 
+        self.journaled_state = getattr(options, "optimized", False)
+        if self.journaled_state:
+            from ethereum_optimized import (
+                monkey_patch_in_memory,
+                monkey_patch_instruction_stream,
+            )
+
+            monkey_patch_in_memory(self.fork.fork_module)
+            # Traced transitions run the specification's interpreter.
+            if not self.options.trace:
+                monkey_patch_instruction_stream(self.fork.fork_module)
+
+        state_root_workers = getattr(options, "state_root_workers", None)
+        if state_root_workers is not None:
+            from ethereum_optimized import monkey_patch_parallel_storage_roots
+
+            monkey_patch_parallel_storage_roots(
+                self.fork.fork_module, state_root_workers or None
+            )
+
         if self.options.trace:
             trace_memory = getattr(self.options, "trace.memory", False)
             trace_stack = not getattr(self.options, "trace.nostack", False)
@@ -160,21 +193,58 @@ class T8N(Load):
 
         return self.fork.BlockEnvironment(**kw_arguments)
 
+    def _state_transaction_args(self) -> Tuple[Any, ...]:
+        """
+        Arguments for the fork's state transaction functions. Transient
+        storage is scoped to a single transaction, so a fresh one is used.
+        """
+        if self.fork.is_after_fork("ethereum.cancun"):
+            return (self.alloc.state, self.fork.TransientStorage())
+        return (self.alloc.state,)
+
     def backup_state(self) -> None:
-        """Back up the state in order to restore in case of an error."""
+        """
+        Take a checkpoint of the state in order to restore in case of an
+        error.
+
+        With `--optimized` the state keeps an undo journal, so from
+        Byzantium onwards this opens a transaction on the state, which only
+        records the length of the journal. The transaction's message call is
+        nested inside it, and the journal keeps the storage values from
+        before the outermost transaction as the original ones. Otherwise the
+        tries are copied, as they are for earlier forks, which compute the
+        state root after every transaction for the receipt, and that isn't
+        allowed inside a state transaction.
+        """
         state = self.alloc.state
-        self.alloc.state_backup = (
-            self.fork.copy_trie(state._main_trie),
-            {
-                k: self.fork.copy_trie(t)
-                for (k, t) in state._storage_tries.items()
-            },
-        )
+        if self.journaled_state and self.fork.is_after_fork(
+            "ethereum.byzantium"
+        ):
+            self.alloc.state_backup = None
+            self.alloc.state_checkpoint = self._state_transaction_args()
+            self.fork.begin_transaction(*self.alloc.state_checkpoint)
+        else:
+            self.alloc.state_checkpoint = None
+            self.alloc.state_backup = (
+                self.fork.copy_trie(state._main_trie),
+                {
+                    k: self.fork.copy_trie(t)
+                    for (k, t) in state._storage_tries.items()
+                },
+            )
+
+    def commit_state(self) -> None:
+        """Keep the changes made since the last checkpoint."""
+        if self.alloc.state_checkpoint is not None:
+            self.fork.commit_transaction(*self.alloc.state_checkpoint)
 
     def restore_state(self) -> None:
-        """Restore the state from the backup."""
-        state = self.alloc.state
-        state._main_trie, state._storage_tries = self.alloc.state_backup
+        """Restore the state to the last checkpoint."""
+        if self.alloc.state_checkpoint is not None:
+            self.fork.rollback_transaction(*self.alloc.state_checkpoint)
+        else:
+            state = self.alloc.state
+            state._main_trie, state._storage_tries = self.alloc.state_backup
 
     def run_state_test(self) -> Any:
         """
@@ -183,9 +253,9 @@ class T8N(Load):
         """
         block_env = self.block_environment()
         block_output = self.fork.BlockOutput()
-        self.backup_state()
         if len(self.txs.transactions) > 0:
             tx = self.txs.transactions[0]
+            self.backup_state()
             try:
                 self.fork.process_transaction(
                     block_env=block_env,
@@ -197,6 +267,8 @@ class T8N(Load):
                 self.txs.rejected_txs[0] = f"Failed transaction: {e!r}"
                 self.restore_state()
                 self.logger.warning(f"Transaction {0} failed: {str(e)}")
+            else:
+                self.commit_state()
 
         self.result.update(self, block_env, block_output)
         self.result.rejected = self.txs.rejected_txs
@@ -226,6 +298,8 @@ class T8N(Load):
                 self.txs.rejected_txs[i] = f"Failed transaction: {e!r}"
                 self.restore_state()
                 self.logger.warning(f"Transaction {i} failed: {e!r}")
+            else:
+                self.commit_state()
 
         if not self.fork.is_after_fork("ethereum.paris"):
             self.fork.pay_rewards(
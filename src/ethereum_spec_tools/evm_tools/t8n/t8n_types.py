@@ -26,6 +26,7 @@ class Alloc:
 
     state: Any
     state_backup: Any
+    state_checkpoint: Any
 
     def __init__(self, t8n: "T8N", stdin: Optional[Dict] = None):
         """Read the alloc file and return the state."""
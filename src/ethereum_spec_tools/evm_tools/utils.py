@@ -5,6 +5,7 @@ Utilities for the EVM tools
 import json
 import logging
 import sys
+from functools import lru_cache
 from typing import (
     Any,
     Callable,
@@ -136,12 +137,21 @@ def get_module_name(
     sys.exit(f"Unsupported state fork: {options.state_fork}")
 
 
+@lru_cache(maxsize=None)
+def discover_forks() -> Tuple[Hardfork, ...]:
+    """
+    Get the forks found by `Hardfork.discover()`. They are only searched for
+    once, since the daemon needs them for every request.
+    """
+    return tuple(Hardfork.discover())
+
+
 def get_supported_forks() -> List[str]:
     """
     Get the supported forks.
     """
     supported_forks = [
-        fork.title_case_name.replace(" ", "") for fork in Hardfork.discover()
+        fork.title_case_name.replace(" ", "") for fork in discover_forks()
     ]
 
     # Add the exception forks
@@ -8,14 +8,32 @@ Using an RPC provider, fetch each block and validate it with the specification.
 import argparse
 import json
 import logging
+import multiprocessing
 import os
 import pkgutil
 import shutil
 import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import fields, is_dataclass
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
 from queue import Empty, Full, Queue
-from threading import Thread
-from typing import Any, Dict, List, Optional, TypeVar, Union, cast
-from urllib import request
+from threading import Thread, local
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Deque,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+    cast,
+)
+from urllib.parse import urlsplit
 
 from ethereum_rlp import rlp
 from ethereum_types.bytes import Bytes0, Bytes256
@@ -33,6 +51,9 @@ from ethereum.utils.hexadecimal import (
 
 from .forks import Hardfork
 
+if TYPE_CHECKING:
+    from ethereum.fork_criteria import ForkCriteria
+
 T = TypeVar("T")
 
 
@@ -45,6 +66,12 @@ class RpcError(Exception):
         super().__init__(message)
         self.code = code
 
+    def __reduce__(self) -> Tuple[Any, ...]:
+        """
+        Keep the code when the error is sent between processes.
+        """
+        return (RpcError, (self.code, str(self)))
+
 
 class ForkTracking:
     """
@@ -105,197 +132,78 @@ class ForkTracking:
         return new_fork
 
 
-class BlockDownloader(ForkTracking):
-    """Downloads blocks from the RPC provider."""
-
-    queue: Queue
-    log: logging.Logger
-    rpc_url: str
-    geth: bool
-
-    def __init__(
-        self,
-        forks: List[Hardfork],
-        log: logging.Logger,
-        rpc_url: str,
-        geth: bool,
-        first_block: Uint,
-        first_block_timestamp: U256,
-    ) -> None:
-        ForkTracking.__init__(self, forks, first_block, first_block_timestamp)
-
-        # `first_block_timestamp` is the timestamp for the persisted block,
-        #  but the downloader starts 256 blocks earlier. Since this might be
-        #  the previous fork we step 1 fork backwards. In the case that there
-        #  wasn't a fork in the previous 256 blocks, `advance_block()` will
-        #  restore the correct fork before any blocks are processed.
-        if self.active_fork_index > 0:
-            self.active_fork_index -= 1
+class BlockDecoder(ForkTracking):
+    """
+    Turns the replies of the RPC provider into blocks of the right fork.
 
-        self.queue = Queue(maxsize=512)
-        self.log = log
-        self.rpc_url = rpc_url
-        self.geth = geth
+    The fork of each block is chosen from its own number and timestamp, so a
+    decoder doesn't need to see every block and batches can be decoded
+    independently of each other.
+    """
 
-        Thread(target=self.download, name="download", daemon=True).start()
+    def __init__(self, forks: List[Hardfork]) -> None:
+        ForkTracking.__init__(self, forks, Uint(0), U256(0))
 
-    def take_block(self) -> Optional[Any]:
+    def decode_raw_blocks(
+        self, block_rlps: List[Union[bytes, RpcError]]
+    ) -> List[Union[Any, RpcError]]:
         """
-        Pop a block of the download queue.
+        Decode RLP encoded blocks fetched with `debug_getRawBlock`.
         """
-        # Use a loop+timeout so that KeyboardInterrupt is still raised.
-        while True:
+        blocks: List[Union[Any, RpcError]] = []
+        for block_rlp in block_rlps:
+            if isinstance(block_rlp, RpcError):
+                blocks.append(block_rlp)
+                continue
+
+            decoded_block = rlp.decode(block_rlp)
+            assert not isinstance(decoded_block, bytes)
+            assert not isinstance(decoded_block[0], bytes)
+            assert isinstance(decoded_block[0][8], bytes)
+            assert isinstance(decoded_block[0][11], bytes)
+            number = Uint.from_be_bytes(decoded_block[0][8])
+            timestamp = U256.from_be_bytes(decoded_block[0][11])
+            self.set_block(number, timestamp)
             try:
-                return self.queue.get(timeout=1)
-            except Empty:
-                pass
-
-    def download(self) -> None:
-        """
-        Fetch chunks of blocks from the RPC provider.
-        """
-        running = True
-
-        while running:
-            count = Uint(max(1, self.queue.maxsize // 2))
-            replies = self.fetch_blocks(self.block_number + Uint(1), count)
-
-            for reply in replies:
-                to_push: Optional[bytes]
-
-                if isinstance(reply, RpcError):
-                    if reply.code != -32000:
-                        raise reply
+                blocks.append(
+                    rlp.deserialize_to(
+                        self.module("blocks").Block, decoded_block
+                    )
+                )
+            except Exception:
+                logging.getLogger(__name__).exception(
+                    "failed to decode block %d with timestamp %d",
+                    number,
+                    timestamp,
+                )
+                raise
 
-                    logging.info("reached end of chain", exc_info=reply)
-                    running = False
-                    to_push = None
-                else:
-                    to_push = reply
-
-                # Use a loop+timeout so that KeyboardInterrupt is still raised.
-                while True:
-                    try:
-                        self.queue.put(to_push, timeout=1)
-                        break
-                    except Full:
-                        pass
+        return blocks
 
-    def fetch_blocks(
+    def decode_json_blocks(
         self,
-        first: Uint,
-        count: Uint,
+        block_jsons: List[Union[Any, RpcError]],
+        ommer_jsons: Dict[Uint, List[Any]],
     ) -> List[Union[Any, RpcError]]:
         """
-        Fetch the block specified by the given number from the RPC provider.
+        Create blocks from the replies of `eth_getBlockByNumber` and
+        `eth_getUncleByBlockNumberAndIndex`.
         """
-        if self.geth:
-            return self.fetch_blocks_debug(first, count)
-        else:
-            return self.fetch_blocks_eth(first, count)
-
-    def fetch_blocks_debug(
-        self,
-        first: Uint,
-        count: Uint,
-    ) -> List[Union[bytes, RpcError]]:
-        """
-        Fetch the block specified by the given number from the RPC provider as
-        an RLP encoded byte array.
-        """
-        if count == 0:
-            return []
-
-        calls = []
-
-        for number in range(first, first + count):
-            calls.append(
-                {
-                    "jsonrpc": "2.0",
-                    "id": hex(number),
-                    "method": "debug_getRawBlock",
-                    "params": [hex(number)],
-                }
+        blocks: List[Union[Any, RpcError]] = []
+        for block_json in block_jsons:
+            if isinstance(block_json, RpcError):
+                blocks.append(block_json)
+                continue
+
+            number = hex_to_uint(block_json["number"])
+            self.set_block(number, hex_to_u256(block_json["timestamp"]))
+            ommers = tuple(
+                self.make_header(ommer)
+                for ommer in ommer_jsons.get(number, [])
             )
+            blocks.append(self.make_block(block_json, ommers))
 
-        data = json.dumps(calls).encode("utf-8")
-
-        self.log.debug("fetching blocks [%d, %d)...", first, first + count)
-
-        post = request.Request(
-            self.rpc_url,
-            data=data,
-            headers={
-                "Content-Length": str(len(data)),
-                "Content-Type": "application/json",
-                "User-Agent": "ethereum-spec-sync",
-            },
-        )
-
-        with request.urlopen(post) as response:
-            replies = json.load(response)
-            if not isinstance(replies, list):
-                self.log.error(
-                    "got non-list JSON-RPC response. replies=%r", replies
-                )
-                raise ValueError
-
-            block_rlps: Dict[Uint, Union[RpcError, bytes]] = {}
-
-            for reply in replies:
-                try:
-                    reply_id = Uint(int(reply["id"], 0))
-                except Exception:
-                    self.log.exception(
-                        "unable to parse RPC id. reply=%r", reply
-                    )
-                    raise
-
-                if reply_id < first or reply_id >= first + count:
-                    raise Exception("mismatched request id")
-
-                if "error" in reply:
-                    block_rlps[reply_id] = RpcError(
-                        reply["error"]["code"],
-                        reply["error"]["message"],
-                    )
-                else:
-                    block_rlps[reply_id] = bytes.fromhex(reply["result"][2:])
-
-            if len(block_rlps) != count:
-                raise Exception(
-                    f"expected {count} blocks but only got {len(block_rlps)}"
-                )
-
-            self.log.info("blocks [%d, %d) fetched", first, first + count)
-
-            blocks: List[Union[RpcError, Any]] = []
-            for _, block_rlp in sorted(block_rlps.items()):
-                if isinstance(block_rlp, RpcError):
-                    blocks.append(block_rlp)
-                else:
-                    # Unfortunately we have to decode the RLP twice.
-                    decoded_block = rlp.decode(block_rlp)
-                    assert not isinstance(decoded_block, bytes)
-                    assert not isinstance(decoded_block[0], bytes)
-                    assert isinstance(decoded_block[0][11], bytes)
-                    timestamp = U256.from_be_bytes(decoded_block[0][11])
-                    self.advance_block(timestamp)
-                    try:
-                        blocks.append(
-                            rlp.decode_to(
-                                self.module("blocks").Block, block_rlp
-                            )
-                        )
-                    except Exception:
-                        self.log.exception(
-                            "failed to decode block %d with timestamp %d",
-                            self.block_number,
-                            timestamp,
-                        )
-                        raise
-
-            return blocks
+        return blocks
 
     def load_transaction(self, t: Any) -> Any:
         """
@@ -385,14 +293,476 @@ class BlockDownloader(ForkTracking):
                 hex_to_u256(t["s"]),
             )
 
+    def make_header(self, json: Any) -> Any:
+        """
+        Create a Header object from JSON describing it.
+        """
+        fields = [
+            hex_to_bytes32(json["parentHash"]),
+            hex_to_bytes32(json["sha3Uncles"]),
+            self.module("utils.hexadecimal").hex_to_address(json["miner"]),
+            hex_to_bytes32(json["stateRoot"]),
+            hex_to_bytes32(json["transactionsRoot"]),
+            hex_to_bytes32(json["receiptsRoot"]),
+            Bytes256(hex_to_bytes(json["logsBloom"])),
+            hex_to_uint(json["difficulty"]),
+            hex_to_uint(json["number"]),
+            hex_to_uint(json["gasLimit"]),
+            hex_to_uint(json["gasUsed"]),
+            hex_to_u256(json["timestamp"]),
+            hex_to_bytes(json["extraData"]),
+            hex_to_bytes32(json["mixHash"]),
+            hex_to_bytes8(json["nonce"]),
+        ]
+        if hasattr(self.module("blocks").Header, "base_fee_per_gas"):
+            fields.append(hex_to_uint(json["baseFeePerGas"]))
+        if hasattr(self.module("blocks").Header, "withdrawals_root"):
+            fields.append(hex_to_bytes32(json["withdrawalsRoot"]))
+        return self.module("blocks").Header(*fields)
+
+    def make_block(self, json: Any, ommers: Any) -> Any:
+        """
+        Create a block from JSON describing it.
+        """
+        header = self.make_header(json)
+        transactions = []
+        for t in json["transactions"]:
+            transactions.append(self.load_transaction(t))
+
+        if json.get("withdrawals") is not None:
+            withdrawals = []
+            for j in json["withdrawals"]:
+                withdrawals.append(
+                    self.module("blocks").Withdrawal(
+                        hex_to_u64(j["index"]),
+                        hex_to_u64(j["validatorIndex"]),
+                        self.module("utils.hexadecimal").hex_to_address(
+                            j["address"]
+                        ),
+                        hex_to_u256(j["amount"]),
+                    )
+                )
+
+        extra_fields = []
+        if hasattr(self.module("blocks").Block, "withdrawals"):
+            extra_fields.append(withdrawals)
+
+        return self.module("blocks").Block(
+            header,
+            tuple(transactions),
+            ommers,
+            *extra_fields,
+        )
+
+
+class _Fields(NamedTuple):
+    """
+    A dataclass instance, flattened into its type and field values.
+    """
+
+    cls: Any
+    values: Tuple[Any, ...]
+
+
+def _flatten(value: Any) -> Any:
+    """
+    Replace the dataclasses in `value` with `_Fields`. Frozen dataclasses
+    cannot be unpickled, so blocks leave the decoding processes like this.
+    """
+    if is_dataclass(value) and not isinstance(value, type):
+        return _Fields(
+            type(value),
+            tuple(_flatten(getattr(value, f.name)) for f in fields(value)),
+        )
+    elif type(value) is tuple:
+        return tuple(_flatten(item) for item in value)
+    else:
+        return value
+
+
+def _rebuild(value: Any) -> Any:
+    """
+    Rebuild the dataclasses flattened by `_flatten()`.
+    """
+    if isinstance(value, _Fields):
+        return value.cls(*(_rebuild(item) for item in value.values))
+    elif type(value) is tuple:
+        return tuple(_rebuild(item) for item in value)
+    else:
+        return value
+
+
+# Decoder used by the processes of `BlockDownloader`'s decoding pool.
+_decoder: Optional[BlockDecoder] = None
+
+
+def _init_decoder(fork_config: Dict["ForkCriteria", str]) -> None:
+    """
+    Set up the decoder of a decoding process.
+    """
+    global _decoder
+    _decoder = BlockDecoder(Hardfork.load(fork_config))
+
+
+def _decode_raw_blocks(
+    block_rlps: List[Union[bytes, RpcError]]
+) -> List[Union[Any, RpcError]]:
+    """
+    See `BlockDecoder.decode_raw_blocks()`.
+    """
+    assert _decoder is not None
+    return [_flatten(b) for b in _decoder.decode_raw_blocks(block_rlps)]
+
+
+def _decode_json_blocks(
+    block_jsons: List[Union[Any, RpcError]],
+    ommer_jsons: Dict[Uint, List[Any]],
+) -> List[Union[Any, RpcError]]:
+    """
+    See `BlockDecoder.decode_json_blocks()`.
+    """
+    assert _decoder is not None
+    return [
+        _flatten(b)
+        for b in _decoder.decode_json_blocks(block_jsons, ommer_jsons)
+    ]
+
+
+class BlockDownloader(BlockDecoder):
+    """
+    Downloads blocks from the RPC provider.
+
+    Batches of blocks are requested by `fetchers` threads at once, each
+    keeping its own connection alive. Fetched batches are decoded by a pool
+    of `decoders` processes (or by the fetching thread if `decoders` is 0),
+    and put back in order before they reach `take_block()`.
+    """
+
+    queue: Queue
+    log: logging.Logger
+    rpc_url: str
+    geth: bool
+    fetchers: int
+    decoders: int
+    batch_size: int
+
+    def __init__(
+        self,
+        forks: List[Hardfork],
+        log: logging.Logger,
+        rpc_url: str,
+        geth: bool,
+        first_block: Uint,
+        first_block_timestamp: U256,
+        fetchers: int = 4,
+        decoders: int = 2,
+        batch_size: int = 128,
+    ) -> None:
+        BlockDecoder.__init__(self, forks)
+        self.set_block(first_block, first_block_timestamp)
+
+        self.queue = Queue(maxsize=512)
+        self.log = log
+        self.rpc_url = rpc_url
+        self.geth = geth
+        self.fetchers = fetchers
+        self.decoders = decoders
+        self.batch_size = batch_size
+        self._connections = local()
+
+        Thread(target=self.download, name="download", daemon=True).start()
+
+    def take_block(self) -> Optional[Any]:
+        """
+        Pop a block of the download queue. Errors raised while downloading
+        are raised here.
+        """
+        # Use a loop+timeout so that KeyboardInterrupt is still raised.
+        while True:
+            try:
+                block = self.queue.get(timeout=1)
+            except Empty:
+                continue
+
+            if isinstance(block, Exception):
+                raise block
+            return block
+
+    def _push(self, block: Optional[Any]) -> None:
+        """
+        Push a block (or an error) onto the download queue.
+        """
+        # Use a loop+timeout so that KeyboardInterrupt is still raised.
+        while True:
+            try:
+                self.queue.put(block, timeout=1)
+                break
+            except Full:
+                pass
+
+    def download(self) -> None:
+        """
+        Fetch and decode blocks from the RPC provider until the end of the
+        chain is reached, handing errors over to `take_block()`.
+        """
+        try:
+            self._download()
+        except Exception as e:
+            self.log.exception("failed to download blocks")
+            self._push(e)
+
+    def _download(self) -> None:
+        """
+        Fetch and decode batches of blocks from the RPC provider, making
+        sure the fetching threads and decoding processes are shut down
+        however the download ends.
+        """
+        with ExitStack() as pools:
+            decoding_pool: Optional[ProcessPoolExecutor] = None
+            if self.decoders > 0:
+                decoding_pool = ProcessPoolExecutor(
+                    self.decoders,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_decoder,
+                    initargs=(
+                        {
+                            fork.criteria: fork.short_name
+                            for fork in self.forks
+                        },
+                    ),
+                )
+                pools.callback(decoding_pool.shutdown, cancel_futures=True)
+
+            # Shut down before the decoding pool, which running fetches
+            # still submit to. Fetches that haven't started are cancelled,
+            # whether the download ended or failed.
+            fetch_pool = ThreadPoolExecutor(
+                self.fetchers, thread_name_prefix="fetch"
+            )
+            pools.callback(fetch_pool.shutdown, cancel_futures=True)
+
+            self._fetch_in_order(fetch_pool, decoding_pool)
+
+    def _fetch_in_order(
+        self,
+        fetch_pool: ThreadPoolExecutor,
+        decoding_pool: Optional[ProcessPoolExecutor],
+    ) -> None:
+        """
+        Keep `2 * fetchers` batches in flight on `fetch_pool`, and push their
+        blocks in order until the end of the chain is reached.
+        """
+        in_flight: Deque[Tuple[Uint, "Future[Future[List[Any]]]"]] = deque()
+        next_block = self.block_number + Uint(1)
+        count = Uint(self.batch_size)
+
+        while True:
+            while len(in_flight) < 2 * self.fetchers:
+                in_flight.append(
+                    (
+                        next_block,
+                        fetch_pool.submit(
+                            self.fetch_batch,
+                            next_block,
+                            count,
+                            decoding_pool,
+                        ),
+                    )
+                )
+                next_block += count
+
+            first, fetching = in_flight.popleft()
+            replies = fetching.result().result()
+
+            for reply in replies:
+                if isinstance(reply, RpcError):
+                    if reply.code != -32000:
+                        raise reply
+
+                    logging.info("reached end of chain", exc_info=reply)
+                    self._push(None)
+                    return
+
+                self._push(_rebuild(reply))
+
+            if Uint(len(replies)) < count:
+                # The provider doesn't have the whole batch yet, so the
+                # batches after it have to be requested again.
+                for _, pending in in_flight:
+                    pending.cancel()
+                in_flight.clear()
+                next_block = first + Uint(len(replies))
+
+    def fetch_batch(
+        self,
+        first: Uint,
+        count: Uint,
+        decoding_pool: Optional[ProcessPoolExecutor],
+    ) -> "Future[List[Union[Any, RpcError]]]":
+        """
+        Fetch the blocks `[first, first + count)` and start decoding them,
+        either on `decoding_pool` or right away on this thread.
+        """
+        blocks: List[Union[Any, RpcError]]
+        if self.geth:
+            block_rlps = self.fetch_blocks_debug(first, count)
+            if decoding_pool is not None:
+                return decoding_pool.submit(_decode_raw_blocks, block_rlps)
+            blocks = BlockDecoder(self.forks).decode_raw_blocks(block_rlps)
+        else:
+            block_jsons = self.fetch_blocks_eth(first, count)
+            ommer_jsons = self.fetch_ommers(
+                {
+                    hex_to_uint(block["number"]): len(block["uncles"])
+                    for block in block_jsons
+                    if not isinstance(block, RpcError)
+                }
+            )
+            if decoding_pool is not None:
+                return decoding_pool.submit(
+                    _decode_json_blocks, block_jsons, ommer_jsons
+                )
+            blocks = BlockDecoder(self.forks).decode_json_blocks(
+                block_jsons, ommer_jsons
+            )
+
+        decoded: "Future[List[Union[Any, RpcError]]]" = Future()
+        decoded.set_result(blocks)
+        return decoded
+
+    def fetch_blocks(
+        self,
+        first: Uint,
+        count: Uint,
+    ) -> List[Union[Any, RpcError]]:
+        """
+        Fetch and decode the blocks `[first, first + count)` from the RPC
+        provider.
+        """
+        return self.fetch_batch(first, count, None).result()
+
+    def post(self, calls: List[Any]) -> Any:
+        """
+        Send a batch of JSON-RPC calls to the RPC provider and return the
+        parsed replies. Every thread keeps its own connection alive between
+        calls.
+        """
+        data = json.dumps(calls).encode("utf-8")
+        url = urlsplit(self.rpc_url)
+        path = url.path or "/"
+        if url.query:
+            path += "?" + url.query
+
+        for attempt in range(2):
+            connection = getattr(self._connections, "connection", None)
+            if connection is None:
+                connection_class: Any = HTTPConnection
+                if url.scheme == "https":
+                    connection_class = HTTPSConnection
+                connection = connection_class(url.netloc)
+                self._connections.connection = connection
+
+            try:
+                connection.request(
+                    "POST",
+                    path,
+                    body=data,
+                    headers={
+                        "Content-Length": str(len(data)),
+                        "Content-Type": "application/json",
+                        "User-Agent": "ethereum-spec-sync",
+                    },
+                )
+                response = connection.getresponse()
+                body = response.read()
+            except (ConnectionError, HTTPException):
+                # The provider may close idle connections, so retry once on
+                # a fresh connection.
+                connection.close()
+                self._connections.connection = None
+                if attempt > 0:
+                    raise
+                continue
+
+            if response.status != 200:
+                raise HTTPException(
+                    f"RPC provider returned status {response.status}"
+                )
+            return json.loads(body)
+
+        raise AssertionError("unreachable")
+
+    def fetch_blocks_debug(
+        self,
+        first: Uint,
+        count: Uint,
+    ) -> List[Union[bytes, RpcError]]:
+        """
+        Fetch the blocks `[first, first + count)` from the RPC provider as
+        RLP encoded byte arrays.
+        """
+        if count == 0:
+            return []
+
+        calls = []
+
+        for number in range(first, first + count):
+            calls.append(
+                {
+                    "jsonrpc": "2.0",
+                    "id": hex(number),
+                    "method": "debug_getRawBlock",
+                    "params": [hex(number)],
+                }
+            )
+
+        self.log.debug("fetching blocks [%d, %d)...", first, first + count)
+
+        replies = self.post(calls)
+        if not isinstance(replies, list):
+            self.log.error(
+                "got non-list JSON-RPC response. replies=%r", replies
+            )
+            raise ValueError
+
+        block_rlps: Dict[Uint, Union[RpcError, bytes]] = {}
+
+        for reply in replies:
+            try:
+                reply_id = Uint(int(reply["id"], 0))
+            except Exception:
+                self.log.exception("unable to parse RPC id. reply=%r", reply)
+                raise
+
+            if reply_id < first or reply_id >= first + count:
+                raise Exception("mismatched request id")
+
+            if "error" in reply:
+                block_rlps[reply_id] = RpcError(
+                    reply["error"]["code"],
+                    reply["error"]["message"],
+                )
+            else:
+                block_rlps[reply_id] = bytes.fromhex(reply["result"][2:])
+
+        if len(block_rlps) != count:
+            raise Exception(
+                f"expected {count} blocks but only got {len(block_rlps)}"
+            )
+
+        self.log.info("blocks [%d, %d) fetched", first, first + count)
+
+        return [v for (_, v) in sorted(block_rlps.items())]
+
     def fetch_blocks_eth(
         self,
         first: Uint,
         count: Uint,
     ) -> List[Union[Any, RpcError]]:
         """
-        Fetch the block specified by the given number from the RPC provider
-        using only standard endpoints.
+        Fetch the blocks `[first, first + count)` from the RPC provider as
+        JSON using only standard endpoints. If the provider doesn't know a
+        block yet, only the blocks before it are returned.
         """
         if count == 0:
             return []
@@ -409,62 +779,41 @@ class BlockDownloader(ForkTracking):
                 }
             )
 
-        data = json.dumps(calls).encode("utf-8")
-
         self.log.debug("fetching blocks [%d, %d)...", first, first + count)
 
-        post = request.Request(
-            self.rpc_url,
-            data=data,
-            headers={
-                "Content-Length": str(len(data)),
-                "Content-Type": "application/json",
-                "User-Agent": "ethereum-spec-sync",
-            },
-        )
+        replies = self.post(calls)
+        blocks: Dict[Uint, Union[Any, RpcError]] = {}
 
-        with request.urlopen(post) as response:
-            replies = json.load(response)
-            block_jsons: Dict[Uint, Any] = {}
-            ommers_needed: Dict[Uint, int] = {}
-            blocks: Dict[Uint, Union[Any, RpcError]] = {}
+        for reply in replies:
+            reply_id = Uint(int(reply["id"], 0))
 
-            for reply in replies:
-                reply_id = Uint(int(reply["id"], 0))
+            if reply_id < first or reply_id >= first + count:
+                raise Exception("mismatched request id")
 
-                if reply_id < first or reply_id >= first + count:
-                    raise Exception("mismatched request id")
-
-                if "error" in reply:
-                    blocks[reply_id] = RpcError(
-                        reply["error"]["code"],
-                        reply["error"]["message"],
-                    )
-                else:
-                    res = reply["result"]
-                    if res is None:
-                        from time import sleep
-
-                        sleep(12)
-                        break
-
-                    block_jsons[reply_id] = res
-                    ommers_needed[reply_id] = len(res["uncles"])
-
-            ommers = self.fetch_ommers(ommers_needed)
-            for id in block_jsons:
-                self.advance_block(hex_to_u256(block_jsons[id]["timestamp"]))
-                blocks[id] = self.make_block(
-                    block_jsons[id], ommers.get(id, ())
+            if "error" in reply:
+                blocks[reply_id] = RpcError(
+                    reply["error"]["code"],
+                    reply["error"]["message"],
                 )
+            else:
+                blocks[reply_id] = reply["result"]
 
-            self.log.info("blocks [%d, %d) fetched", first, first + count)
+        result = []
+        for _, block in sorted(blocks.items()):
+            if block is None:
+                time.sleep(12)
+                break
+            result.append(block)
 
-            return [v for (_, v) in sorted(blocks.items())]
+        self.log.info("blocks [%d, %d) fetched", first, first + count)
 
-    def fetch_ommers(self, ommers_needed: Dict[Uint, int]) -> Dict[Uint, Any]:
+        return result
+
+    def fetch_ommers(
+        self, ommers_needed: Dict[Uint, int]
+    ) -> Dict[Uint, List[Any]]:
         """
-        Fetch the ommers for a given block from the RPC provider.
+        Fetch the ommers of the given blocks from the RPC provider as JSON.
         """
         calls = []
 
@@ -482,117 +831,40 @@ class BlockDownloader(ForkTracking):
         if calls == []:
             return {}
 
-        data = json.dumps(calls).encode("utf-8")
-
         self.log.debug(
             "fetching ommers [%d, %d]...",
             min(ommers_needed),
             max(ommers_needed),
         )
 
-        post = request.Request(
-            self.rpc_url,
-            data=data,
-            headers={
-                "Content-Length": str(len(data)),
-                "Content-Type": "application/json",
-                "User-Agent": "ethereum-spec-sync",
-            },
-        )
-
-        with request.urlopen(post) as response:
-            replies = json.load(response)
-            ommers: Dict[Uint, Dict[Uint, Any]] = {}
+        replies = self.post(calls)
+        ommers: Dict[Uint, Dict[Uint, Any]] = {}
 
-            twenty = Uint(20)
-            for reply in replies:
-                reply_id = Uint(int(reply["id"], 0))
-
-                if reply_id // twenty not in ommers:
-                    ommers[reply_id // twenty] = {}
-
-                if "error" in reply:
-                    raise RpcError(
-                        reply["error"]["code"],
-                        reply["error"]["message"],
-                    )
-                else:
-                    ommers[reply_id // twenty][
-                        reply_id % twenty
-                    ] = self.make_header(reply["result"])
-
-            self.log.info(
-                "ommers [%d, %d] fetched",
-                min(ommers_needed),
-                max(ommers_needed),
-            )
-
-            return {
-                k: tuple(x for (_, x) in sorted(v.items()))
-                for (k, v) in ommers.items()
-            }
-
-    def make_header(self, json: Any) -> Any:
-        """
-        Create a Header object from JSON describing it.
-        """
-        fields = [
-            hex_to_bytes32(json["parentHash"]),
-            hex_to_bytes32(json["sha3Uncles"]),
-            self.module("utils.hexadecimal").hex_to_address(json["miner"]),
-            hex_to_bytes32(json["stateRoot"]),
-            hex_to_bytes32(json["transactionsRoot"]),
-            hex_to_bytes32(json["receiptsRoot"]),
-            Bytes256(hex_to_bytes(json["logsBloom"])),
-            hex_to_uint(json["difficulty"]),
-            hex_to_uint(json["number"]),
-            hex_to_uint(json["gasLimit"]),
-            hex_to_uint(json["gasUsed"]),
-            hex_to_u256(json["timestamp"]),
-            hex_to_bytes(json["extraData"]),
-            hex_to_bytes32(json["mixHash"]),
-            hex_to_bytes8(json["nonce"]),
-        ]
-        if hasattr(self.module("blocks").Header, "base_fee_per_gas"):
-            fields.append(hex_to_uint(json["baseFeePerGas"]))
-        if hasattr(self.module("blocks").Header, "withdrawals_root"):
-            fields.append(hex_to_bytes32(json["withdrawalsRoot"]))
-        return self.module("blocks").Header(*fields)
+        twenty = Uint(20)
+        for reply in replies:
+            reply_id = Uint(int(reply["id"], 0))
 
-    def make_block(self, json: Any, ommers: Any) -> Any:
-        """
-        Create a block from JSON describing it.
-        """
-        header = self.make_header(json)
-        transactions = []
-        for t in json["transactions"]:
-            transactions.append(self.load_transaction(t))
+            if reply_id // twenty not in ommers:
+                ommers[reply_id // twenty] = {}
 
-        if json.get("withdrawals") is not None:
-            withdrawals = []
-            for j in json["withdrawals"]:
-                withdrawals.append(
-                    self.module("blocks").Withdrawal(
-                        hex_to_u64(j["index"]),
-                        hex_to_u64(j["validatorIndex"]),
-                        self.module("utils.hexadecimal").hex_to_address(
-                            j["address"]
-                        ),
-                        hex_to_u256(j["amount"]),
-                    )
+            if "error" in reply:
+                raise RpcError(
+                    reply["error"]["code"],
+                    reply["error"]["message"],
                 )
+            else:
+                ommers[reply_id // twenty][reply_id % twenty] = reply["result"]
 
-        extra_fields = []
-        if hasattr(self.module("blocks").Block, "withdrawals"):
-            extra_fields.append(withdrawals)
-
-        return self.module("blocks").Block(
-            header,
-            tuple(transactions),
-            ommers,
-            *extra_fields,
+        self.log.info(
+            "ommers [%d, %d] fetched",
+            min(ommers_needed),
+            max(ommers_needed),
         )
 
+        return {
+            k: [x for (_, x) in sorted(v.items())] for (k, v) in ommers.items()
+        }
+
     def download_chain_id(self) -> U64:
         """
         Fetch the chain id of the executing chain from the rpc provider.
@@ -605,24 +877,10 @@ class BlockDownloader(ForkTracking):
                 "params": [],
             }
         ]
-        data = json.dumps(call).encode("utf-8")
-
-        post = request.Request(
-            self.rpc_url,
-            data=data,
-            headers={
-                "Content-Length": str(len(data)),
-                "Content-Type": "application/json",
-                "User-Agent": "ethereum-spec-sync",
-            },
-        )
-
-        with request.urlopen(post) as response:
-            reply = json.load(response)[0]
-            assert reply["id"] == hex(2)
-            chain_id = U64(int(reply["result"], 16))
 
-        return chain_id
+        reply = self.post(call)[0]
+        assert reply["id"] == hex(2)
+        return U64(int(reply["result"], 16))
 
 
 class Sync(ForkTracking):
@@ -655,12 +913,49 @@ class Sync(ForkTracking):
             help="store the state in a db in this file",
         )
 
+        parser.add_argument(
+            "--recovery-workers",
+            type=int,
+            default=None,
+            help="recover the signers of the next block on this many"
+            " processes while a block executes, 0 for one per CPU",
+        )
+
+        parser.add_argument(
+            "--ethash-cache",
+            help="with --unoptimized, keep the ethash caches generated by the"
+            " specification and save them in this directory",
+        )
+
         parser.add_argument(
             "--geth",
             help="use geth specific RPC endpoints while fetching blocks",
             action="store_true",
         )
 
+        parser.add_argument(
+            "--fetchers",
+            help="number of block batches to request from the RPC provider"
+            " at once",
+            type=int,
+            default=4,
+        )
+
+        parser.add_argument(
+            "--decoders",
+            help="number of processes decoding fetched blocks (0 to decode"
+            " them on the fetching threads)",
+            type=int,
+            default=2,
+        )
+
+        parser.add_argument(
+            "--batch-size",
+            help="number of blocks requested from the RPC provider at once",
+            type=int,
+            default=128,
+        )
+
         parser.add_argument(
             "--reset",
             help="delete the db and start from scratch",
@@ -722,11 +1017,38 @@ class Sync(ForkTracking):
         if not self.options.unoptimized:
             import ethereum_optimized
 
+            # The optimized forks verify proof-of-work with the ethash
+            # package, which never generates the specification's caches.
+            if self.options.ethash_cache is not None:
+                self.log.error(
+                    "--ethash-cache is only supported with --unoptimized"
+                )
+                exit(1)
+
             ethereum_optimized.monkey_patch(state_path=self.options.persist)
+
+            if self.options.recovery_workers is not None:
+                for fork in Hardfork.discover():
+                    ethereum_optimized.monkey_patch_sender_recovery(
+                        fork.short_name, self.options.recovery_workers or None
+                    )
         else:
+            if self.options.ethash_cache is not None:
+                import ethereum_optimized
+
+                for fork in Hardfork.discover():
+                    if fork.consensus.is_pow():
+                        ethereum_optimized.monkey_patch_ethash_cache(
+                            fork.short_name, self.options.ethash_cache
+                        )
             if self.options.persist is not None:
                 self.log.error("--persist is not supported with --unoptimized")
                 exit(1)
+            if self.options.recovery_workers is not None:
+                self.log.error(
+                    "--recovery-workers is not supported with --unoptimized"
+                )
+                exit(1)
             if self.options.initial_state is not None:
                 self.log.error(
                     "--initial-state is not supported with --unoptimized"
@@ -837,6 +1159,9 @@ class Sync(ForkTracking):
                 self.options.geth,
                 Uint(0),
                 genesis_configuration.timestamp,
+                fetchers=self.options.fetchers,
+                decoders=self.options.decoders,
+                batch_size=self.options.batch_size,
             )
             self.set_block(Uint(0), genesis_configuration.timestamp)
         else:
@@ -852,6 +1177,9 @@ class Sync(ForkTracking):
                 self.options.geth,
                 persisted_block - initial_blocks_length,
                 persisted_block_timestamp,
+                fetchers=self.options.fetchers,
+                decoders=self.options.decoders,
+                batch_size=self.options.batch_size,
             )
             blocks = []
             for _ in range(initial_blocks_length):
@@ -944,12 +1272,31 @@ class Sync(ForkTracking):
 
             self.persist()
 
+        signer_recovery: Optional[Any] = None
+        if self.options.recovery_workers is not None:
+            from ethereum_optimized.signers import SIGNER_RECOVERY
+
+            signer_recovery = SIGNER_RECOVERY
+
+        next_block = self.downloader.take_block()
+        recoveries: List[Any] = []
         while True:
-            block = self.downloader.take_block()
+            block = next_block
 
             if block is None:
                 break
 
+            # Take the next block ahead, so its signers are recovered while
+            # this one is executing.
+            next_block = self.downloader.take_block()
+            next_recoveries: List[Any] = []
+            if signer_recovery is not None and next_block is not None:
+                next_recoveries = signer_recovery.recover_block(
+                    self.active_fork.short_name,
+                    self.chain.chain_id,
+                    next_block.transactions,
+                )
+
             try:
                 self.process_block(block)
             except Exception:
@@ -958,6 +1305,11 @@ class Sync(ForkTracking):
                 )
                 raise
 
+            # Recoveries started for the wrong fork are never used.
+            if signer_recovery is not None:
+                signer_recovery.discard(recoveries)
+            recoveries = next_recoveries
+
             # Additional gas to account for block overhead
             gas_since_last_commit += 30000
             gas_since_last_commit += int(block.header.gas_used)
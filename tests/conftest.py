@@ -15,6 +15,7 @@ from requests_cache import CachedSession
 from requests_cache.backends.sqlite import SQLiteCache
 from typing_extensions import Self
 
+from ethereum_spec_tools.forks import Hardfork
 from tests.helpers import TEST_FIXTURES
 
 try:
@@ -39,6 +40,15 @@ def pytest_addoption(parser: Parser) -> None:
         help="Use optimized state and ethash",
     )
 
+    parser.addoption(
+        "--ethash-cache",
+        dest="ethash_cache",
+        default=False,
+        action="store_const",
+        const=True,
+        help="Generate the ethash cache once per epoch rather than per block",
+    )
+
     parser.addoption(
         "--evm_trace",
         dest="evm_trace",
@@ -58,6 +68,13 @@ def pytest_configure(config: Config) -> None:
 
         ethereum_optimized.monkey_patch(None)
 
+    if config.getoption("ethash_cache"):
+        import ethereum_optimized
+
+        for fork in Hardfork.discover():
+            if fork.consensus.is_pow():
+                ethereum_optimized.monkey_patch_ethash_cache(fork.short_name)
+
     if config.getoption("evm_trace"):
         import ethereum.trace
         from ethereum_spec_tools.evm_tools.t8n.evm_trace import (
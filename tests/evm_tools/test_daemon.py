@@ -0,0 +1,141 @@
+import http.client
+import json
+import socket
+from io import StringIO
+from pathlib import Path
+from threading import Thread, Timer
+from typing import Any, Dict, Iterator, List, Tuple
+
+import pytest
+
+from ethereum_spec_tools.evm_tools import main
+from ethereum_spec_tools.evm_tools.daemon import (
+    _EvmToolHandler,
+    _ThreadingUnixSocketHttpServer,
+    _WorkerPool,
+)
+
+ALLOC = {
+    "0xa94f5374fce5edbc8e2a8697c15331677e6ebf0b": {
+        "balance": "0x0de0b6b3a7640000",
+        "nonce": "0x0",
+    },
+}
+
+ENV = {
+    "currentCoinbase": "0x2adc25665018aa1fe0e6bc666dac8fc2697ff9ba",
+    "currentDifficulty": "0x20000",
+    "currentGasLimit": "0x05f5e100",
+    "currentNumber": "0x01",
+    "currentTimestamp": "0x03e8",
+    "blockHashes": {"0x00": "0x" + "00" * 32},
+    "ommers": [],
+}
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str) -> None:
+        super().__init__("localhost")
+        self.path = path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+def request(uds: str, reward: int) -> Tuple[int, str]:
+    body = json.dumps(
+        {
+            "state": {"fork": "Frontier", "chainid": 1, "reward": reward},
+            "input": {"alloc": ALLOC, "env": ENV, "txs": []},
+        }
+    )
+    connection = _UnixHTTPConnection(uds)
+    connection.request("POST", "/", body)
+    response = connection.getresponse()
+    return response.status, response.read().decode("utf-8")
+
+
+def t8n_args(reward: int) -> List[str]:
+    return [
+        "t8n",
+        "--input.env=stdin",
+        "--input.alloc=stdin",
+        "--input.txs=stdin",
+        "--output.result=stdout",
+        "--output.body=stdout",
+        "--output.alloc=stdout",
+        "--state.fork=Frontier",
+        "--state.chainid=1",
+        f"--state.reward={reward}",
+    ]
+
+
+def expected_output(reward: int) -> Dict[str, Any]:
+    out_file = StringIO()
+    main(
+        args=t8n_args(reward),
+        out_file=out_file,
+        in_file=StringIO(json.dumps({"alloc": ALLOC, "env": ENV, "txs": []})),
+    )
+    return json.loads(out_file.getvalue())
+
+
+@pytest.fixture
+def daemon(request: Any, tmp_path: Path) -> Iterator[str]:
+    request_timeout = getattr(request, "param", 0)
+    uds = str(tmp_path / "daemon.sock")
+    pool = _WorkerPool(2, 4, request_timeout)
+    server = _ThreadingUnixSocketHttpServer(
+        uds, _EvmToolHandler, shutdown_timeout=0, pool=pool
+    )
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield uds
+    finally:
+        server.shutdown()
+        server.server_close()
+        pool.close()
+
+
+def test_concurrent_requests(daemon: str) -> None:
+    rewards = list(range(6))
+    results: List[Tuple[int, str]] = [(0, "")] * len(rewards)
+
+    def send(index: int) -> None:
+        results[index] = request(daemon, rewards[index])
+
+    threads = [Thread(target=send, args=(i,)) for i in range(len(rewards))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for reward, (status, output) in zip(rewards, results):
+        assert status == 200
+        assert json.loads(output) == expected_output(reward)
+
+
+@pytest.mark.parametrize("daemon", [0.001], indirect=True)
+def test_request_timeout(daemon: str) -> None:
+    status, _ = request(daemon, 0)
+    assert status == 504
+
+
+def test_request_timeout_excludes_queue() -> None:
+    pool = _WorkerPool(1, 4, 2.0)
+    try:
+        # Keep the only worker busy for longer than the request timeout.
+        worker = pool._idle.get()
+        timer = Timer(2.5, pool._idle.put, args=(worker,))
+        timer.start()
+        output = pool.run(
+            t8n_args(0),
+            json.dumps({"alloc": ALLOC, "env": ENV, "txs": []}),
+        )
+        timer.join()
+    finally:
+        pool.close()
+
+    assert json.loads(output) == expected_output(0)
@@ -0,0 +1,152 @@
+import json
+from io import StringIO
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import pytest
+
+from ethereum_spec_tools.evm_tools import create_parser, statetest
+from ethereum_spec_tools.evm_tools.statetest import StateTest
+
+SENDER_KEY = (
+    "0x45a915e4d060149eb4365960e6a7a45f334393093061116b197e3240065ff2d8"
+)
+CONTRACT = "0x" + "aa" * 20
+
+# Stores the calldata at slot zero, then logs it.
+CODE = "0x6000356000556020600060003760206000a0"
+
+
+def state_test(name: str, values: int) -> Dict[str, Any]:
+    post = [
+        {
+            "hash": "0x" + "00" * 32,
+            "indexes": {"data": i, "gas": 0, "value": i % values},
+        }
+        for i in range(3)
+    ]
+    return {
+        name: {
+            "env": {
+                "currentCoinbase": "0x" + "c0" * 20,
+                "currentDifficulty": "0x020000",
+                "currentGasLimit": "0x05f5e100",
+                "currentNumber": "0x01",
+                "currentTimestamp": "0x03e8",
+                "currentBaseFee": "0x0a",
+                "currentRandom": "0x" + "00" * 32,
+                "currentExcessBlobGas": "0x00",
+            },
+            "pre": {
+                "0xa94f5374fce5edbc8e2a8697c15331677e6ebf0b": {
+                    "balance": "0x0de0b6b3a7640000",
+                    "code": "0x",
+                    "nonce": "0x00",
+                    "storage": {},
+                },
+                CONTRACT: {
+                    "balance": "0x00",
+                    "code": CODE,
+                    "nonce": "0x01",
+                    "storage": {},
+                },
+            },
+            "transaction": {
+                "data": ["0x01", "0x02", "0x" + "ff" * 32],
+                "gasLimit": ["0x0186a0"],
+                "gasPrice": "0x0a",
+                "nonce": "0x00",
+                "secretKey": SENDER_KEY,
+                "to": CONTRACT,
+                "value": [hex(v) for v in range(values)],
+            },
+            "post": {"Cancun": post, "Shanghai": post[:1]},
+        }
+    }
+
+
+def state_tests(
+    paths: List[str], workers: int, *extra: str
+) -> Tuple[StateTest, StringIO]:
+    options = create_parser().parse_args(
+        ["statetest", "--json", "--workers", str(workers), *extra]
+    )
+    out_file = StringIO()
+    in_file = StringIO("".join(path + "\n" for path in paths))
+    return StateTest(options, out_file, in_file), out_file
+
+
+def run(paths: List[str], workers: int, capsys: Any, *extra: str) -> Any:
+    tests, out_file = state_tests(paths, workers, *extra)
+    assert tests.run_many() == 0
+    return out_file.getvalue(), capsys.readouterr().err
+
+
+def test_parallel_output_matches_serial(tmp_path: Path, capsys: Any) -> None:
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"test_{i}.json"
+        path.write_text(json.dumps(state_test(f"test_{i}", i + 1)))
+        paths.append(str(path))
+
+    serial = run(paths, 0, capsys)
+    parallel = run(paths, 3, capsys)
+    # The workers apply the optimizations, this process doesn't.
+    optimized = run(paths, 2, capsys, "--optimized")
+
+    assert serial == parallel == optimized
+
+    out, err = serial
+    assert err.count("stateRoot") == 12
+    assert err.count('"opName":"SSTORE"') == 12
+    names = [name for name in out.split() if name.startswith('"test_')]
+    assert names == [f'"test_{i}",' for i in range(3) for _ in range(4)]
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_missing_file(tmp_path: Path, workers: int) -> None:
+    path = tmp_path / "test.json"
+    path.write_text(json.dumps(state_test("test", 1)))
+    missing = str(tmp_path / "missing.json")
+
+    tests, out_file = state_tests([str(path), missing], workers)
+    with pytest.raises(FileNotFoundError):
+        tests.run_many()
+    # The results of the files before the missing one are still written.
+    assert out_file.getvalue().count('"name": "test"') == 4
+
+
+def test_worker_parses_file_once(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    path = tmp_path / "test.json"
+    path.write_text(json.dumps(state_test("test", 1)))
+    tests, _ = state_tests([], 1)
+    task = (str(path), tests.t8n_extra(), tests.supported_forks)
+
+    parsed = []
+    read_test_cases = statetest.read_test_cases
+
+    def recording_read_test_cases(path: str) -> Any:
+        parsed.append(path)
+        return read_test_cases(path)
+
+    monkeypatch.setattr(
+        statetest, "read_test_cases", recording_read_test_cases
+    )
+    monkeypatch.setattr(statetest, "_worker_files", statetest.OrderedDict())
+
+    count, first = statetest._start_in_worker(task)
+    assert count == 4
+    assert first is not None and first[1]["fork"] == "Cancun"
+    for index in range(1, count):
+        _, result_dict = statetest._run_in_worker((task[0], index, *task[1:]))
+        assert result_dict["name"] == "test"
+    assert parsed == [str(path)]
+
+    # Files with no supported test cases are started without running any.
+    unsupported = state_test("unsupported", 1)
+    unsupported["unsupported"]["post"] = {"Paris2": []}
+    path.write_text(json.dumps(unsupported))
+    statetest._worker_files.clear()
+    assert statetest._start_in_worker(task) == (0, None)
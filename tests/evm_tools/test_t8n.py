@@ -0,0 +1,329 @@
+import json
+import multiprocessing
+from importlib import import_module
+from io import StringIO
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Tuple, cast
+
+import pytest
+from ethereum_types.bytes import Bytes32
+from ethereum_types.numeric import U256
+
+from ethereum import trace
+from ethereum.shanghai.fork_types import Address
+from ethereum.utils.hexadecimal import hex_to_bytes
+from ethereum_spec_tools.evm_tools import create_parser
+from ethereum_spec_tools.evm_tools.t8n import T8N
+from ethereum_spec_tools.forks import Hardfork
+
+SENDER_KEY = (
+    "0x45a915e4d060149eb4365960e6a7a45f334393093061116b197e3240065ff2d8"
+)
+SENDER = "0xa94f5374fce5edbc8e2a8697c15331677e6ebf0b"
+CALLER = "0x" + "aa" * 20
+REVERTER = "0x" + "bb" * 20
+
+# Stores one at slot zero, then calls `REVERTER`.
+CALLER_CODE = (
+    "0x600160005560006000600060006000" + "73" + "bb" * 20 + "5af15000"
+)
+
+# Stores two at slot zero, then reverts.
+REVERTER_CODE = "0x6002600055" + "60006000fd"
+
+ENV = {
+    "currentCoinbase": "0x" + "c0" * 20,
+    "currentDifficulty": "0x00",
+    "currentGasLimit": "0x05f5e100",
+    "currentNumber": "0x01",
+    "currentTimestamp": "0x03e8",
+    "currentBaseFee": "0x0a",
+    "currentRandom": "0x" + "00" * 32,
+    "blockHashes": {"0": "0x" + "00" * 32},
+    "withdrawals": [],
+}
+
+
+@pytest.fixture(autouse=True)
+def untraced() -> Iterator[None]:
+    # Tracers set by other tests stay installed.
+    tracer = trace.set_evm_trace(trace.discard_evm_trace)
+    try:
+        yield
+    finally:
+        trace.set_evm_trace(tracer)
+
+
+def transition(
+    alloc: Dict[str, Any], nonces: List[int], extra: List[str]
+) -> T8N:
+    options = create_parser().parse_args(
+        [
+            "t8n",
+            "--input.alloc=stdin",
+            "--input.env=stdin",
+            "--input.txs=stdin",
+            "--state.fork=Shanghai",
+            *extra,
+        ]
+    )
+    txs = [
+        {
+            "input": "0x",
+            "gas": "0x0186a0",
+            "gasPrice": "0x0a",
+            "nonce": hex(nonce),
+            "secretKey": SENDER_KEY,
+            "to": CALLER,
+            "value": "0x00",
+        }
+        for nonce in nonces
+    ]
+    stdin = {"alloc": alloc, "env": ENV, "txs": txs}
+    t8n = T8N(options, StringIO(), StringIO(json.dumps(stdin)))
+    t8n.run_blockchain_test()
+    return t8n
+
+
+def alloc(accounts: int) -> Dict[str, Any]:
+    alloc: Dict[str, Any] = {
+        SENDER: {"balance": "0x0de0b6b3a7640000", "nonce": "0x00"},
+        CALLER: {"balance": "0x00", "code": CALLER_CODE, "nonce": "0x01"},
+        REVERTER: {"balance": "0x00", "code": REVERTER_CODE, "nonce": "0x01"},
+    }
+    for index in range(accounts):
+        alloc["0x" + index.to_bytes(20, "big").hex()] = {
+            "balance": "0x01",
+            "storage": {"0x01": "0x01"},
+        }
+    return alloc
+
+
+def in_child(function: Callable[..., Any], *args: Any) -> Any:
+    # Patches applied by `--optimized` stay in the child process.
+    with multiprocessing.get_context("fork").Pool(1) as pool:
+        return pool.apply(function, args)
+
+
+def streamed() -> bool:
+    """
+    Whether the interpreter runs from the optimized instruction stream.
+    """
+    interpreter = cast(Any, import_module("ethereum.shanghai.vm.interpreter"))
+    return interpreter.execute_code.__module__ == (
+        "ethereum_optimized.instruction_stream"
+    )
+
+
+def optimized_transition(
+    alloc: Dict[str, Any], nonces: List[int]
+) -> Tuple[bytes, bool, bool, bool]:
+    t8n = transition(alloc, nonces, ["--optimized"])
+    state = t8n.alloc.state
+    return (
+        t8n.result.state_root,
+        hasattr(state, "_journal"),
+        getattr(state._main_trie, "_cache", None) is not None,
+        streamed(),
+    )
+
+
+def test_optimized_state() -> None:
+    nonces = [0, 1, 2]
+    expected = transition(alloc(3), nonces, []).result.state_root
+
+    state_root, journaled, cached, stream = in_child(
+        optimized_transition, alloc(3), nonces
+    )
+    assert journaled
+    assert cached
+    assert stream
+    assert state_root == expected
+
+
+def traced_transition(extra: List[str], basedir: str) -> Tuple[bytes, bool]:
+    t8n = transition(
+        alloc(3), [0, 1], ["--trace", f"--output.basedir={basedir}", *extra]
+    )
+    return t8n.result.state_root, streamed()
+
+
+def traced_after_untraced(basedir: str) -> Tuple[bytes, bool]:
+    optimized_transition(alloc(3), [0])
+    return traced_transition(["--optimized"], basedir)
+
+
+def read_traces(basedir: Path) -> List[str]:
+    return [path.read_text() for path in sorted(basedir.glob("trace-*.jsonl"))]
+
+
+def test_optimized_trace(tmp_path: Path) -> None:
+    for name in ("spec", "optimized", "installed"):
+        (tmp_path / name).mkdir()
+    expected = traced_transition([], str(tmp_path / "spec"))
+
+    # Traced transitions keep the specification's interpreter.
+    assert (
+        in_child(
+            traced_transition, ["--optimized"], str(tmp_path / "optimized")
+        )
+        == expected
+    )
+    assert not expected[1]
+    traces = read_traces(tmp_path / "spec")
+    assert len(traces) == 2
+    assert read_traces(tmp_path / "optimized") == traces
+
+    # Once installed, the instruction stream hands traced code to the
+    # specification's interpreter.
+    state_root, stream = in_child(
+        traced_after_untraced, str(tmp_path / "installed")
+    )
+    assert stream
+    assert state_root == expected[0]
+    assert read_traces(tmp_path / "installed") == traces
+
+
+def test_rejected_transaction() -> None:
+    # The second transaction's nonce is too high.
+    nonces = [0, 5, 1]
+    spec = transition(alloc(3), nonces, [])
+    assert list(spec.txs.rejected_txs) == [1]
+
+    state_root, _, _, _ = in_child(optimized_transition, alloc(3), nonces)
+    assert state_root == spec.result.state_root
+
+
+def checkpoint(accounts: int) -> Tuple[int, int, bool]:
+    """
+    Write to the state of an optimized transition after a checkpoint, and
+    restore it. Returns the number of tries copied, the number of journal
+    entries undone, and whether the state is back to what it was.
+    """
+    t8n = transition(alloc(accounts), [0], ["--optimized"])
+    state = t8n.alloc.state
+    state_mod = cast(Any, import_module("ethereum.shanghai.state"))
+    trie_mod = cast(Any, import_module("ethereum.shanghai.trie"))
+
+    main = dict(state._main_trie._data)
+    storage = {a: dict(t._data) for a, t in state._storage_tries.items()}
+    state_root = state_mod.state_root(state)
+
+    copies = 0
+    copy_trie = trie_mod.copy_trie
+
+    def counting_copy_trie(trie: Any) -> Any:
+        nonlocal copies
+        copies += 1
+        return copy_trie(trie)
+
+    trie_mod.copy_trie = counting_copy_trie
+
+    caller = Address(hex_to_bytes(CALLER))
+    account = Address(bytes(20))
+    t8n.backup_state()
+    state_mod.set_storage(state, caller, Bytes32(bytes(32)), U256(7))
+    state_mod.set_storage(
+        state, account, Bytes32(bytes(31) + b"\x01"), U256(0)
+    )
+    state_mod.destroy_storage(state, caller)
+    state_mod.set_account(state, account, None)
+    entries = len(state._journal)
+    t8n.restore_state()
+
+    restored = (
+        state._main_trie._data == main
+        and {a: t._data for a, t in state._storage_tries.items()} == storage
+        and state_mod.state_root(state) == state_root
+    )
+    return copies, entries, restored
+
+
+def test_checkpoint_cost() -> None:
+    # Checkpoints copy nothing, and undoing one only touches what was
+    # written, however large the state is.
+    assert in_child(checkpoint, 3) == (0, 4, True)
+    assert in_child(checkpoint, 300) == (0, 4, True)
+
+
+def shared_code(extra: List[str]) -> bool:
+    """
+    Whether two accounts given the same code in the alloc share it.
+    """
+    accounts = alloc(0)
+    accounts[CALLER]["code"] = REVERTER_CODE
+    t8n = transition(accounts, [], extra)
+    state_mod = cast(Any, import_module("ethereum.shanghai.state"))
+    caller, reverter = (
+        state_mod.get_account(t8n.alloc.state, Address(hex_to_bytes(a)))
+        for a in (CALLER, REVERTER)
+    )
+    return caller.code is reverter.code
+
+
+def test_shared_code() -> None:
+    assert not shared_code([])
+    assert in_child(shared_code, ["--optimized"])
+
+
+def swept_transition() -> Tuple[bytes, int]:
+    """
+    Run an optimized transition, counting the tries whose first root is
+    built in one sweep.
+    """
+    trie_cache = cast(Any, import_module("ethereum_optimized.trie_cache"))
+    sweeps = 0
+    stack_trie = trie_cache.StackTrie
+
+    def counting_stack_trie(*args: Any) -> Any:
+        nonlocal sweeps
+        sweeps += 1
+        return stack_trie(*args)
+
+    trie_cache.StackTrie = counting_stack_trie
+    t8n = transition(alloc(3), [0, 1], ["--optimized"])
+    return t8n.result.state_root, sweeps
+
+
+def test_first_root_swept() -> None:
+    expected = transition(alloc(3), [0, 1], []).result.state_root
+    state_root, sweeps = in_child(swept_transition)
+    assert state_root == expected
+    # The main trie and the storage tries.
+    assert sweeps >= 4
+
+
+def ordered_transition() -> Tuple[bytes, bytes, bool]:
+    """
+    Run an optimized transition, and check whether its block's ordered
+    tries are built as they are written.
+    """
+    t8n = transition(alloc(3), [0, 1, 2], ["--optimized"])
+    block_output = t8n.fork.BlockOutput()
+    return (
+        t8n.result.tx_root,
+        t8n.result.receipt_root,
+        block_output.transactions_trie._stack_trie is not None,
+    )
+
+
+def test_ordered_tries() -> None:
+    spec = transition(alloc(3), [0, 1, 2], []).result
+    assert in_child(ordered_transition) == (
+        spec.tx_root,
+        spec.receipt_root,
+        True,
+    )
+
+
+def test_setup_not_repeated(monkeypatch: pytest.MonkeyPatch) -> None:
+    transition(alloc(0), [0], [])
+
+    def discover() -> None:
+        raise AssertionError("forks discovered again")
+
+    # Later transitions, such as the daemon's requests, reuse the parser and
+    # the discovered forks.
+    monkeypatch.setattr(Hardfork, "discover", discover)
+    assert create_parser() is create_parser()
+    transition(alloc(0), [0], [])
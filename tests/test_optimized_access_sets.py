@@ -0,0 +1,98 @@
+from dataclasses import fields
+from types import SimpleNamespace
+from typing import Any
+
+from ethereum_types.numeric import Uint
+
+from ethereum_optimized.access_sets import (
+    MAX_LAYERS,
+    AccessSet,
+    get_access_set_patches,
+)
+
+A = b"\x0a" * 20
+B = b"\x0b" * 20
+C = b"\x0c" * 20
+
+
+def test_child_layers() -> None:
+    root = AccessSet([A])
+    child = root.copy()
+    child.add(B)
+    assert A in child and B in child
+    assert B not in root
+
+    # A reverted child is dropped without touching its parent.
+    reverted = root.copy()
+    reverted.add(C)
+    assert C not in root
+
+    # A successful child is merged into its parent.
+    grandchild = child.copy()
+    grandchild.add(C)
+    child.update(grandchild)
+    root.update(child)
+    assert set(root) == {A, B, C}
+    assert len(root) == 3
+    assert set(root._entries) == {A, B, C}
+
+
+def test_update_from_other_sets() -> None:
+    access_set = AccessSet([A])
+    access_set.update([B])
+    assert set(access_set) == {A, B}
+    # A layer copied from another set brings the entries below it along.
+    access_set.update(AccessSet([C]).copy())
+    assert set(access_set) == {A, B, C}
+
+
+def test_deep_nesting_is_flattened() -> None:
+    access_set = AccessSet([A])
+    for i in range(3 * MAX_LAYERS):
+        access_set = access_set.copy()
+        access_set.add(i.to_bytes(20, "big"))
+        assert access_set._layers <= MAX_LAYERS
+    assert A in access_set
+    assert set(access_set) == {A} | {
+        i.to_bytes(20, "big") for i in range(3 * MAX_LAYERS)
+    }
+
+
+def new_evm(evm_class: Any, **overrides: Any) -> Any:
+    values = dict(
+        pc=Uint(0),
+        stack=[],
+        memory=bytearray(),
+        code=b"",
+        gas_left=Uint(0),
+        valid_jump_destinations=set(),
+        logs=(),
+        refund_counter=0,
+        running=True,
+        message=SimpleNamespace(),
+        output=b"",
+        accounts_to_delete=set(),
+        touched_accounts=set(),
+        return_data=b"",
+        error=None,
+        accessed_addresses={A},
+        accessed_storage_keys={(A, b"\x00" * 32)},
+    )
+    values.update(overrides)
+    names = {f.name for f in fields(evm_class)}
+    return evm_class(**{k: v for k, v in values.items() if k in names})
+
+
+def test_evm() -> None:
+    assert get_access_set_patches("istanbul") == {}
+
+    evm = new_evm(get_access_set_patches("prague")["Evm"])
+    assert isinstance(evm.accessed_addresses, AccessSet)
+    assert isinstance(evm.accessed_storage_keys, AccessSet)
+    assert A in evm.accessed_addresses
+    assert (A, b"\x00" * 32) in evm.accessed_storage_keys
+
+    # The layer handed to a child message is kept by the child's `Evm`.
+    layer = evm.accessed_addresses.copy()
+    child = new_evm(type(evm), accessed_addresses=layer)
+    assert child.accessed_addresses is layer
@@ -0,0 +1,174 @@
+from dataclasses import replace
+from typing import Any, List, Tuple
+
+import pytest
+from ethereum_rlp import rlp
+from ethereum_types.bytes import Bytes8, Bytes32
+from ethereum_types.numeric import U64, U256, Uint
+
+import ethereum.london.fork as london_fork
+from ethereum.crypto.hash import Hash32, keccak256
+from ethereum.exceptions import InvalidBlock
+from ethereum.london.blocks import Block, Header
+from ethereum.london.fork_types import Address, Bloom
+from ethereum.london.state import State
+from ethereum_optimized.block_history import (
+    BlockHistory,
+    get_block_history_patches,
+)
+
+
+def header(
+    number: int,
+    parent_hash: Hash32,
+    ommers: Tuple[Header, ...] = (),
+    extra_data: bytes = b"",
+) -> Header:
+    return Header(
+        parent_hash=parent_hash,
+        ommers_hash=keccak256(rlp.encode(ommers)),
+        coinbase=Address(b"\x00" * 20),
+        state_root=Bytes32(b"\x00" * 32),
+        transactions_root=Bytes32(b"\x00" * 32),
+        receipt_root=Bytes32(b"\x00" * 32),
+        bloom=Bloom(b"\x00" * 256),
+        difficulty=Uint(1),
+        number=Uint(number),
+        gas_limit=Uint(30000000),
+        gas_used=Uint(0),
+        timestamp=U256(number),
+        extra_data=extra_data,
+        mix_digest=Bytes32(b"\x00" * 32),
+        nonce=Bytes8(b"\x00" * 8),
+        base_fee_per_gas=Uint(7),
+    )
+
+
+def block_hash(block: Block) -> Hash32:
+    return keccak256(rlp.encode(block.header))
+
+
+def make_chain(length: int, ommers_at: int) -> List[Block]:
+    """
+    Build a chain whose block number `ommers_at` includes an ommer.
+    """
+    blocks: List[Block] = []
+    parent_hash = Hash32(b"\x00" * 32)
+    for number in range(length):
+        ommers: Tuple[Header, ...] = ()
+        if number == ommers_at:
+            ommers = (
+                header(number - 1, block_hash(blocks[-2]), extra_data=b"o"),
+            )
+        block = Block(
+            header=header(number, parent_hash, ommers),
+            transactions=(),
+            ommers=ommers,
+        )
+        blocks.append(block)
+        parent_hash = block_hash(block)
+    return blocks
+
+
+def test_history() -> None:
+    blocks = make_chain(10, -1)
+    history = BlockHistory(blocks, max_blocks=4)
+    spec_chain: Any = london_fork.BlockChain(blocks[-4:], State(), U64(1))
+    patches = get_block_history_patches("london")
+    patched_chain = patches["BlockChain"](history, State(), U64(1))
+
+    assert len(history) == 4
+    assert [entry.header for entry in history] == [
+        block.header for block in blocks[-4:]
+    ]
+    assert history[-1].hash == block_hash(blocks[-1])
+    assert [entry.header for entry in history[-2:]] == [
+        block.header for block in blocks[-2:]
+    ]
+    assert history.find(block_hash(blocks[5])) is None
+    found = history.find(block_hash(blocks[6]))
+    assert found is not None and found.header == blocks[6].header
+    assert history.is_recent(found, 4) and not history.is_recent(found, 3)
+    assert patches["get_last_256_block_hashes"](patched_chain) == (
+        london_fork.get_last_256_block_hashes(spec_chain)
+    )
+    assert BlockHistory().block_hashes() == []
+
+    with pytest.raises(ValueError):
+        BlockHistory(max_blocks=0)
+
+
+def test_block_chain() -> None:
+    patches = get_block_history_patches("london")
+    blocks = make_chain(300, -1)
+    chain = patches["BlockChain"](blocks[:1], State(), U64(1))
+    assert isinstance(chain, london_fork.BlockChain)
+    assert isinstance(chain.blocks, BlockHistory)
+
+    for block in blocks[1:]:
+        chain.blocks.append(block)
+    assert len(chain.blocks) == 255
+    assert chain.blocks[0].header == blocks[45].header
+    assert not hasattr(chain.blocks[0], "transactions")
+
+
+def outcome(validate_ommers: Any, block: Block, chain: Any) -> Any:
+    try:
+        validate_ommers(block.ommers, block.header, chain)
+    except InvalidBlock:
+        return InvalidBlock
+    return None
+
+
+def test_validate_ommers(monkeypatch: pytest.MonkeyPatch) -> None:
+    # Ommers here are only checked against the chain.
+    monkeypatch.setattr(london_fork, "validate_header", lambda *_: None)
+    patches = get_block_history_patches("london")
+    blocks = make_chain(20, 16)
+    chain = blocks[:-1]
+    parent = chain[-1]
+    number = len(chain)
+
+    def child(*ommers: Header) -> Block:
+        return Block(
+            header=header(number, block_hash(parent), ommers),
+            transactions=(),
+            ommers=ommers,
+        )
+
+    def ommer(depth: int, extra_data: bytes = b"x") -> Header:
+        return header(
+            number - depth,
+            block_hash(chain[-depth - 1]),
+            extra_data=extra_data,
+        )
+
+    cases = [
+        child(),
+        child(ommer(1)),
+        child(ommer(2), ommer(6, b"y")),
+        # Too old, or a sibling of the block itself.
+        child(ommer(7)),
+        child(header(number, block_hash(parent), extra_data=b"x")),
+        # Twice, more than twice, or already included.
+        child(ommer(2), ommer(2)),
+        child(ommer(2), ommer(3), ommer(4)),
+        child(blocks[16].ommers[0]),
+        # Canonical.
+        child(chain[-2].header),
+        # Not the ommers in the header.
+        replace(child(ommer(2)), ommers=(ommer(3),)),
+    ]
+    outcomes = [None, None, None] + [InvalidBlock] * (len(cases) - 3)
+
+    spec_chain: Any = london_fork.BlockChain(chain, State(), U64(1))
+    patched_chain: Any = patches["BlockChain"](chain, State(), U64(1))
+    for block, expected in zip(cases, outcomes):
+        assert outcome(london_fork.validate_ommers, block, spec_chain) == (
+            expected
+        )
+        assert outcome(
+            patches["validate_ommers"], block, patched_chain
+        ) == outcome(london_fork.validate_ommers, block, spec_chain)
+
+    assert "validate_ommers" not in get_block_history_patches("paris")
@@ -0,0 +1,121 @@
+import random
+from types import SimpleNamespace
+from typing import Any, List
+
+import pytest
+from ethereum_types.numeric import Uint
+from py_ecc.optimized_bls12_381.optimized_curve import (
+    G1,
+    G2,
+    Z1,
+    add,
+    curve_order,
+    multiply,
+    neg,
+    normalize,
+)
+
+from ethereum.prague.vm.exceptions import InvalidParameter
+from ethereum.prague.vm.precompiled_contracts.bls12_381 import (
+    bls12_381_g1 as g1,
+)
+from ethereum.prague.vm.precompiled_contracts.bls12_381 import (
+    bls12_381_g2 as g2,
+)
+from ethereum.prague.vm.precompiled_contracts.bls12_381 import (
+    g1_to_bytes,
+    g2_to_bytes,
+)
+from ethereum_optimized.bls12_381_msm import (
+    get_bls12_381_msm_patches,
+    pippenger,
+    signed_digits,
+    window_count,
+)
+
+optimized = get_bls12_381_msm_patches("prague")
+
+
+def naive(points: List[Any], scalars: List[int]) -> Any:
+    result = multiply(points[0], 0)
+    for point, scalar in zip(points, scalars):
+        result = add(result, multiply(point, scalar))
+    return result
+
+
+@pytest.mark.parametrize("size", [2, 3, 5, 8])
+def test_signed_digits(size: int) -> None:
+    rng = random.Random(size)
+    for _ in range(50):
+        scalar = rng.randrange(2**256)
+        windows = window_count(scalar.bit_length(), size)
+        digits = signed_digits(scalar, size, windows)
+        assert sum(d << (size * i) for i, d in enumerate(digits)) == scalar
+        assert all(-(2 ** (size - 1)) <= d < 2 ** (size - 1) for d in digits)
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 7, 20])
+def test_matches_naive_g1(count: int) -> None:
+    rng = random.Random(count)
+    points = [multiply(G1, rng.randrange(1, 1000)) for _ in range(count)]
+    scalars = [rng.randrange(2**256) for _ in range(count)]
+    # Repeated and cancelling points and special scalars.
+    points[0] = points[-1]
+    scalars[0] = rng.choice([0, 1, curve_order, curve_order - 1])
+
+    assert normalize(pippenger(points, scalars)) == normalize(
+        naive(points, scalars)
+    )
+
+
+def test_matches_naive_g2() -> None:
+    rng = random.Random(2)
+    points = [multiply(G2, rng.randrange(1, 1000)) for _ in range(6)]
+    scalars = [rng.randrange(2**256) for _ in range(6)]
+    assert normalize(pippenger(points, scalars)) == normalize(
+        naive(points, scalars)
+    )
+
+
+def test_infinity() -> None:
+    point = multiply(G1, 5)
+    cases = [
+        ([point], [0]),
+        ([point, neg(point)], [3, 3]),
+        ([Z1, point], [4, curve_order]),
+    ]
+    for points, scalars in cases:
+        assert g1_to_bytes(pippenger(points, scalars)) == b"\x00" * 128
+
+
+def run(precompile: Any, data: bytes) -> SimpleNamespace:
+    evm = SimpleNamespace(
+        message=SimpleNamespace(data=data), gas_left=Uint(10**9), output=b""
+    )
+    precompile(evm)
+    return evm
+
+
+@pytest.mark.parametrize("count", [1, 4, 9])
+def test_precompiles_match_spec(count: int) -> None:
+    rng = random.Random(count)
+    g1_data = b""
+    g2_data = b""
+    for _ in range(count):
+        scalar = rng.randrange(2**256).to_bytes(32, "big")
+        g1_data += g1_to_bytes(multiply(G1, rng.randrange(curve_order)))
+        g1_data += scalar
+        g2_data += g2_to_bytes(multiply(G2, rng.randrange(curve_order)))
+        g2_data += scalar
+
+    for name, spec, data in (
+        ("bls12_g1_msm", g1.bls12_g1_msm, g1_data),
+        ("bls12_g2_msm", g2.bls12_g2_msm, g2_data),
+    ):
+        expected = run(spec, data)
+        actual = run(optimized[name], data)
+        assert actual.output == expected.output
+        assert actual.gas_left == expected.gas_left
+
+        with pytest.raises(InvalidParameter):
+            run(optimized[name], data[:-1])
@@ -0,0 +1,119 @@
+from typing import Any
+
+import pytest
+from ethereum_types.numeric import U256, Uint
+
+import ethereum.prague.state as prague_state
+from ethereum.crypto.hash import Hash32, keccak256
+from ethereum.prague.fork_types import Account, encode_account
+from ethereum_optimized import code_store
+from ethereum_optimized.code_store import CodeStore, get_code_store_patches
+
+PROXY = bytes.fromhex("363d3d373d3d3d363d73") + b"\xaa" * 20
+
+
+def test_store() -> None:
+    store = CodeStore(max_bytes=len(PROXY) + 1)
+    first = store.add(bytes(bytearray(PROXY)))
+    assert store.add(bytes(bytearray(PROXY))) is first
+    assert store.code_hash(bytes(bytearray(PROXY))) == keccak256(PROXY)
+    assert store.get(keccak256(PROXY)) is first
+    assert store.code_hash(b"") == keccak256(b"")
+    assert store.get(keccak256(b"")) == b""
+    assert store.add(bytearray(PROXY)) is first
+    assert len(store) == 1
+
+    store.add(b"\x00")
+    assert len(store) == 2
+    assert store.size == len(PROXY) + 1
+    store.add(b"\x01")
+    assert len(store) == 2
+    assert store.size == 2
+    assert store.get(keccak256(PROXY)) is None
+    assert store.add(bytes(bytearray(PROXY))) is not first
+
+    store.clear()
+    assert len(store) == 0
+    assert store.size == 0
+
+
+def test_large_code_kept() -> None:
+    store = CodeStore(max_bytes=4)
+    store.add(b"\x00")
+    code = store.add(PROXY)
+    assert len(store) == 1
+    assert store.get(keccak256(PROXY)) is code
+
+
+def test_stored_code_not_rehashed(monkeypatch: pytest.MonkeyPatch) -> None:
+    hashed = []
+
+    def recording_keccak256(code: bytes) -> Hash32:
+        hashed.append(code)
+        return keccak256(code)
+
+    monkeypatch.setattr(code_store, "keccak256", recording_keccak256)
+    store = CodeStore()
+    code = store.add(bytes(bytearray(PROXY)))
+    for _ in range(3):
+        assert store.code_hash(code) == keccak256(PROXY)
+    assert hashed == [PROXY]
+
+    # An equal copy finds the stored one without hashing it.
+    assert store.add(bytes(bytearray(PROXY))) is code
+    assert store.code_hash(bytearray(PROXY)) == keccak256(PROXY)
+    assert hashed == [PROXY]
+
+
+def test_invalid_size() -> None:
+    with pytest.raises(ValueError, match="max_bytes"):
+        CodeStore(max_bytes=0)
+
+
+@pytest.mark.parametrize("fork", ["frontier", "prague"])
+def test_encode_account(fork: str) -> None:
+    patches = get_code_store_patches(fork)["fork_types"]
+    account = Account(nonce=Uint(1), balance=U256(7), code=PROXY)
+    storage_root = keccak256(b"storage")
+    assert patches["encode_account"](account, storage_root) == (
+        encode_account(account, storage_root)
+    )
+
+
+def test_set_account_shares_code(monkeypatch: pytest.MonkeyPatch) -> None:
+    hashed = []
+
+    def recording_keccak256(code: bytes) -> Hash32:
+        hashed.append(code)
+        return keccak256(code)
+
+    monkeypatch.setattr(code_store, "keccak256", recording_keccak256)
+    monkeypatch.setattr(code_store, "CODE_STORE", CodeStore())
+    patches = get_code_store_patches("prague")
+    set_account: Any = patches["state"]["set_account"]
+    encode: Any = patches["fork_types"]["encode_account"]
+
+    state = prague_state.State()
+    addresses = [index.to_bytes(20, "big") for index in range(1000)]
+    for address in addresses:
+        account = Account(
+            nonce=Uint(1), balance=U256(0), code=bytes(bytearray(PROXY))
+        )
+        set_account(state, address, account)
+
+    accounts = [prague_state.get_account(state, a) for a in addresses]
+    assert all(account.code is accounts[0].code for account in accounts)
+    assert accounts[0].code == PROXY
+
+    storage_root = keccak256(b"storage")
+    for _ in range(3):
+        for account in accounts:
+            assert encode(account, storage_root) == (
+                encode_account(account, storage_root)
+            )
+    assert hashed == [PROXY]
+
+
+def test_environment_hash() -> None:
+    patches = get_code_store_patches("prague")["vm.instructions.environment"]
+    assert patches["keccak256"](PROXY) == keccak256(PROXY)
@@ -0,0 +1,121 @@
+import random
+from pathlib import Path
+from typing import List
+
+import pytest
+from ethereum_types.bytes import Bytes8
+from ethereum_types.numeric import Uint
+
+import ethereum.ethash
+from ethereum.crypto.hash import Hash32
+from ethereum.ethash import EPOCH_SIZE
+from ethereum_optimized import ethash_cache
+from ethereum_optimized.ethash_cache import (
+    EthashCache,
+    EthashCacheStore,
+    get_ethash_cache_patches,
+)
+
+# A real cache takes too long to generate, so the tests use this many items.
+ITEMS = 97
+
+
+@pytest.fixture
+def generated(monkeypatch: pytest.MonkeyPatch) -> List[int]:
+    """
+    Shrink the cache, recording the epoch of every cache generated.
+    """
+    calls: List[int] = []
+    generate_cache = ethash_cache.generate_cache
+
+    def recording_generate_cache(block_number: Uint) -> EthashCache:
+        calls.append(int(ethereum.ethash.epoch(block_number)))
+        return generate_cache(block_number)
+
+    monkeypatch.setattr(
+        ethereum.ethash, "cache_size", lambda _: Uint(ITEMS * 64)
+    )
+    monkeypatch.setattr(
+        ethash_cache, "generate_cache", recording_generate_cache
+    )
+    return calls
+
+
+@pytest.mark.usefixtures("generated")
+def test_matches_spec() -> None:
+    rng = random.Random(8)
+    for block_number in (Uint(0), EPOCH_SIZE * Uint(3)):
+        spec_cache = ethereum.ethash.generate_cache(block_number)
+        cache = ethash_cache.generate_cache(block_number)
+        assert cache.to_spec() == spec_cache
+        assert EthashCache.from_spec(spec_cache).words == cache.words
+
+        for index in (0, 1, ITEMS, 2**32 + 3):
+            assert ethash_cache.generate_dataset_item(
+                cache, index
+            ) == ethereum.ethash.generate_dataset_item(spec_cache, Uint(index))
+
+        # The specification's `hashimoto_light()` is slow, so it is only
+        # checked once.
+        if block_number != Uint(0):
+            continue
+
+        header_hash = Hash32(rng.randbytes(32))
+        nonce = Bytes8(rng.randbytes(8))
+        dataset_size = ethereum.ethash.dataset_size(block_number)
+        expected = ethereum.ethash.hashimoto_light(
+            header_hash, nonce, spec_cache, dataset_size
+        )
+        for light_cache in (cache, spec_cache):
+            assert expected == ethash_cache.hashimoto_light(
+                header_hash, nonce, light_cache, dataset_size
+            )
+
+
+def test_generated_once_per_epoch(generated: List[int]) -> None:
+    store = EthashCacheStore(max_epochs=2)
+    size = int(EPOCH_SIZE)
+    for number in (0, 1, size - 1, size, 2 * size, 5):
+        assert store.get(Uint(number)).to_spec() == (
+            ethereum.ethash.generate_cache(Uint(number))
+        )
+
+    # Epoch 0 is evicted by epoch 2 and has to be generated again.
+    assert generated == [0, 1, 2, 0]
+
+
+def test_least_recently_used_evicted(generated: List[int]) -> None:
+    store = EthashCacheStore(max_epochs=2)
+    for epoch in (0, 1, 0, 2, 0, 1):
+        store.get(EPOCH_SIZE * Uint(epoch))
+    assert generated == [0, 1, 2, 1]
+
+
+def test_saved_to_disk(generated: List[int], tmp_path: Path) -> None:
+    store = EthashCacheStore(directory=str(tmp_path))
+    expected = store.get(EPOCH_SIZE)
+    assert generated == [1]
+
+    loaded = EthashCacheStore(directory=str(tmp_path)).get(EPOCH_SIZE)
+    assert generated == [1]
+    assert loaded.words == expected.words
+
+
+def test_wrong_size_file_ignored(generated: List[int], tmp_path: Path) -> None:
+    EthashCacheStore(directory=str(tmp_path)).get(Uint(0))
+    (tmp_path / "ethash-cache-0.bin").write_bytes(b"\x00" * 12)
+
+    store = EthashCacheStore(directory=str(tmp_path))
+    assert store.get(Uint(0)).to_spec() == ethereum.ethash.generate_cache(
+        Uint(0)
+    )
+    assert generated == [0, 0]
+
+
+def test_patches_only_for_pow_forks() -> None:
+    assert set(get_ethash_cache_patches("frontier")) == {
+        "generate_cache",
+        "hashimoto_light",
+    }
+    with pytest.raises(Exception, match="non-pow"):
+        get_ethash_cache_patches("paris")
@@ -0,0 +1,76 @@
+import pytest
+from ethereum_types.bytes import Bytes
+from ethereum_types.numeric import U256
+
+from ethereum.crypto.hash import keccak256
+from ethereum.prague.trie import Trie, bytes_to_nibble_list, root, trie_set
+from ethereum_optimized.hashed_keys import HASHED_KEYS, HashedKeyCache
+from ethereum_optimized.trie_cache import get_trie_cache_patches
+
+
+def test_statistics() -> None:
+    cache = HashedKeyCache(max_entries=8)
+    keys = [bytes([i]) * 32 for i in range(3)]
+    for key in keys + keys + keys[:1]:
+        assert cache.path(key) == bytes_to_nibble_list(keccak256(key))
+
+    assert (cache.hits, cache.misses, cache.evictions) == (4, 3, 0)
+    assert cache.hit_rate == 4 / 7
+    assert len(cache) == 3
+
+    cache.reset_statistics()
+    assert cache.hit_rate == 0.0
+    cache.clear()
+    assert len(cache) == 0
+
+    with pytest.raises(ValueError):
+        HashedKeyCache(max_entries=0)
+    with pytest.raises(ValueError):
+        HashedKeyCache(max_entries=4, protected_entries=5)
+
+
+def test_scan_resistance() -> None:
+    cache = HashedKeyCache(max_entries=4, protected_entries=2)
+    reused = [b"\x01" * 20, b"\x02" * 20]
+    for key in reused + reused:
+        cache.path(key)
+
+    # Keys used once only evict each other.
+    for i in range(100):
+        cache.path(i.to_bytes(32, "big"))
+    assert len(cache) == 4
+    assert cache.evictions == 98
+
+    cache.reset_statistics()
+    for key in reused:
+        cache.path(key)
+    assert cache.hits == 2
+
+    # Protected keys that fall out of use go back on probation.
+    for key in [b"\x03" * 20, b"\x04" * 20]:
+        cache.path(key)
+        cache.path(key)
+    cache.reset_statistics()
+    cache.path(reused[1])
+    cache.path(b"\x05" * 20)
+    cache.path(reused[0])
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_trie_cache_paths() -> None:
+    optimized = get_trie_cache_patches("prague")
+    keys = [i.to_bytes(20, "big") for i in range(1, 50)]
+    HASHED_KEYS.clear()
+
+    for secured in (True, True, False):
+        spec_trie: Trie[Bytes, U256] = Trie(secured=secured, default=U256(0))
+        cached_trie = optimized["Trie"](secured=secured, default=U256(0))
+        for i, key in enumerate(keys):
+            trie_set(spec_trie, key, U256(i + 1))
+            optimized["trie_set"](cached_trie, key, U256(i + 1))
+        assert optimized["root"](cached_trie) == root(spec_trie)
+
+    # The second secured trie found the paths of the first, and unsecured
+    # keys aren't hashed.
+    assert (HASHED_KEYS.hits, HASHED_KEYS.misses) == (49, 49)
+    HASHED_KEYS.clear()
@@ -0,0 +1,276 @@
+from importlib import import_module
+from types import SimpleNamespace
+from typing import Any, Callable, Iterator, List, Tuple
+
+import pytest
+from ethereum_types.numeric import Uint
+
+import ethereum.trace
+from ethereum.prague.vm.exceptions import OutOfGasError
+from ethereum_optimized.instruction_stream import (
+    get_instruction_stream_patches,
+)
+
+CODE_ADDRESS = b"\xaa" * 20
+
+# PUSH1 3, PUSH1 5, ADD, PUSH1 0, MSTORE, PUSH1 32, PUSH1 0, RETURN
+ADD_AND_RETURN = bytes.fromhex("600360050160005260206000f3")
+
+# Count down from 10 in a loop, jumping back with a PUSH2 immediate.
+LOOP = bytes.fromhex(
+    "600a"  # PUSH1 10
+    "5b"  # JUMPDEST (pc 2)
+    "6001"  # PUSH1 1
+    "90"  # SWAP1
+    "03"  # SUB
+    "80"  # DUP1
+    "610002"  # PUSH2 2
+    "57"  # JUMPI
+    "00"  # STOP
+)
+
+# Jump into the immediate of a PUSH2 whose data looks like a JUMPDEST.
+JUMP_INTO_IMMEDIATE = bytes.fromhex("600456615b0000")
+
+# A PUSH32 cut off by the end of the code.
+TRUNCATED_PUSH = bytes.fromhex("7f0102")
+
+# An undefined opcode after some work.
+INVALID = bytes.fromhex("600160020c")
+
+# REVERT with one word of memory, which is an invalid opcode before Byzantium.
+REVERT = bytes.fromhex("602a60005260206000fd")
+
+# A byte that looks like an undefined opcode, hidden in a PUSH immediate.
+HIDDEN_INVALID = bytes.fromhex("620c0c0c5000")
+
+# Instructions that only work on the stack, split into blocks at JUMPDEST.
+STACK_ONLY = bytes.fromhex(
+    "6007"  # PUSH1 7
+    "6003"  # PUSH1 3
+    "80"  # DUP1
+    "91"  # SWAP2
+    "01"  # ADD
+    "02"  # MUL
+    "6002"  # PUSH1 2
+    "1b"  # SHL
+    "5b"  # JUMPDEST
+    "6005"  # PUSH1 5
+    "90"  # SWAP1
+    "04"  # DIV
+    "6003"  # PUSH1 3
+    "06"  # MOD
+    "19"  # NOT
+    "15"  # ISZERO
+    "600f"  # PUSH1 15
+    "16"  # AND
+    "50"  # POP
+)
+
+# More pushes than the stack can hold.
+STACK_OVERFLOW = bytes.fromhex("6001") * 1025
+
+# A block whose second instruction needs more items than the stack holds.
+STACK_UNDERFLOW = bytes.fromhex("600182")
+
+CODES = [
+    ADD_AND_RETURN,
+    LOOP,
+    JUMP_INTO_IMMEDIATE,
+    TRUNCATED_PUSH,
+    INVALID,
+    REVERT,
+    HIDDEN_INVALID,
+    STACK_ONLY,
+    STACK_OVERFLOW,
+    STACK_UNDERFLOW,
+    b"",
+    # Init code is read from memory.
+    bytearray(LOOP),
+]
+
+
+@pytest.fixture
+def traces() -> Iterator[List[Tuple[Any, ...]]]:
+    events: List[Tuple[Any, ...]] = []
+
+    def tracer(
+        evm: Any,
+        event: ethereum.trace.TraceEvent,
+        trace_memory: bool = False,  # noqa: U100
+        trace_stack: bool = True,  # noqa: U100
+        trace_return_data: bool = False,  # noqa: U100
+    ) -> None:
+        if isinstance(event, ethereum.trace.OpException):
+            events.append((type(event.error), evm.pc))
+        else:
+            events.append((event, evm.pc, list(evm.stack)))
+
+    previous = ethereum.trace.set_evm_trace(tracer)
+    yield events
+    ethereum.trace.set_evm_trace(previous)
+
+
+def run(
+    execute_code: Callable[[Any], Any],
+    code: bytes,
+    events: List[Tuple[Any, ...]],
+    gas: int = 100000,
+) -> Tuple[Any, ...]:
+    message = SimpleNamespace(
+        code=code,
+        gas=Uint(gas),
+        code_address=CODE_ADDRESS,
+        accessed_addresses=set(),
+        accessed_storage_keys=set(),
+        disable_precompiles=False,
+    )
+    events.clear()
+    evm = execute_code(message)
+    return (
+        evm.pc,
+        evm.stack,
+        bytes(evm.memory),
+        evm.gas_left,
+        evm.output,
+        type(evm.error),
+        evm.running,
+        list(events),
+    )
+
+
+@pytest.mark.parametrize("fork", ["frontier", "byzantium", "prague"])
+@pytest.mark.parametrize("code", CODES)
+def test_matches_spec(
+    fork: str, code: bytes, traces: List[Tuple[Any, ...]]
+) -> None:
+    interpreter: Any = import_module("ethereum." + fork + ".vm.interpreter")
+    patches = get_instruction_stream_patches(fork)
+
+    expected = run(interpreter.execute_code, code, traces)
+    assert run(patches["execute_code"], code, traces) == expected
+    # A second run uses the cached instruction stream.
+    assert run(patches["execute_code"], code, traces) == expected
+
+
+def test_push_immediates_decoded() -> None:
+    patches = get_instruction_stream_patches("prague")
+
+    evm = patches["execute_code"](
+        SimpleNamespace(
+            code=bytes.fromhex("5f60ff61abcd7f") + bytes(range(32)),
+            gas=Uint(100000),
+            code_address=CODE_ADDRESS,
+            accessed_addresses=set(),
+            accessed_storage_keys=set(),
+            disable_precompiles=False,
+        )
+    )
+    assert evm.stack == [0, 0xFF, 0xABCD, int.from_bytes(bytes(range(32)))]
+    assert evm.pc == 39
+    assert evm.error is None
+
+
+@pytest.mark.parametrize("code", CODES)
+def test_untraced_builds_no_events(
+    code: bytes, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    interpreter: Any = import_module("ethereum.prague.vm.interpreter")
+    patches = get_instruction_stream_patches("prague")
+    expected = run(interpreter.execute_code, code, [])
+
+    def no_event(*args: Any) -> None:  # noqa: U100
+        raise AssertionError("trace event built while not tracing")
+
+    for name in ("OpStart", "OpEnd", "OpException", "EvmStop"):
+        monkeypatch.setattr(interpreter, name, no_event)
+    assert run(patches["execute_code"], code, []) == expected
+
+
+@pytest.mark.usefixtures("traces")
+def test_traced_runs_spec(monkeypatch: pytest.MonkeyPatch) -> None:
+    interpreter: Any = import_module("ethereum.prague.vm.interpreter")
+    messages = []
+
+    def execute_code(message: Any) -> Any:
+        messages.append(message)
+        return SimpleNamespace()
+
+    monkeypatch.setattr(interpreter, "execute_code", execute_code)
+    patches = get_instruction_stream_patches("prague")
+    message = SimpleNamespace(code=LOOP)
+    patches["execute_code"](message)
+    assert messages == [message]
+
+    ethereum.trace.set_evm_trace(ethereum.trace.discard_evm_trace)
+    run(patches["execute_code"], LOOP, [])
+    assert messages == [message]
+
+
+@pytest.mark.parametrize("gas", range(0, 70))
+def test_block_out_of_gas(gas: int) -> None:
+    interpreter: Any = import_module("ethereum.prague.vm.interpreter")
+    patches = get_instruction_stream_patches("prague")
+
+    expected = run(interpreter.execute_code, STACK_ONLY, [], gas)
+    assert run(patches["execute_code"], STACK_ONLY, [], gas) == expected
+
+
+def test_blocks_charged_at_once(monkeypatch: pytest.MonkeyPatch) -> None:
+    gas: Any = import_module("ethereum.prague.vm.gas")
+    patches = get_instruction_stream_patches("prague")
+    spec_charge_gas = gas.charge_gas
+    charges: List[Uint] = []
+
+    def charge_gas(evm: Any, amount: Uint) -> None:
+        charges.append(amount)
+        spec_charge_gas(evm, amount)
+
+    monkeypatch.setattr(gas, "charge_gas", charge_gas)
+    evm = patches["execute_code"](
+        SimpleNamespace(
+            code=STACK_ONLY,
+            gas=Uint(100000),
+            code_address=CODE_ADDRESS,
+            accessed_addresses=set(),
+            accessed_storage_keys=set(),
+            disable_precompiles=False,
+        )
+    )
+    assert charges == []
+    assert evm.gas_left == Uint(100000 - 60)
+    assert evm.stack == []
+
+    # Without enough gas for the second block, each of its instructions is
+    # charged, including its two PUSH1s.
+    evm = patches["execute_code"](
+        SimpleNamespace(
+            code=STACK_ONLY,
+            gas=Uint(40),
+            code_address=CODE_ADDRESS,
+            accessed_addresses=set(),
+            accessed_storage_keys=set(),
+            disable_precompiles=False,
+        )
+    )
+    assert charges == [Uint(3), Uint(3)]
+    assert isinstance(evm.error, OutOfGasError)
+
+
+def test_charge_gas(
+    traces: List[Tuple[Any, ...]], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    gas: Any = import_module("ethereum.prague.vm.gas")
+    charge_gas = get_instruction_stream_patches("prague")["charge_gas"]
+    evm = SimpleNamespace(pc=Uint(0), stack=[], gas_left=Uint(10))
+
+    charge_gas(evm, Uint(3))
+    assert evm.gas_left == Uint(7)
+    assert traces == [(ethereum.trace.GasAndRefund(3), Uint(0), [])]
+
+    ethereum.trace.set_evm_trace(ethereum.trace.discard_evm_trace)
+    monkeypatch.setattr(gas, "GasAndRefund", None)
+    charge_gas(evm, Uint(7))
+    assert evm.gas_left == Uint(0)
+    with pytest.raises(OutOfGasError):
+        charge_gas(evm, Uint(1))
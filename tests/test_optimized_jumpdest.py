@@ -0,0 +1,76 @@
+import random
+
+import pytest
+from ethereum_types.numeric import Uint
+
+from ethereum.frontier.vm.runtime import (
+    get_valid_jump_destinations as frontier_jump_destinations,
+)
+from ethereum.prague.vm.runtime import (
+    get_valid_jump_destinations as prague_jump_destinations,
+)
+from ethereum_optimized.jumpdest import (
+    JumpdestCache,
+    find_jump_destinations,
+    get_jumpdest_patches,
+)
+
+CODES = [
+    b"",
+    bytes.fromhex("5b"),
+    bytes.fromhex("605b5b"),  # JUMPDEST in a PUSH1 immediate
+    bytes.fromhex("7f" + "5b" * 32 + "5b"),
+    bytes.fromhex("7f5b5b"),  # truncated PUSH32
+    bytes.fromhex("5f5b"),  # PUSH0 has no immediate
+    bytes.fromhex("0c5b"),  # undefined opcode
+    bytes.fromhex("5b0a5b"),  # newline
+]
+
+
+@pytest.mark.parametrize("code", CODES)
+def test_matches_spec(code: bytes) -> None:
+    expected = prague_jump_destinations(code)
+    assert find_jump_destinations(code) == expected
+    assert frontier_jump_destinations(code) == expected
+    assert all(isinstance(pc, Uint) for pc in find_jump_destinations(code))
+
+
+def test_matches_spec_random() -> None:
+    rng = random.Random(0)
+    for _ in range(200):
+        # Bias the bytes towards PUSH opcodes and JUMPDEST.
+        alphabet = list(range(0x5B, 0x80)) + list(range(256))
+        code = bytes(rng.choice(alphabet) for _ in range(rng.randrange(200)))
+        assert find_jump_destinations(code) == prague_jump_destinations(code)
+
+
+def test_cache() -> None:
+    cache = JumpdestCache(max_bytes=len(CODES[2]) + len(CODES[5]))
+    first = cache.get(CODES[1])
+    assert cache.get(CODES[1]) is first
+    assert cache.get(bytearray(CODES[1])) is first
+    assert cache.get(bytes(bytearray(CODES[1]))) is first
+
+    cache.get(CODES[2])
+    assert len(cache) == 2
+    cache.get(CODES[5])
+    assert len(cache) == 2
+    assert cache.size == len(CODES[2]) + len(CODES[5])
+    assert cache.get(CODES[1]) is not first
+    assert cache.get(CODES[1]) == first
+
+    # The most recent analysis is kept, however large.
+    cache.get(CODES[3])
+    assert len(cache) == 1
+
+    cache.clear()
+    assert cache.size == 0
+    assert cache.get(CODES[1]) is not first
+
+    with pytest.raises(ValueError, match="max_bytes"):
+        JumpdestCache(max_bytes=0)
+
+
+def test_patches() -> None:
+    patch = get_jumpdest_patches("prague")["get_valid_jump_destinations"]
+    assert patch(CODES[3]) == prague_jump_destinations(CODES[3])
@@ -0,0 +1,94 @@
+from dataclasses import fields
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+from ethereum_rlp import rlp
+from ethereum_types.numeric import U256, Uint
+
+import ethereum.frontier.vm.instructions.log as frontier_log
+import ethereum.prague.vm.instructions.log as prague_log
+from ethereum.prague.vm.exceptions import WriteInStaticContext
+from ethereum_optimized.logs import get_log_patches
+
+TARGET = b"\xaa" * 20
+
+
+def new_evm(evm_class: Any, is_static: bool = False) -> Any:
+    values = dict(
+        pc=Uint(0),
+        stack=[],
+        memory=bytearray(b"\x01\x02\x03\x04"),
+        code=b"",
+        gas_left=Uint(100000),
+        valid_jump_destinations=set(),
+        logs=(),
+        refund_counter=0,
+        running=True,
+        message=SimpleNamespace(current_target=TARGET, is_static=is_static),
+        output=b"",
+        accounts_to_delete=set(),
+        touched_accounts=set(),
+        return_data=b"",
+        error=None,
+        accessed_addresses=set(),
+        accessed_storage_keys=set(),
+    )
+    names = {f.name for f in fields(evm_class)}
+    return evm_class(**{k: v for k, v in values.items() if k in names})
+
+
+def emit(log_mod: Any, evm: Any, count: int) -> None:
+    for i in range(count):
+        # LOG2 with topics `i` and 7 over two bytes of memory from `i % 3`.
+        evm.stack.extend([U256(7), U256(i), U256(2), U256(i % 3)])
+        log_mod.log2(evm)
+
+
+@pytest.mark.parametrize("fork", ["frontier", "prague"])
+def test_matches_spec(fork: str) -> None:
+    spec_log: Any = frontier_log if fork == "frontier" else prague_log
+    patches = get_log_patches(fork)
+
+    expected = new_evm(spec_log.Evm)
+    emit(spec_log, expected, 20)
+
+    optimized = new_evm(patches["vm.interpreter"]["Evm"])
+    emit(SimpleNamespace(**patches["vm.instructions.log"]), optimized, 20)
+
+    assert isinstance(optimized.logs, list)
+    assert tuple(optimized.logs) == expected.logs
+    assert optimized.gas_left == expected.gas_left
+    assert optimized.memory == expected.memory
+    assert optimized.pc == expected.pc
+
+
+def test_static_context() -> None:
+    patches = get_log_patches("prague")
+    evm = new_evm(patches["vm.interpreter"]["Evm"], is_static=True)
+    with pytest.raises(WriteInStaticContext):
+        emit(SimpleNamespace(**patches["vm.instructions.log"]), evm, 1)
+    assert evm.logs == []
+
+
+def test_outputs() -> None:
+    patches = get_log_patches("prague")
+    logs = [b"a", b"b"]
+    output = patches["vm.interpreter"]["MessageCallOutput"](
+        gas_left=Uint(0),
+        refund_counter=U256(0),
+        logs=logs,
+        accounts_to_delete=set(),
+        error=None,
+        return_data=b"",
+    )
+    assert output.logs == (b"a", b"b")
+
+    block_output = patches["vm"]["BlockOutput"]()
+    block_logs = block_output.block_logs
+    block_output.block_logs += output.logs
+    block_output.receipt_keys += (b"\x80",)
+    assert block_output.block_logs is block_logs
+    assert block_output.block_logs == [b"a", b"b"]
+    assert block_output.receipt_keys == [b"\x80"]
+    assert rlp.encode(block_output.block_logs) == rlp.encode(output.logs)
@@ -0,0 +1,194 @@
+import random
+from importlib import import_module
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Optional
+
+import pytest
+from ethereum_types.numeric import Uint
+from py_ecc import optimized_bls12_381 as bls12_381
+from py_ecc import optimized_bn128 as bn128
+from py_ecc.bls.hash_to_curve import map_to_curve_G1, map_to_curve_G2
+
+from ethereum.prague.vm.exceptions import InvalidParameter
+from ethereum.prague.vm.precompiled_contracts import alt_bn128
+from ethereum.prague.vm.precompiled_contracts.bls12_381 import (
+    bls12_381_pairing,
+    g1_to_bytes,
+    g2_to_bytes,
+)
+from ethereum_optimized.pairing import (
+    get_alt_bn128_pairing_patches,
+    get_bls12_381_pairing_patches,
+    is_in_bls12_381_g1,
+    is_in_bls12_381_g2,
+    is_in_bn128_g2,
+)
+
+bls12_381_patches = get_bls12_381_pairing_patches("prague")
+alt_bn128_patches = get_alt_bn128_pairing_patches("prague")
+
+
+def bn128_sqrt(a: bn128.FQ2) -> Optional[bn128.FQ2]:
+    """
+    Square root in `FQ2` for `p = 3 mod 4`, or `None` if there is none.
+    """
+    p = bn128.field_modulus
+    a1 = a ** ((p - 3) // 4)
+    alpha = a1 * a1 * a
+    x0 = a1 * a
+    if alpha == -bn128.FQ2.one():
+        root = bn128.FQ2([0, 1]) * x0
+    else:
+        root = (alpha + bn128.FQ2.one()) ** ((p - 1) // 2) * x0
+    return root if root * root == a else None
+
+
+def random_bn128_twist_point(rng: random.Random) -> Any:
+    """
+    A point on the alt_bn128 twisted curve, almost never in G2.
+    """
+    while True:
+        x = bn128.FQ2([rng.randrange(bn128.field_modulus) for _ in range(2)])
+        y = bn128_sqrt(x**3 + bn128.b2)
+        if y is not None:
+            return (x, y, bn128.FQ2.one())
+
+
+def in_subgroup(multiply: Callable, order: int, point: Any) -> bool:
+    return multiply(point, order)[2] == point[2].zero()
+
+
+def test_bls12_381_subgroup_checks() -> None:
+    rng = random.Random(1)
+    for _ in range(5):
+        scalar = rng.randrange(bls12_381.curve_order)
+        assert is_in_bls12_381_g1(bls12_381.multiply(bls12_381.G1, scalar))
+        assert is_in_bls12_381_g2(bls12_381.multiply(bls12_381.G2, scalar))
+
+        # Mapped points have not had their cofactor cleared.
+        g1_point = map_to_curve_G1(
+            bls12_381.FQ(rng.randrange(bls12_381.field_modulus))
+        )
+        assert is_in_bls12_381_g1(g1_point) == in_subgroup(
+            bls12_381.multiply, bls12_381.curve_order, g1_point
+        )
+        g2_point = map_to_curve_G2(
+            bls12_381.FQ2(
+                [rng.randrange(bls12_381.field_modulus) for _ in range(2)]
+            )
+        )
+        assert is_in_bls12_381_g2(g2_point) == in_subgroup(
+            bls12_381.multiply, bls12_381.curve_order, g2_point
+        )
+
+    assert is_in_bls12_381_g1(bls12_381.Z1)
+    assert is_in_bls12_381_g2(bls12_381.Z2)
+
+
+def test_bn128_subgroup_check() -> None:
+    rng = random.Random(2)
+    for _ in range(5):
+        scalar = rng.randrange(bn128.curve_order)
+        assert is_in_bn128_g2(bn128.multiply(bn128.G2, scalar))
+
+        point = random_bn128_twist_point(rng)
+        assert is_in_bn128_g2(point) == in_subgroup(
+            bn128.multiply, bn128.curve_order, point
+        )
+
+    assert is_in_bn128_g2(bn128.Z2)
+
+
+def run(precompile: Any, data: bytes) -> Any:
+    evm = SimpleNamespace(
+        message=SimpleNamespace(data=data), gas_left=Uint(10**9), output=b""
+    )
+    try:
+        precompile(evm)
+    except Exception as e:
+        return type(e)
+    return evm.output, evm.gas_left
+
+
+def test_bls12_381_pairing() -> None:
+    rng = random.Random(3)
+    a = rng.randrange(bls12_381.curve_order)
+    b = rng.randrange(bls12_381.curve_order)
+    g1_a = g1_to_bytes(bls12_381.multiply(bls12_381.G1, a))
+    g1_ab = g1_to_bytes(bls12_381.neg(bls12_381.multiply(bls12_381.G1, a * b)))
+    g2_one = g2_to_bytes(bls12_381.G2)
+    g2_b = g2_to_bytes(bls12_381.multiply(bls12_381.G2, b))
+    infinity_g1 = b"\x00" * 128
+    outside_g1 = g1_to_bytes(map_to_curve_G1(bls12_381.FQ(5)))
+
+    cases = [
+        g1_a + g2_b + g1_ab + g2_one,
+        g1_a + g2_b + g1_a + g2_one,
+        infinity_g1 + g2_b,
+        outside_g1 + g2_b,
+        g1_a + g2_b[:-1],
+    ]
+    for data in cases:
+        expected = run(bls12_381_pairing.bls12_pairing, data)
+        assert run(bls12_381_patches["bls12_pairing"], data) == expected
+    assert run(bls12_381_patches["bls12_pairing"], cases[0])[0][-1] == 1
+    assert (
+        run(bls12_381_patches["bls12_pairing"], cases[3]) is InvalidParameter
+    )
+
+
+def bn128_g1_to_bytes(point: Any) -> bytes:
+    x, y = bn128.normalize(point)
+    return int(x).to_bytes(32, "big") + int(y).to_bytes(32, "big")
+
+
+def bn128_g2_to_bytes(point: Any) -> bytes:
+    x, y = bn128.normalize(point)
+    return b"".join(
+        c.to_bytes(32, "big")
+        for c in (x.coeffs[1], x.coeffs[0], y.coeffs[1], y.coeffs[0])
+    )
+
+
+def alt_bn128_inputs() -> Dict[str, bytes]:
+    rng = random.Random(4)
+    a = rng.randrange(bn128.curve_order)
+    b = rng.randrange(bn128.curve_order)
+    g1_a = bn128_g1_to_bytes(bn128.multiply(bn128.G1, a))
+    g1_ab = bn128_g1_to_bytes(bn128.neg(bn128.multiply(bn128.G1, a * b)))
+    g2_one = bn128_g2_to_bytes(bn128.G2)
+    g2_b = bn128_g2_to_bytes(bn128.multiply(bn128.G2, b))
+    return {
+        "empty": b"",
+        "infinity": b"\x00" * 64 + g2_b,
+        "outside": g1_a + bn128_g2_to_bytes(random_bn128_twist_point(rng)),
+        "length": g1_a + g2_b[:-1],
+        "one": g1_a + g2_b + g1_ab + g2_one,
+        "not_one": g1_a + g2_b,
+    }
+
+
+@pytest.mark.parametrize(
+    "fork", ["byzantium", "constantinople", "istanbul", "prague"]
+)
+def test_alt_bn128_pairing(fork: str) -> None:
+    spec = import_module(f"ethereum.{fork}.vm.precompiled_contracts.alt_bn128")
+    optimized = get_alt_bn128_pairing_patches(fork)["alt_bn128_pairing_check"]
+
+    inputs = alt_bn128_inputs()
+    for name in ("empty", "infinity", "outside", "length"):
+        expected = run(spec.alt_bn128_pairing_check, inputs[name])
+        assert run(optimized, inputs[name]) == expected
+    assert run(optimized, inputs["outside"]).__name__ == "OutOfGasError"
+
+    assert run(optimized, inputs["one"])[0][-1] == 1
+    assert run(optimized, inputs["not_one"])[0][-1] == 0
+
+
+@pytest.mark.slow
+def test_alt_bn128_pairing_matches_spec() -> None:
+    optimized = alt_bn128_patches["alt_bn128_pairing_check"]
+    inputs = alt_bn128_inputs()
+    for name in ("one", "not_one"):
+        expected = run(alt_bn128.alt_bn128_pairing_check, inputs[name])
+        assert run(optimized, inputs[name]) == expected
@@ -0,0 +1,108 @@
+import random
+
+import pytest
+from ethereum_types.bytes import Bytes20, Bytes32
+from ethereum_types.numeric import U256, Uint
+
+from ethereum.prague.fork_types import Account, Address
+from ethereum.prague.state import (
+    State,
+    close_state,
+    set_account,
+    set_storage,
+    state_root,
+)
+from ethereum.prague.trie import Trie, root, trie_set
+from ethereum_optimized.parallel_roots import (
+    STORAGE_ROOTS,
+    StorageRootPool,
+    get_parallel_root_patches,
+    pack_storage,
+    storage_trie_cache,
+)
+from ethereum_optimized.trie_cache import get_trie_cache_patches
+
+
+def random_storage(rng: random.Random, size: int) -> Trie[Bytes32, U256]:
+    trie: Trie[Bytes32, U256] = Trie(secured=True, default=U256(0))
+    for _ in range(size):
+        key = Bytes32(rng.randbytes(32))
+        trie_set(trie, key, U256(rng.randrange(1, 2**256)))
+    return trie
+
+
+def test_buffers() -> None:
+    rng = random.Random(1)
+    for size in [0, 1, 2, 17, 300]:
+        trie = random_storage(rng, size)
+        buffers = pack_storage(trie)
+        assert buffers is not None
+        assert storage_trie_cache(*buffers).root == root(trie)
+
+
+def test_pool() -> None:
+    rng = random.Random(2)
+    tries = {index: random_storage(rng, 3 * index) for index in range(6)}
+    pool = StorageRootPool(workers=2, min_slots=4)
+    try:
+        roots = pool.roots(tries, root)
+        assert pool._pool is not None
+        assert roots == {index: root(trie) for index, trie in tries.items()}
+    finally:
+        pool.shutdown()
+    assert pool._pool is None
+
+
+def test_state_root(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(STORAGE_ROOTS, "min_slots", 20)
+    patches = get_parallel_root_patches("prague")
+    rng = random.Random(3)
+    state = State()
+    for index in range(8):
+        address = Address(Bytes20(rng.randbytes(20)))
+        set_account(state, address, Account(Uint(1), U256(index), b""))
+        for _ in range(40 * index):
+            key = Bytes32(rng.randbytes(32))
+            set_storage(state, address, key, U256(rng.randrange(1, 2**64)))
+
+    # Storage left behind by an account that no longer exists is ignored.
+    orphan = Address(Bytes20(rng.randbytes(20)))
+    set_account(state, orphan, Account(Uint(0), U256(1), b""))
+    set_storage(state, orphan, Bytes32(b"\x01" * 32), U256(1))
+    state._main_trie._data.pop(orphan)
+
+    try:
+        assert patches["state_root"](state) == state_root(state)
+    finally:
+        STORAGE_ROOTS.shutdown()
+    close_state(state)
+
+
+def test_trie_cache() -> None:
+    optimized = get_trie_cache_patches("prague")
+    rng = random.Random(4)
+    spec_tries = {index: random_storage(rng, 20) for index in range(3)}
+    tries = {}
+    for index, spec_trie in spec_tries.items():
+        tries[index] = optimized["Trie"](secured=True, default=U256(0))
+        for key, value in spec_trie._data.items():
+            optimized["trie_set"](tries[index], key, value)
+
+    pool = StorageRootPool(workers=2, min_slots=4)
+    try:
+        roots = pool.roots(tries, optimized["root"])
+        assert roots == {i: root(trie) for i, trie in spec_tries.items()}
+        caches = {index: trie._cache for index, trie in tries.items()}
+        assert all(cache is not None for cache in caches.values())
+
+        # Tries with a cache have their roots updated here.
+        key = next(iter(spec_tries[1]._data))
+        trie_set(spec_tries[1], key, U256(7))
+        optimized["trie_set"](tries[1], key, U256(7))
+        pool.shutdown()
+        roots = pool.roots(tries, optimized["root"])
+        assert pool._pool is None
+        assert roots == {i: root(trie) for i, trie in spec_tries.items()}
+        assert all(tries[i]._cache is cache for i, cache in caches.items())
+    finally:
+        pool.shutdown()
@@ -0,0 +1,241 @@
+import dataclasses
+from typing import Any, List, Tuple
+
+import pytest
+from ethereum_rlp import rlp
+from ethereum_types.numeric import U8, U64, U256, Uint
+
+import ethereum.frontier.transactions as frontier_transactions
+import ethereum.prague.fork as prague_fork
+from ethereum.crypto.elliptic_curve import SECP256K1N
+from ethereum.crypto.hash import keccak256
+from ethereum.exceptions import InvalidSignatureError
+from ethereum.prague.fork_types import Address, Authorization
+from ethereum.prague.transactions import (
+    LegacyTransaction,
+    SetCodeTransaction,
+    encode_transaction,
+    recover_sender,
+    signing_hash_155,
+    signing_hash_7702,
+)
+from ethereum.prague.vm.eoa_delegation import (
+    SET_CODE_TX_MAGIC,
+    recover_authority,
+)
+from ethereum_optimized.signers import (
+    SIGNER_RECOVERY,
+    get_signer_patches,
+    recover_signers,
+)
+from ethereum_spec_tools.evm_tools.utils import secp256k1_sign
+
+CHAIN_ID = U64(1)
+TARGET = Address(b"\xaa" * 20)
+
+
+def legacy_transaction(nonce: int, secret_key: int) -> LegacyTransaction:
+    tx = LegacyTransaction(
+        nonce=U256(nonce),
+        gas_price=Uint(1),
+        gas=Uint(21000),
+        to=TARGET,
+        value=U256(0),
+        data=b"",
+        v=U256(0),
+        r=U256(0),
+        s=U256(0),
+    )
+    r, s, v = secp256k1_sign(signing_hash_155(tx, CHAIN_ID), secret_key)
+    return LegacyTransaction(
+        nonce=tx.nonce,
+        gas_price=tx.gas_price,
+        gas=tx.gas,
+        to=tx.to,
+        value=tx.value,
+        data=tx.data,
+        v=U256(37) + v,
+        r=r,
+        s=s,
+    )
+
+
+def authorization(nonce: int, secret_key: int) -> Authorization:
+    signing_hash = keccak256(
+        SET_CODE_TX_MAGIC + rlp.encode((U256(1), TARGET, U64(nonce)))
+    )
+    r, s, y_parity = secp256k1_sign(signing_hash, secret_key)
+    return Authorization(
+        chain_id=U256(1),
+        address=TARGET,
+        nonce=U64(nonce),
+        y_parity=U8(y_parity),
+        r=r,
+        s=s,
+    )
+
+
+def set_code_transaction(secret_key: int) -> SetCodeTransaction:
+    fields: List[Any] = [
+        CHAIN_ID,
+        U64(0),
+        Uint(1),
+        Uint(1),
+        Uint(100000),
+        TARGET,
+        U256(0),
+        b"",
+        (),
+        (authorization(0, 5), authorization(1, 6)),
+    ]
+    new_transaction: Any = SetCodeTransaction
+    tx = new_transaction(*fields, U256(0), U256(0), U256(0))
+    r, s, y_parity = secp256k1_sign(signing_hash_7702(tx), secret_key)
+    return new_transaction(*fields, y_parity, r, s)
+
+
+def bad_signature(tx: LegacyTransaction) -> LegacyTransaction:
+    return LegacyTransaction(
+        nonce=tx.nonce,
+        gas_price=tx.gas_price,
+        gas=tx.gas,
+        to=tx.to,
+        value=tx.value,
+        data=tx.data,
+        v=tx.v,
+        r=tx.r,
+        s=SECP256K1N - U256(1),
+    )
+
+
+def outcome(recover: Any, *args: Any) -> Tuple[Any, ...]:
+    try:
+        return ("ok", recover(*args))
+    except InvalidSignatureError as error:
+        return (type(error), str(error))
+
+
+@pytest.fixture
+def patches() -> Any:
+    patches = get_signer_patches("prague")
+    yield patches
+    SIGNER_RECOVERY.clear()
+
+
+def test_recover_block(patches: Any) -> None:
+    transactions: List[Any] = [
+        legacy_transaction(0, 1),
+        bad_signature(legacy_transaction(1, 2)),
+        set_code_transaction(3),
+    ]
+    encoded = [encode_transaction(tx) for tx in transactions]
+    # Recoveries are only started once.
+    recoveries = SIGNER_RECOVERY.recover_block("prague", CHAIN_ID, encoded)
+    assert SIGNER_RECOVERY.recover_block("prague", CHAIN_ID, encoded) == (
+        recoveries
+    )
+    assert len(recoveries) == 5
+
+    for tx in transactions:
+        assert outcome(patches["fork"]["recover_sender"], CHAIN_ID, tx) == (
+            outcome(recover_sender, CHAIN_ID, tx)
+        )
+    for auth in transactions[2].authorizations:
+        assert outcome(
+            patches["vm.eoa_delegation"]["recover_authority"], auth
+        ) == outcome(recover_authority, auth)
+
+    assert outcome(recover_sender, CHAIN_ID, transactions[1])[0] is (
+        InvalidSignatureError
+    )
+    assert SIGNER_RECOVERY._pending == {}
+
+
+def test_unknown_fork() -> None:
+    tx = legacy_transaction(0, 1)
+    assert SIGNER_RECOVERY.recover_block("unknown", CHAIN_ID, [tx]) == []
+
+
+def test_apply_body(monkeypatch: pytest.MonkeyPatch) -> None:
+    senders: List[Address] = []
+
+    def apply_body(
+        block_env: Any, transactions: Tuple[Any, ...], withdrawals: Any
+    ) -> Any:
+        assert len(SIGNER_RECOVERY._pending) == len(transactions)
+        # Only the first transaction is executed.
+        senders.append(prague_fork.recover_sender(block_env.chain_id, tx))
+        return withdrawals
+
+    tx = legacy_transaction(0, 1)
+    monkeypatch.setattr(prague_fork, "apply_body", apply_body)
+    patches = get_signer_patches("prague")
+    monkeypatch.setattr(
+        prague_fork, "recover_sender", patches["fork"]["recover_sender"]
+    )
+
+    block_env: Any = type("BlockEnvironment", (), {"chain_id": CHAIN_ID})
+    output = patches["fork"]["apply_body"](
+        block_env, (tx, legacy_transaction(1, 2)), ()
+    )
+    assert output == ()
+    assert senders == [recover_sender(CHAIN_ID, tx)]
+    assert SIGNER_RECOVERY._pending == {}
+
+
+def test_recover_signers() -> None:
+    tx = set_code_transaction(3)
+    expected = [recover_sender(CHAIN_ID, tx)] + [
+        recover_authority(auth) for auth in tx.authorizations
+    ]
+    encoded: Any = encode_transaction(tx)
+    legacy = bad_signature(legacy_transaction(0, 1))
+    values = tuple(
+        getattr(legacy, field.name) for field in dataclasses.fields(legacy)
+    )
+
+    *results, error = recover_signers("prague", CHAIN_ID, [encoded, values])
+    assert results == expected
+    assert outcome(recover_sender, CHAIN_ID, legacy) == (
+        type(error),
+        str(error),
+    )
+
+
+def test_recover_signers_without_chain_id() -> None:
+    values: List[Any] = [U256(0), Uint(1), Uint(21000), TARGET, U256(0), b""]
+    new_transaction: Any = frontier_transactions.Transaction
+    unsigned = new_transaction(*values, U256(0), U256(0), U256(0))
+    r, s, v = secp256k1_sign(frontier_transactions.signing_hash(unsigned), 1)
+    signed = (*values, U256(27) + v, r, s)
+
+    assert recover_signers("frontier", None, [signed]) == [
+        frontier_transactions.recover_sender(new_transaction(*signed))
+    ]
+
+
+def test_discarded_recovery_runs_locally(patches: Any) -> None:
+    tx = legacy_transaction(0, 1)
+    recoveries = SIGNER_RECOVERY.recover_block("prague", CHAIN_ID, [tx])
+    [(future, _)] = SIGNER_RECOVERY._pending.values()
+    future.cancel()
+
+    assert patches["fork"]["recover_sender"](CHAIN_ID, tx) == (
+        recover_sender(CHAIN_ID, tx)
+    )
+    SIGNER_RECOVERY.discard(recoveries)
+
+
+def test_shutdown(patches: Any) -> None:
+    tx = legacy_transaction(0, 1)
+    SIGNER_RECOVERY.recover_block("prague", CHAIN_ID, [tx])
+    SIGNER_RECOVERY.shutdown()
+    assert not SIGNER_RECOVERY._pending
+    assert SIGNER_RECOVERY._pool is None
+
+    # A new pool is started for the next recoveries.
+    SIGNER_RECOVERY.recover_block("prague", CHAIN_ID, [tx])
+    assert patches["fork"]["recover_sender"](CHAIN_ID, tx) == (
+        recover_sender(CHAIN_ID, tx)
+    )
+    SIGNER_RECOVERY.shutdown()
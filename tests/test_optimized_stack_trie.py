@@ -0,0 +1,120 @@
+import random
+from typing import Any, List
+
+import pytest
+from ethereum_rlp import rlp
+from ethereum_types.bytes import Bytes
+from ethereum_types.numeric import Uint
+
+from ethereum.prague.trie import Trie, root, trie_set
+from ethereum_optimized.stack_trie import (
+    INDEX_ZERO,
+    IndexStackTrie,
+    StackTrie,
+    get_stack_trie_patches,
+)
+
+
+def random_value(rng: random.Random) -> Bytes:
+    # Short values are inlined in their parents, long ones are hashed.
+    return bytes(rng.randrange(256) for _ in range(rng.choice([1, 8, 40])))
+
+
+def test_sorted_keys() -> None:
+    rng = random.Random(1)
+    for _ in range(100):
+        # Some keys are prefixes of others, and end in branch nodes.
+        keys = sorted(
+            {
+                bytes(rng.randrange(3) for _ in range(rng.randrange(1, 4)))
+                for _ in range(30)
+            }
+        )
+        trie: Trie[Bytes, Bytes] = Trie(secured=False, default=b"")
+        stack_trie = StackTrie()
+        for key in keys:
+            value = random_value(rng)
+            trie_set(trie, key, value)
+            stack_trie.update(key, value)
+            assert stack_trie.root() == root(trie)
+
+    assert StackTrie().root() == root(Trie(secured=False, default=b""))
+
+    with pytest.raises(ValueError):
+        stack_trie.update(keys[0], b"\x01")
+    with pytest.raises(ValueError):
+        stack_trie.update(keys[-1], b"\x01")
+
+
+@pytest.mark.parametrize("count", [1, 2, 127, 128, 129, 300])
+def test_indices(count: int) -> None:
+    rng = random.Random(count)
+    trie: Trie[Bytes, Bytes] = Trie(secured=False, default=b"")
+    stack_trie = IndexStackTrie()
+    for index in range(count):
+        # Skipped indices, like those of rejected transactions.
+        if index > 0 and rng.random() < 0.2:
+            continue
+        key = rlp.encode(Uint(index))
+        value = random_value(rng)
+        trie_set(trie, key, value)
+        stack_trie.update(key, value)
+        if index % 16 == 0 or index == count - 1:
+            assert stack_trie.root() == root(trie)
+
+
+def test_index_zero_rewritten() -> None:
+    stack_trie = IndexStackTrie()
+    stack_trie.update(INDEX_ZERO, b"\x01")
+    # Writing zero again before anything else just replaces it.
+    stack_trie.update(INDEX_ZERO, b"\x02")
+    stack_trie.update(rlp.encode(Uint(1)), b"\x03")
+    with pytest.raises(ValueError):
+        stack_trie.update(INDEX_ZERO, b"\x04")
+
+    trie: Trie[Bytes, Bytes] = Trie(secured=False, default=b"")
+    trie_set(trie, INDEX_ZERO, b"\x02")
+    trie_set(trie, rlp.encode(Uint(1)), b"\x03")
+    assert stack_trie.root() == root(trie)
+
+
+def test_block_output() -> None:
+    patches = get_stack_trie_patches("prague")
+    patched_root = patches["trie"]["root"]
+    patched_trie_set = patches["trie"]["trie_set"]
+
+    block_output = patches["vm"]["BlockOutput"]()
+    tries: List[Any] = [
+        block_output.transactions_trie,
+        block_output.receipts_trie,
+        block_output.withdrawals_trie,
+    ]
+    spec_tries: List[Trie[Bytes, Any]] = [
+        Trie(secured=False, default=None) for _ in tries
+    ]
+    for index in range(200):
+        key = rlp.encode(Uint(index))
+        for trie, spec_trie in zip(tries, spec_tries):
+            patched_trie_set(trie, key, key * 20)
+            trie_set(spec_trie, key, key * 20)
+
+    for trie, spec_trie in zip(tries, spec_tries):
+        assert trie._stack_trie is not None
+        assert patched_root(trie) == root(spec_trie)
+
+    # Overwriting or deleting a key falls back to the usual root.
+    patched_trie_set(tries[2], INDEX_ZERO, b"\x01")
+    trie_set(spec_tries[2], INDEX_ZERO, b"\x01")
+    key = rlp.encode(Uint(3))
+    patched_trie_set(tries[0], key, b"\x01")
+    trie_set(spec_tries[0], key, b"\x01")
+    patched_trie_set(tries[1], key, None)
+    trie_set(spec_tries[1], key, None)
+    for trie, spec_trie in zip(tries, spec_tries):
+        assert patched_root(trie) == root(spec_trie)
+    assert all(trie._stack_trie is None for trie in tries)
+
+    # Other tries are left alone.
+    secured: Trie[Bytes, Any] = Trie(secured=True, default=None)
+    patched_trie_set(secured, key, b"\x01")
+    assert patched_root(secured) == root(secured)
@@ -0,0 +1,145 @@
+from typing import Any, List, cast
+
+from ethereum_types.numeric import U256, Uint
+
+import ethereum.frontier.state as frontier_state
+import ethereum.prague.state as prague_state
+from ethereum.frontier.fork_types import EMPTY_ACCOUNT as FRONTIER_EMPTY
+from ethereum.prague.fork_types import EMPTY_ACCOUNT, Account
+from ethereum.tangerine_whistle.utils.hexadecimal import hex_to_address
+from ethereum_optimized.state_journal import get_journaled_state_patches
+
+
+class JournaledState:
+    pass
+
+
+def journaled(fork: str) -> Any:
+    impl = cast(Any, JournaledState())
+    for name, value in get_journaled_state_patches(fork).items():
+        setattr(impl, name, value)
+    return impl
+
+
+frontier_journaled = journaled("frontier")
+prague_journaled = journaled("prague")
+
+ADDRESS_FOO = hex_to_address("0x00000000219ab540356cbb839cbe05303d7705fa")
+ADDRESS_BAR = hex_to_address("0xbe0eb53f46cd790cd13851d5eff43d12404d33e8")
+KEY_A = U256(1).to_be_bytes32()
+KEY_B = U256(2).to_be_bytes32()
+ACCOUNT = Account(nonce=Uint(1), balance=U256(7), code=b"\x60\x00")
+
+
+def test_nested_rollback_and_commit() -> None:
+    def actions(impl: Any) -> Any:
+        state = impl.State()
+        transient = impl.TransientStorage()
+        impl.set_account(state, ADDRESS_FOO, EMPTY_ACCOUNT)
+        impl.set_storage(state, ADDRESS_FOO, KEY_A, U256(1))
+
+        impl.begin_transaction(state, transient)
+        impl.set_account(state, ADDRESS_BAR, ACCOUNT)
+        impl.set_storage(state, ADDRESS_FOO, KEY_A, U256(2))
+
+        impl.begin_transaction(state, transient)
+        impl.set_storage(state, ADDRESS_FOO, KEY_B, U256(3))
+        impl.destroy_storage(state, ADDRESS_FOO)
+        impl.set_account(state, ADDRESS_FOO, None)
+        impl.rollback_transaction(state, transient)
+
+        impl.begin_transaction(state, transient)
+        impl.set_storage(state, ADDRESS_BAR, KEY_B, U256(4))
+        impl.set_storage(state, ADDRESS_FOO, KEY_A, U256(0))
+        impl.commit_transaction(state, transient)
+
+        impl.commit_transaction(state, transient)
+        return state
+
+    spec = actions(prague_state)
+    optimized = actions(prague_journaled)
+
+    assert not optimized._journal
+    for address in (ADDRESS_FOO, ADDRESS_BAR):
+        for key in (KEY_A, KEY_B):
+            assert prague_state.get_storage(
+                spec, address, key
+            ) == prague_state.get_storage(optimized, address, key)
+    assert prague_state.state_root(spec) == prague_state.state_root(optimized)
+
+
+def test_get_storage_original() -> None:
+    def actions(impl: Any) -> List[U256]:
+        state = impl.State()
+        transient = impl.TransientStorage()
+        impl.set_account(state, ADDRESS_FOO, EMPTY_ACCOUNT)
+        impl.set_storage(state, ADDRESS_FOO, KEY_A, U256(5))
+        impl.set_storage(state, ADDRESS_FOO, KEY_B, U256(6))
+
+        originals = []
+        impl.begin_transaction(state, transient)
+        impl.set_storage(state, ADDRESS_FOO, KEY_A, U256(7))
+
+        impl.begin_transaction(state, transient)
+        impl.destroy_storage(state, ADDRESS_FOO)
+        impl.set_storage(state, ADDRESS_FOO, KEY_A, U256(8))
+        originals.append(impl.get_storage_original(state, ADDRESS_FOO, KEY_A))
+        originals.append(impl.get_storage_original(state, ADDRESS_FOO, KEY_B))
+        impl.rollback_transaction(state, transient)
+
+        impl.set_storage(state, ADDRESS_FOO, KEY_B, U256(9))
+        originals.append(impl.get_storage_original(state, ADDRESS_FOO, KEY_A))
+        originals.append(impl.get_storage_original(state, ADDRESS_FOO, KEY_B))
+        impl.commit_transaction(state, transient)
+
+        impl.begin_transaction(state, transient)
+        originals.append(impl.get_storage_original(state, ADDRESS_FOO, KEY_A))
+        originals.append(impl.get_storage_original(state, ADDRESS_FOO, KEY_B))
+        impl.commit_transaction(state, transient)
+        return originals
+
+    assert actions(prague_state) == actions(prague_journaled)
+
+
+def test_transient_storage_rollback() -> None:
+    def actions(impl: Any) -> List[U256]:
+        state = impl.State()
+        transient = impl.TransientStorage()
+        values = []
+
+        impl.begin_transaction(state, transient)
+        impl.set_transient_storage(transient, ADDRESS_FOO, KEY_A, U256(1))
+
+        impl.begin_transaction(state, transient)
+        impl.set_transient_storage(transient, ADDRESS_FOO, KEY_A, U256(2))
+        impl.set_transient_storage(transient, ADDRESS_BAR, KEY_B, U256(3))
+        impl.rollback_transaction(state, transient)
+
+        for address, key in ((ADDRESS_FOO, KEY_A), (ADDRESS_BAR, KEY_B)):
+            values.append(
+                prague_state.get_transient_storage(transient, address, key)
+            )
+        impl.commit_transaction(state, transient)
+        return values
+
+    assert actions(prague_state) == actions(prague_journaled)
+
+
+def test_fork_without_transient_storage() -> None:
+    def actions(impl: Any) -> Any:
+        state = impl.State()
+        impl.set_account(state, ADDRESS_FOO, FRONTIER_EMPTY)
+
+        impl.begin_transaction(state)
+        impl.set_storage(state, ADDRESS_FOO, KEY_A, U256(1))
+        impl.begin_transaction(state)
+        impl.set_account(state, ADDRESS_BAR, FRONTIER_EMPTY)
+        impl.rollback_transaction(state)
+        impl.commit_transaction(state)
+        return state
+
+    spec = actions(frontier_state)
+    optimized = actions(frontier_journaled)
+    assert frontier_state.state_root(spec) == frontier_state.state_root(
+        optimized
+    )
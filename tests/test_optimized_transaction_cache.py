@@ -0,0 +1,161 @@
+from typing import Any, Callable, Iterator, List
+
+import pytest
+from ethereum_types.bytes import Bytes32
+from ethereum_types.numeric import U64, U256, Uint
+
+import ethereum.prague.transactions as prague_transactions
+from ethereum.prague.fork_types import Address
+from ethereum.prague.transactions import (
+    Access,
+    AccessListTransaction,
+    LegacyTransaction,
+)
+from ethereum_optimized.transaction_cache import (
+    TRANSACTION_CACHE,
+    TransactionCache,
+    get_transaction_cache_patches,
+)
+
+CHAIN_ID = U64(1)
+TARGET = Address(b"\xaa" * 20)
+
+
+def legacy_transaction(nonce: int) -> LegacyTransaction:
+    return LegacyTransaction(
+        nonce=U256(nonce),
+        gas_price=Uint(1),
+        gas=Uint(21000),
+        to=TARGET,
+        value=U256(0),
+        data=b"",
+        v=U256(37),
+        r=U256(1),
+        s=U256(2),
+    )
+
+
+def access_list_transaction(nonce: int) -> AccessListTransaction:
+    return AccessListTransaction(
+        chain_id=CHAIN_ID,
+        nonce=U256(nonce),
+        gas_price=Uint(1),
+        gas=Uint(21000),
+        to=TARGET,
+        value=U256(0),
+        data=b"\x01\x02",
+        access_list=(Access(account=TARGET, slots=(Bytes32(b"\x00" * 32),)),),
+        y_parity=U256(0),
+        r=U256(1),
+        s=U256(2),
+    )
+
+
+@pytest.fixture
+def calls(monkeypatch: pytest.MonkeyPatch) -> Iterator[List[str]]:
+    """
+    Count the calls to the specification's functions made by the patches.
+    """
+    called: List[str] = []
+
+    def counted(name: str) -> Callable[..., Any]:
+        spec_function = getattr(prague_transactions, name)
+
+        def function(*args: Any) -> Any:
+            called.append(name)
+            return spec_function(*args)
+
+        return function
+
+    for name in (
+        "encode_transaction",
+        "get_transaction_hash",
+        "signing_hash_155",
+        "signing_hash_2930",
+    ):
+        monkeypatch.setattr(prague_transactions, name, counted(name))
+    yield called
+    TRANSACTION_CACHE.clear()
+
+
+def test_computed_once(calls: List[str]) -> None:
+    patches = get_transaction_cache_patches("prague")
+    legacy = legacy_transaction(0)
+    typed = access_list_transaction(1)
+    typed_encoding = prague_transactions.encode_transaction(typed)
+    expected = {
+        "legacy": prague_transactions.get_transaction_hash(legacy),
+        "typed": prague_transactions.get_transaction_hash(typed_encoding),
+        "155": prague_transactions.signing_hash_155(legacy, CHAIN_ID),
+        "2930": prague_transactions.signing_hash_2930(typed),
+    }
+    calls.clear()
+
+    for _ in range(3):
+        assert patches["encode_transaction"](legacy) is legacy
+        encoding = patches["encode_transaction"](typed)
+        assert encoding == typed_encoding
+        assert patches["get_transaction_hash"](legacy) == expected["legacy"]
+        assert patches["get_transaction_hash"](encoding) == expected["typed"]
+        assert patches["signing_hash_155"](legacy, CHAIN_ID) == expected["155"]
+        assert patches["signing_hash_2930"](typed) == expected["2930"]
+
+    assert sorted(calls) == [
+        "encode_transaction",
+        "encode_transaction",
+        "get_transaction_hash",
+        "get_transaction_hash",
+        "signing_hash_155",
+        "signing_hash_2930",
+    ]
+
+    # An equal encoding that wasn't returned by the cache is hashed again.
+    calls.clear()
+    assert patches["get_transaction_hash"](bytes(bytearray(encoding))) == (
+        expected["typed"]
+    )
+    assert calls == ["get_transaction_hash"]
+
+
+def test_eviction() -> None:
+    cache = TransactionCache(max_entries=2)
+    transactions = [legacy_transaction(i) for i in range(3)]
+    entries = [cache.get(tx) for tx in transactions[:2]]
+    cache.set_encoding(entries[0], b"encoding")
+    assert cache.find_encoding(entries[0].encoding) is entries[0]
+
+    # Using the first transaction makes the second the oldest.
+    assert cache.get(transactions[0]) is entries[0]
+    cache.get(transactions[2])
+    assert len(cache) == 2
+    assert cache.get(transactions[0]) is entries[0]
+    assert cache.get(transactions[1]) is not entries[1]
+
+    cache.get(transactions[2])
+    cache.get(transactions[1])
+    assert cache.find_encoding(entries[0].encoding) is None
+
+    with pytest.raises(ValueError):
+        TransactionCache(max_entries=0)
+
+
+def test_frontier() -> None:
+    transactions: Any = pytest.importorskip("ethereum.frontier.transactions")
+    patches = get_transaction_cache_patches("frontier")
+    assert "encode_transaction" not in patches
+    tx = transactions.Transaction(
+        nonce=U256(0),
+        gas_price=Uint(1),
+        gas=Uint(21000),
+        to=TARGET,
+        value=U256(0),
+        data=b"",
+        v=U256(27),
+        r=U256(1),
+        s=U256(2),
+    )
+    assert patches["get_transaction_hash"](tx) == (
+        transactions.get_transaction_hash(tx)
+    )
+    assert patches["signing_hash"](tx) == transactions.signing_hash(tx)
+    TRANSACTION_CACHE.clear()
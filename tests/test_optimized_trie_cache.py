@@ -0,0 +1,123 @@
+import random
+from typing import Any, Callable, Dict, Optional, cast
+
+from ethereum_types.bytes import Bytes
+from ethereum_types.numeric import U256, Uint
+
+import ethereum.prague.trie as trie
+from ethereum.prague.fork_types import Account, Address, Root
+from ethereum_optimized.trie_cache import get_trie_cache_patches
+
+
+class TrieCachePatches:
+    pass
+
+
+optimized = cast(Any, TrieCachePatches())
+for name, value in get_trie_cache_patches("prague").items():
+    setattr(optimized, name, value)
+
+
+def random_key(rng: random.Random) -> Bytes:
+    return bytes(rng.randrange(4) for _ in range(rng.randrange(1, 4)))
+
+
+def test_unsecured_variable_length_keys() -> None:
+    rng = random.Random(1)
+    spec_trie: trie.Trie[Bytes, Bytes] = trie.Trie(secured=False, default=b"")
+    cached_trie = optimized.Trie(secured=False, default=b"")
+
+    for _ in range(40):
+        for _ in range(rng.randrange(1, 10)):
+            key = random_key(rng)
+            value = rng.choice([b"", b"\x01", b"\x02" * 40])
+            trie.trie_set(spec_trie, key, value)
+            optimized.trie_set(cached_trie, key, value)
+        assert trie.root(spec_trie) == optimized.root(cached_trie)
+
+
+def test_secured_large_batches() -> None:
+    rng = random.Random(2)
+    spec_trie: trie.Trie[Bytes, U256] = trie.Trie(
+        secured=True, default=U256(0)
+    )
+    cached_trie = optimized.Trie(secured=True, default=U256(0))
+    keys = [U256(i).to_be_bytes32() for i in range(300)]
+
+    for batch in (300, 3, 100, 1, 250):
+        for _ in range(batch):
+            key = rng.choice(keys)
+            value = U256(rng.choice([0, 0, 1, rng.randrange(2**256)]))
+            trie.trie_set(spec_trie, key, value)
+            optimized.trie_set(cached_trie, key, value)
+        assert trie.root(spec_trie) == optimized.root(cached_trie)
+        assert optimized.root(cached_trie) == optimized.root(cached_trie)
+
+
+def test_storage_root_changes() -> None:
+    addresses = [Address(bytes([i]) * 20) for i in range(5)]
+    storage_roots: Dict[Address, Root] = {
+        address: trie.EMPTY_TRIE_ROOT for address in addresses
+    }
+
+    def get_storage_root(address: Address) -> Root:
+        return storage_roots[address]
+
+    def check(get_storage_root: Callable[[Address], Root]) -> None:
+        assert trie.root(spec_trie, get_storage_root) == optimized.root(
+            cached_trie, get_storage_root
+        )
+
+    spec_trie: trie.Trie[Address, Optional[Account]] = trie.Trie(
+        secured=True, default=None
+    )
+    cached_trie = optimized.Trie(secured=True, default=None)
+    for i, address in enumerate(addresses):
+        account = Account(nonce=Uint(i), balance=U256(i), code=b"")
+        trie.trie_set(spec_trie, address, account)
+        optimized.trie_set(cached_trie, address, account)
+    check(get_storage_root)
+
+    # Changing only a storage root must still change the state root.
+    storage_roots[addresses[2]] = Root(b"\x12" * 32)
+    check(get_storage_root)
+
+    trie.trie_set(spec_trie, addresses[0], None)
+    optimized.trie_set(cached_trie, addresses[0], None)
+    check(get_storage_root)
+
+
+def test_copy_trie() -> None:
+    cached_trie = optimized.Trie(secured=True, default=b"")
+    for i in range(20):
+        optimized.trie_set(cached_trie, bytes([i]), bytes([i + 1]))
+    original_root = optimized.root(cached_trie)
+
+    copied = optimized.copy_trie(cached_trie)
+    optimized.trie_set(copied, b"\x05", b"\xff")
+    assert optimized.root(copied) != original_root
+    assert optimized.root(cached_trie) == original_root
+
+    spec_trie: trie.Trie[Bytes, Bytes] = trie.Trie(secured=True, default=b"")
+    for key, value in copied._data.items():
+        trie.trie_set(spec_trie, key, value)
+    assert trie.root(spec_trie) == optimized.root(copied)
+
+
+def test_first_root_nodes() -> None:
+    # The nodes recorded by the sweep building the first root are those
+    # the incremental build would cache.
+    rng = random.Random(3)
+    for secured in (True, False):
+        swept = optimized.Trie(secured=secured, default=b"")
+        for _ in range(300):
+            key = rng.randbytes(32) if secured else random_key(rng)
+            optimized.trie_set(swept, key, rng.randbytes(rng.randrange(40)))
+        swept_root = optimized.root(swept)
+
+        built = optimized.copy_trie(swept)
+        built._cache.nodes = {b"\xff": b""}
+        built._cache.root = None
+        assert optimized.root(built) == swept_root
+        del built._cache.nodes[b"\xff"]
+        assert built._cache.nodes == swept._cache.nodes
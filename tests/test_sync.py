@@ -0,0 +1,203 @@
+import json
+import logging
+import multiprocessing
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from typing import Any, Dict, Iterator, List
+
+import pytest
+from ethereum_rlp import rlp
+from ethereum_types.bytes import Bytes8, Bytes32
+from ethereum_types.numeric import U256, Uint
+
+from ethereum.crypto.hash import Hash32
+from ethereum.frontier.blocks import Block, Header
+from ethereum.frontier.fork_types import Address, Bloom, Root
+from ethereum.frontier.transactions import Transaction
+from ethereum_spec_tools.forks import Hardfork
+from ethereum_spec_tools.sync import BlockDownloader, RpcError
+
+CHAIN_LENGTH = 50
+
+
+def make_header(number: int) -> Header:
+    return Header(
+        parent_hash=Hash32(number.to_bytes(32, "big")),
+        ommers_hash=Hash32(b"\x01" * 32),
+        coinbase=Address(b"\x02" * 20),
+        state_root=Root(b"\x03" * 32),
+        transactions_root=Root(b"\x04" * 32),
+        receipt_root=Root(b"\x05" * 32),
+        bloom=Bloom(b"\x00" * 256),
+        difficulty=Uint(0x20000 + number),
+        number=Uint(number),
+        gas_limit=Uint(5000),
+        gas_used=Uint(0),
+        timestamp=U256(1000 + 10 * number),
+        extra_data=b"",
+        mix_digest=Bytes32(b"\x06" * 32),
+        nonce=Bytes8(b"\x07" * 8),
+    )
+
+
+def make_block(number: int) -> Block:
+    transactions = tuple(
+        Transaction(
+            nonce=U256(i),
+            gas_price=Uint(10),
+            gas=Uint(21000),
+            to=Address(b"\x08" * 20),
+            value=U256(number),
+            data=b"\x09" * i,
+            v=U256(27),
+            r=U256(1),
+            s=U256(2),
+        )
+        for i in range(number % 3)
+    )
+    ommers = tuple(make_header(number + 1000 + i) for i in range(number % 2))
+    return Block(make_header(number), transactions, ommers)
+
+
+def header_json(header: Header) -> Dict[str, Any]:
+    return {
+        "parentHash": "0x" + header.parent_hash.hex(),
+        "sha3Uncles": "0x" + header.ommers_hash.hex(),
+        "miner": "0x" + header.coinbase.hex(),
+        "stateRoot": "0x" + header.state_root.hex(),
+        "transactionsRoot": "0x" + header.transactions_root.hex(),
+        "receiptsRoot": "0x" + header.receipt_root.hex(),
+        "logsBloom": "0x" + header.bloom.hex(),
+        "difficulty": hex(header.difficulty),
+        "number": hex(header.number),
+        "gasLimit": hex(header.gas_limit),
+        "gasUsed": hex(header.gas_used),
+        "timestamp": hex(header.timestamp),
+        "extraData": "0x" + header.extra_data.hex(),
+        "mixHash": "0x" + header.mix_digest.hex(),
+        "nonce": "0x" + header.nonce.hex(),
+    }
+
+
+def block_json(block: Block) -> Dict[str, Any]:
+    result = header_json(block.header)
+    result["uncles"] = ["0x" + "00" * 32 for _ in block.ommers]
+    result["transactions"] = [
+        {
+            "type": "0x0",
+            "nonce": hex(tx.nonce),
+            "gasPrice": hex(tx.gas_price),
+            "gas": hex(tx.gas),
+            "to": "0x" + tx.to.hex(),
+            "value": hex(tx.value),
+            "input": "0x" + tx.data.hex(),
+            "v": hex(tx.v),
+            "r": hex(tx.r),
+            "s": hex(tx.s),
+        }
+        for tx in block.transactions
+    ]
+    return result
+
+
+BLOCKS = [make_block(number) for number in range(CHAIN_LENGTH)]
+
+
+# Requests to this path get an error for this block.
+FAILING_PATH = "/fail"
+FAILING_BLOCK = 20
+
+
+def reply(call: Dict[str, Any], path: str) -> Dict[str, Any]:
+    params = call["params"]
+    number = int(params[0], 16)
+    if path == FAILING_PATH and number == FAILING_BLOCK:
+        return {
+            "jsonrpc": "2.0",
+            "id": call["id"],
+            "error": {"code": -32603, "message": "internal error"},
+        }
+    if number >= CHAIN_LENGTH:
+        return {
+            "jsonrpc": "2.0",
+            "id": call["id"],
+            "error": {"code": -32000, "message": "not found"},
+        }
+
+    block = BLOCKS[number]
+    result: Any
+    if call["method"] == "debug_getRawBlock":
+        result = "0x" + rlp.encode(block).hex()
+    elif call["method"] == "eth_getBlockByNumber":
+        result = block_json(block)
+    else:
+        assert call["method"] == "eth_getUncleByBlockNumberAndIndex"
+        result = header_json(block.ommers[int(params[1], 16)])
+    return {"jsonrpc": "2.0", "id": call["id"], "result": result}
+
+
+class _RpcHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self) -> None:
+        calls = json.loads(
+            self.rfile.read(int(self.headers["Content-Length"]))
+        )
+        # Answer out of order, so batches complete in a different order than
+        # they were requested.
+        time.sleep(random.random() / 20)
+        body = json.dumps([reply(call, self.path) for call in calls])
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+
+@pytest.fixture(scope="module")
+def rpc_url() -> Iterator[str]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _RpcHandler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def download(rpc_url: str, geth: bool, decoders: int) -> List[Any]:
+    downloader = BlockDownloader(
+        Hardfork.discover(),
+        logging.getLogger("test_sync"),
+        rpc_url,
+        geth,
+        Uint(4),
+        U256(1040),
+        fetchers=3,
+        decoders=decoders,
+        batch_size=7,
+    )
+    blocks: List[Any] = []
+    while True:
+        block = downloader.take_block()
+        if block is None:
+            return blocks
+        blocks.append(block)
+
+
+@pytest.mark.parametrize("geth", [True, False])
+@pytest.mark.parametrize("decoders", [0, 2])
+def test_download_in_order(rpc_url: str, geth: bool, decoders: int) -> None:
+    assert download(rpc_url, geth, decoders) == BLOCKS[5:]
+
+
+@pytest.mark.parametrize("decoders", [0, 2])
+def test_download_error(rpc_url: str, decoders: int) -> None:
+    before = set(multiprocessing.active_children())
+    with pytest.raises(RpcError):
+        download(rpc_url + FAILING_PATH, True, decoders)
+    # The error is only handed over once the decoding processes are gone.
+    assert set(multiprocessing.active_children()) <= before